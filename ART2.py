@@ -4,9 +4,59 @@ import json
 import cv2
 import numpy as np
 
+try:
+    import tracker                              # 持續 ID + 最佳配對 + 等速預測
+except ImportError:
+    tracker = None
+try:
+    import broadcast                            # 主動推播：訂閱、限速、差量、二進位格式
+except ImportError:
+    broadcast = None
+
 # Global variable to store previous circle positions
 previous_circles = []
 
+# 多人追蹤器（座標是 0~1 正規化，門檻沿用舊版的 0.1）
+circle_tracker = tracker.MultiTracker(gate=0.1) if tracker else None
+
+RESULTS_OP = 'script1'        # 跑 td.py 的 Script TOP（它會 store 偵測結果）
+RESULTS_KEY = 'detections'    # 和 td.RESULTS_KEY 相同
+RESULTS_MAX_AGE = 0.5         # 秒；結果比這更舊（script1 停止 cook：bypass、錯誤、關閉）就當作沒有，改回 Hough
+
+# ===== 直接讀 render 階段發佈的圓心 =====
+def published_results(source=RESULTS_OP):
+    """
+    td.py publish_detections() 存下的 dict（frame / seconds / size / circles）。
+    沒有發佈、或超過 RESULTS_MAX_AGE 秒沒更新時回傳 None。
+    """
+    src = op(source)
+    if src is None:
+        return None
+    results = src.fetch(RESULTS_KEY, None, search=False)
+    if results is None or absTime.seconds - results.get('seconds', float('-inf')) > RESULTS_MAX_AGE:
+        return None
+    return results
+
+# ===== 每個 frame 只偵測 + 追蹤一次 =====
+_frame_cache = {'key': None, 'frame': 0, 'tracks': []}
+
+def frame_tracks():
+    """
+    回傳 (frame, tracks)。同一個 frame 不論有幾個客戶端、叫幾次都只算一次：
+    有發佈結果就用它的 frame 編號，否則以 absTime.frame 為單位跑一次 Hough。
+    """
+    results = published_results()
+    key = ('published', results['frame']) if results is not None else ('hough', absTime.frame)
+    if key != _frame_cache['key']:
+        if results is not None:
+            pts = [[x, y] for x, y, _ in results['circles']]
+        else:
+            pts = detect_circles()
+        _frame_cache['key'] = key
+        _frame_cache['frame'] = key[1]
+        _frame_cache['tracks'] = track_circles(pts)
+    return _frame_cache['frame'], _frame_cache['tracks']
+
 # ===== 圓形偵測 =====
 # ===== 圓形偵測（最終版，兼容舊版 TD） =====
 def detect_circles(top_name='null1'):
@@ -47,6 +97,12 @@ def detect_circles(top_name='null1'):
 
 # Function to track circles and calculate movement
 def track_circles(new_circles):
+    """
+    回傳 [{"id", "pos", "movement", "velocity"}, ...]（有 tracker 模組時），
+    id 跨 frame 不變，velocity 為每秒位移；沒有 tracker 時退回舊的貪婪配對。
+    """
+    if circle_tracker is not None:
+        return circle_tracker.update(new_circles)
     global previous_circles
     result = []
     
@@ -88,6 +144,29 @@ def track_circles(new_circles):
     previous_circles = new_circles.copy()
     return result
 
+# ===== 主動推播 =====
+# 在 Execute DAT 的 onFrameEnd 裡呼叫：
+#     def onFrameEnd(frame):
+#         op('ART2').module.broadcast_detections(op('webserver1'))
+_broadcasters = {}
+
+def _get_broadcaster(webServerDAT):
+    b = _broadcasters.get(webServerDAT.path)
+    if b is None:
+        b = broadcast.Broadcaster(webServerDAT.webSocketSendText, webServerDAT.webSocketSendBinary)
+        _broadcasters[webServerDAT.path] = b
+    return b
+
+def broadcast_detections(webServerDAT):
+    """每個 frame 呼叫一次：偵測 + 追蹤只算一次，再依各客戶端的速率 / 差量 / 格式推出去。"""
+    if broadcast is None:
+        return
+    b = _get_broadcaster(webServerDAT)
+    if not b.subscribers:
+        return
+    frame, tracks = frame_tracks()
+    b.publish(frame, tracks)
+
 # ===== HTTP (保持原本功能) =====
 def onHTTPRequest(webServerDAT, request, response):
     response['statusCode'] = 200
@@ -101,14 +180,25 @@ def onWebSocketOpen(webServerDAT, client, uri):
     return
 
 def onWebSocketClose(webServerDAT, client):
+    if broadcast is not None:
+        _get_broadcaster(webServerDAT).unsubscribe(client)
     return
 
 def onWebSocketReceiveText(webServerDAT, client, data):
     msg = data.strip().lower()
     if msg == 'detect':                          # 客戶端固定送 detect
-        pts = detect_circles()                   # [[nx, ny], ...]
-        tracked_circles = track_circles(pts)     # Track circles and calculate movement
+        _, tracked_circles = frame_tracks()      # 同一 frame 的結果所有客戶端共用
         webServerDAT.webSocketSendText(client, json.dumps(tracked_circles))
+    elif broadcast is not None and msg.startswith('subscribe'):
+        # subscribe {"fps": 15, "delta": true, "format": "binary"}
+        try:
+            options = broadcast.parse_subscribe(data)
+        except ValueError as e:                  # 格式錯誤：回覆這個客戶端，不讓 callback 出錯
+            webServerDAT.webSocketSendText(client, json.dumps({'error': f"bad subscribe options: {e}"}))
+            return
+        _get_broadcaster(webServerDAT).subscribe(client, **options)
+    elif broadcast is not None and msg == 'unsubscribe':
+        _get_broadcaster(webServerDAT).unsubscribe(client)
     else:
         # 其他訊息照原樣回傳
         webServerDAT.webSocketSendText(client, data)
@@ -0,0 +1,70 @@
+# bench_dilation.py
+#
+# Compares the dilation backends of index.dilate_disk ('ellipse' = one
+# cv2.dilate with the full MORPH_ELLIPSE kernel, 'separable' = row/column
+# bands) on the mask a real frame produces, checks that they give the same
+# pixels, and prints the timings.
+#
+#   python bench_dilation.py --file point1.chan --width 1920 --height 1080
+#   python bench_dilation.py                      # random points, no .chan needed
+
+import argparse
+import time
+
+import numpy as np
+
+import index
+from chanfile import load_chan_array, frame_view
+
+DEFAULT_RADII = (10, 20, 55, 100)
+
+def frame_mask(path, frame_idx, width, height):
+    """Occupancy mask of one frame of `path`, at width x height (default rig layout)."""
+    data, offsets = load_chan_array(path, dtype=np.float64)
+    frame_idx = min(frame_idx, len(offsets) - 2)
+    radii, angles = frame_view(data, offsets, frame_idx)
+    plot_x_half = index.DEFAULT_PLOT_X_LIM_HALF
+    plot_y_half = plot_x_half * height / width
+    sensor_trans = [(-6.7, -1.7), (6.7, 2.0), (6.7, -1.7), (-6.7, 2.0)]
+    mask, _, _ = index.render_occupancy(radii, angles, width, height,
+                                        plot_x_half, plot_y_half, sensor_trans)
+    return mask
+
+def random_mask(width, height, num_points=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((height, width), dtype=np.uint8)
+    index._stamp_dots(mask, rng.integers(0, width, num_points), rng.integers(0, height, num_points), 255)
+    return mask
+
+def time_backend(mask, r, backend, repeat):
+    index.dilate_disk(mask, r, backend)      # warm the kernel / plan cache
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = index.dilate_disk(mask, r, backend)
+    return (time.perf_counter() - start) / repeat * 1000.0, out
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dilation backends of index.dilate_disk.")
+    parser.add_argument('--file', type=str, default=None, help=".chan file to take the mask from (default: random points).")
+    parser.add_argument('--frame', type=int, default=0, help="Frame index within --file (default: 0).")
+    parser.add_argument('--width', type=int, default=1920, help="Mask width in pixels (default: 1920).")
+    parser.add_argument('--height', type=int, default=1080, help="Mask height in pixels (default: 1080).")
+    parser.add_argument('--radii', type=str, default=",".join(map(str, DEFAULT_RADII)),
+                        help="Comma-separated radii to test (default: 10,20,55,100).")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case (default: 3).")
+    args = parser.parse_args()
+
+    if args.file:
+        mask = frame_mask(args.file, args.frame, args.width, args.height)
+    else:
+        mask = random_mask(args.width, args.height)
+    print(f"Mask {args.width}x{args.height}, {np.count_nonzero(mask)} occupied pixels")
+    print(f"{'r':>5} {'ellipse ms':>12} {'separable ms':>13} {'speedup':>8}  same")
+    for r in (int(v) for v in args.radii.split(',')):
+        t_ellipse, ref = time_backend(mask, r, 'ellipse', args.repeat)
+        t_separable, out = time_backend(mask, r, 'separable', args.repeat)
+        print(f"{r:>5} {t_ellipse:>12.1f} {t_separable:>13.1f} {t_ellipse / t_separable:>7.1f}x  "
+              f"{np.array_equal(ref, out)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# broadcast.py
+#
+# Push-side helpers for streaming tracked detections to WebSocket clients.
+# The detection/tracking work runs once per frame; every subscriber then gets
+# its own view of that one result:
+#   - rate control: at most `fps` messages per second per client,
+#   - delta mode: only tracks that moved (or appeared) plus removed ids,
+#   - JSON text or a compact binary frame.
+#
+# Subscribe with a text message:
+#     subscribe
+#     subscribe {"fps": 15, "delta": true, "format": "binary"}
+# and stop with `unsubscribe`.
+#
+# JSON messages: full frames are the same list ART2 answers `detect` with,
+#     [{"id", "pos", "movement", "velocity"}, ...]
+# delta frames are {"frame": n, "tracks": [...changed...], "removed": [ids]}.
+#
+# Binary messages (little endian):
+#     header  4s magic b'LDT1', uint32 frame, uint16 num_tracks,
+#             uint16 num_removed, uint8 flags (bit 0 = delta), 3 pad bytes
+#     tracks  num_tracks x (uint32 id, float32 x, y, vx, vy)
+#     removed num_removed x uint32 id
+
+import json
+import struct
+import time
+
+import numpy as np
+
+BINARY_MAGIC = b'LDT1'
+BINARY_HEADER = struct.Struct('<4sIHHB3x')
+TRACK_RECORD = np.dtype([('id', '<u4'), ('x', '<f4'), ('y', '<f4'), ('vx', '<f4'), ('vy', '<f4')])
+FLAG_DELTA = 1
+
+DEFAULT_FPS = 30.0
+DELTA_EPSILON = 1e-4        # position change below which a track counts as unchanged
+
+
+def pack_binary(frame, tracks, removed=(), delta=False):
+    """Packs tracker results into one binary message (see the format above)."""
+    records = np.empty(len(tracks), dtype=TRACK_RECORD)
+    for rec, t in zip(records, tracks):
+        rec['id'] = t['id']
+        rec['x'], rec['y'] = t['pos']
+        rec['vx'], rec['vy'] = t.get('velocity', (0.0, 0.0))
+    header = BINARY_HEADER.pack(BINARY_MAGIC, frame & 0xFFFFFFFF, len(tracks), len(removed),
+                                FLAG_DELTA if delta else 0)
+    return header + records.tobytes() + np.asarray(removed, dtype='<u4').tobytes()
+
+
+def unpack_binary(payload):
+    """Inverse of pack_binary: returns (frame, records, removed, delta)."""
+    magic, frame, num_tracks, num_removed, flags = BINARY_HEADER.unpack_from(payload)
+    if magic != BINARY_MAGIC:
+        raise ValueError("Not a detection frame.")
+    offset = BINARY_HEADER.size
+    records = np.frombuffer(payload, dtype=TRACK_RECORD, count=num_tracks, offset=offset)
+    offset += records.nbytes
+    removed = np.frombuffer(payload, dtype='<u4', count=num_removed, offset=offset)
+    return frame, records, removed, bool(flags & FLAG_DELTA)
+
+
+def parse_subscribe(message):
+    """
+    Returns the options of a `subscribe` text message, or None if `message`
+    is not a subscription request. Raises ValueError for malformed options.
+    """
+    text = message.strip()
+    if not text.lower().startswith('subscribe'):
+        return None
+    options = {}
+    body = text[len('subscribe'):].strip()
+    if body:
+        options = json.loads(body)
+        if not isinstance(options, dict):
+            raise ValueError("subscribe options must be a JSON object.")
+    try:
+        fps = float(options.get('fps', DEFAULT_FPS))
+    except TypeError:
+        raise ValueError("fps must be a number.")
+    return {'fps': fps,
+            'delta': bool(options.get('delta', False)),
+            'binary': str(options.get('format', 'json')).lower() == 'binary'}
+
+
+class Subscriber:
+    """Per-client push state: rate limit, last state sent (for deltas), format."""
+
+    def __init__(self, fps=DEFAULT_FPS, delta=False, binary=False):
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.delta = delta
+        self.binary = binary
+        self.next_send = 0.0
+        self.sent = {}             # delta mode: id -> (x, y) last sent, for live tracks only
+
+    def message(self, frame, tracks, now=None):
+        """
+        Returns the payload to send for this frame (str or bytes), or None
+        when the client is rate limited or, in delta mode, nothing changed.
+        """
+        now = time.monotonic() if now is None else now
+        if now < self.next_send:
+            return None
+        removed = []
+        if self.delta:
+            current = {t['id'] for t in tracks}
+            removed = [i for i in self.sent if i not in current]
+            changed = []
+            for t in tracks:
+                last = self.sent.get(t['id'])
+                x, y = t['pos']
+                if last is None or abs(x - last[0]) > DELTA_EPSILON or abs(y - last[1]) > DELTA_EPSILON:
+                    changed.append(t)
+            if not changed and not removed:
+                return None
+            for i in removed:
+                del self.sent[i]
+            for t in changed:
+                self.sent[t['id']] = tuple(t['pos'])
+            tracks = changed
+        self.next_send = max(self.next_send + self.interval, now) if self.interval else now
+
+        if self.binary:
+            return pack_binary(frame, tracks, removed, self.delta)
+        if self.delta:
+            return json.dumps({'frame': frame, 'tracks': tracks, 'removed': removed})
+        return json.dumps(tracks)
+
+
+class Broadcaster:
+    """
+    Holds the subscribers of one server and fans a frame result out to them.
+    `send_text(client, str)` / `send_binary(client, bytes)` do the actual I/O.
+    """
+
+    def __init__(self, send_text, send_binary):
+        self.send_text = send_text
+        self.send_binary = send_binary
+        self.subscribers = {}
+        self.last_frame = None
+
+    def subscribe(self, client, fps=DEFAULT_FPS, delta=False, binary=False):
+        self.subscribers[client] = Subscriber(fps, delta, binary)
+
+    def unsubscribe(self, client):
+        self.subscribers.pop(client, None)
+
+    def publish(self, frame, tracks, now=None):
+        """Sends `tracks` of `frame` to every due subscriber (once per frame)."""
+        if frame == self.last_frame:
+            return
+        self.last_frame = frame
+        now = time.monotonic() if now is None else now
+        for client, sub in list(self.subscribers.items()):
+            payload = sub.message(frame, tracks, now)
+            if payload is None:
+                continue
+            if isinstance(payload, bytes):
+                self.send_binary(client, payload)
+            else:
+                self.send_text(client, payload)
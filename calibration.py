@@ -0,0 +1,292 @@
+# calibration.py
+#
+# Automatic extrinsic calibration: estimates every sensor's pose (translation
+# and yaw) from one capture instead of nudging S1_X ... S4_Y by hand in
+# gui.TranslationGUI.
+#
+# 1. Static background. A sample of frames is turned into points in each
+#    sensor's own frame (SensorRig.local_points, the _process_sensor_data
+#    projection before the pose is applied). Cells of a local occupancy grid
+#    that are hit in at least `static_fraction` of those frames are
+#    background (walls, pillars, furniture); people walking through are not.
+#    Every background cell becomes one point, the mean of its samples.
+# 2. Correlation search. Sensor `anchor` stays where the rig puts it. Every
+#    other sensor's background is scored against a blurred occupancy grid of
+#    the sensors placed so far, for every translation in a window around its
+#    current pose and every yaw in a window around its current yaw. A coarse
+#    level finds the peak, a fine level refines it (sub-cell by a parabola
+#    through the peak). Further passes re-align each sensor against all the
+#    others.
+#
+# The search only looks around the starting layout, so start within --search
+# metres (and --yaw_search degrees) of the true poses; the hand-measured
+# layout usually is. Sensors must share some static background with the others.
+#
+# The result is a SensorRig: it saves as a --rig JSON (translations and
+# yaws), and its translations print in the cli.py --translations format,
+# which is enough on its own only when the yaws stay the defaults
+# (--yaw_search 0).
+#
+#   python calibration.py point1.chan
+#   python calibration.py point1.chan --rig rig.json --save_rig calibrated.json
+
+import argparse
+
+import cv2
+import numpy as np
+
+import chanfile
+from sensor_rig import (
+    DEFAULT_SENSOR_TRANSLATIONS,
+    default_yaws,
+    parse_translations,
+    parse_rig,
+    build_rig
+)
+
+DEFAULT_MAX_FRAMES = 60         # frames sampled for the background
+BACKGROUND_CELL = 0.05          # m, local grid used to find static cells
+STATIC_FRACTION = 0.3           # a cell hit in this share of the sampled frames is background
+MIN_RANGE = 0.1                 # m, closer returns are sensor noise
+DEFAULT_SEARCH = 1.0            # m, translation window of the coarse level
+DEFAULT_YAW_SEARCH = 5.0        # deg, yaw window of the coarse level
+DEFAULT_PASSES = 2
+# (cell m, yaw step deg) per level; each level searches +-2 cells / +-1 step of
+# the previous one around its best pose
+LEVELS = ((0.10, 1.0), (0.02, 0.2))
+MIN_OVERLAP = 0.3               # below this share of matched background points the pose is doubtful
+
+
+def background_points(rig, data, offsets, max_frames=DEFAULT_MAX_FRAMES,
+                      cell=BACKGROUND_CELL, static_fraction=STATIC_FRACTION):
+    """
+    Static background of each sensor in its own frame.
+
+    Args:
+        rig (SensorRig): Supplies the sensor count and max ranges.
+        data, offsets: A capture as returned by chanfile.load_chan_array.
+        max_frames (int): Frames sampled evenly over the capture.
+        cell (float): Size of the local occupancy cells (m).
+        static_fraction (float): Share of frames a cell must be hit in.
+    Returns:
+        list: One (n, 2) array of local (x, y) background points per sensor.
+    """
+    total = len(offsets) - 1
+    frames = np.unique(np.linspace(0, total - 1, min(total, max_frames)).astype(np.int64))
+    parts = []
+    for i, k in enumerate(frames):
+        lx, ly, sensor = rig.local_points(*chanfile.frame_view(data, offsets, k))
+        parts.append((lx, ly, sensor, np.full(lx.size, i)))
+    if not parts:
+        return [np.empty((0, 2)) for _ in range(rig.num_sensors)]
+    lx, ly, sensor, frame = (np.concatenate(p) for p in zip(*parts))
+    keep = lx * lx + ly * ly >= MIN_RANGE * MIN_RANGE
+    lx, ly, sensor, frame = lx[keep], ly[keep], sensor[keep], frame[keep]
+
+    # One id per (sensor, cell); each frame votes once per cell.
+    ix = np.floor(lx / cell).astype(np.int64) + (1 << 15)
+    iy = np.floor(ly / cell).astype(np.int64) + (1 << 15)
+    cells, inverse = np.unique((sensor << 32) | (ix << 16) | iy, return_inverse=True)
+    votes = np.bincount(np.unique(inverse * len(frames) + frame) // len(frames), minlength=cells.size)
+    static = votes >= static_fraction * len(frames)
+
+    hits = np.bincount(inverse, minlength=cells.size)
+    mean_x = np.bincount(inverse, lx, cells.size) / np.maximum(hits, 1)
+    mean_y = np.bincount(inverse, ly, cells.size) / np.maximum(hits, 1)
+    owner = cells >> 32
+    return [np.column_stack((mean_x[static & (owner == s)], mean_y[static & (owner == s)]))
+            for s in range(rig.num_sensors)]
+
+
+def _place(local, translation, yaw):
+    """Sensor-frame points -> world, with the SensorRig pose convention."""
+    c, s = np.cos(np.deg2rad(yaw)), np.sin(np.deg2rad(yaw))
+    return np.column_stack((c * local[:, 0] + s * local[:, 1] + translation[0],
+                            -s * local[:, 0] + c * local[:, 1] + translation[1]))
+
+
+def _reference_grid(points, origin, shape, cell):
+    """Occupancy of the reference points, blurred by one cell so near misses still score."""
+    ix = np.floor((points[:, 0] - origin[0]) / cell).astype(np.int64)
+    iy = np.floor((points[:, 1] - origin[1]) / cell).astype(np.int64)
+    inside = (ix >= 0) & (ix < shape[1]) & (iy >= 0) & (iy < shape[0])
+    grid = np.zeros(shape, dtype=np.float32)
+    np.add.at(grid, (iy[inside], ix[inside]), 1.0)
+    occupied = grid > 0
+    return cv2.GaussianBlur(occupied.astype(np.float32), (0, 0), 1.0), occupied
+
+
+def _peak_offset(before, at, after):
+    """Sub-cell position of a peak from its two neighbours (parabola vertex, in [-0.5, 0.5])."""
+    den = before - 2.0 * at + after
+    if den >= 0:
+        return 0.0
+    return float(np.clip(0.5 * (before - after) / den, -0.5, 0.5))
+
+
+def align_sensor(reference, local, translation, yaw, search=DEFAULT_SEARCH,
+                 yaw_search=DEFAULT_YAW_SEARCH, levels=LEVELS):
+    """
+    Correlation search for the pose of one sensor.
+
+    Args:
+        reference (ndarray): (n, 2) world background points of the sensors placed so far.
+        local (ndarray): (m, 2) background points of this sensor in its own frame.
+        translation, yaw: Starting pose.
+        search (float): Translation window (m, +-) of the first level.
+        yaw_search (float): Yaw window (deg, +-) of the first level; 0 keeps the yaw.
+        levels: (cell, yaw_step) per level, coarse to fine.
+    Returns:
+        tuple: (translation, yaw, overlap) where overlap is the share of this
+        sensor's background points that land on the reference.
+    """
+    translation = np.asarray(translation, dtype=np.float64)
+    if not len(reference) or not len(local):
+        return translation, float(yaw), 0.0
+    reach = np.sqrt((local ** 2).sum(1)).max()
+    window, yaw_window = search, yaw_search
+    for cell, yaw_step in levels:
+        radius = max(1, int(np.ceil(window / cell)))
+        margin = window + 2 * cell
+        low = np.minimum(reference.min(0), translation - reach) - margin
+        high = np.maximum(reference.max(0), translation + reach) + margin
+        shape = tuple((np.ceil((high - low) / cell).astype(np.int64) + 1)[::-1])
+        ref, occupied = _reference_grid(reference, low, shape, cell)
+
+        shifts = np.arange(-radius, radius + 1)
+        yaws = yaw + np.arange(-np.floor(yaw_window / yaw_step), np.floor(yaw_window / yaw_step) + 1) * yaw_step \
+            if yaw_window > 0 else np.array([float(yaw)])
+        peaks, best = [], None
+        for i, y in enumerate(yaws):
+            world = _place(local, translation, y)
+            ix = np.floor((world[:, 0] - low[0]) / cell).astype(np.int64)
+            iy = np.floor((world[:, 1] - low[1]) / cell).astype(np.int64)
+            # scores[dy, dx] = sum of the blurred reference under the shifted points
+            scores = ref[(iy[None, :] + shifts[:, None])[:, None, :],
+                         (ix[None, :] + shifts[:, None])[None, :, :]].sum(-1)
+            k = int(np.argmax(scores))
+            peaks.append(float(scores.flat[k]))
+            if best is None or peaks[-1] > peaks[best[0]]:
+                best = (i, k // shifts.size, k % shifts.size, scores)
+        i, row, col, scores = best
+
+        yaw = float(yaws[i])
+        if 0 < i < len(yaws) - 1:
+            yaw += _peak_offset(peaks[i - 1], peaks[i], peaks[i + 1]) * yaw_step
+        dx, dy = float(shifts[col]), float(shifts[row])
+        if 0 < col < shifts.size - 1:
+            dx += _peak_offset(scores[row, col - 1], scores[row, col], scores[row, col + 1])
+        if 0 < row < shifts.size - 1:
+            dy += _peak_offset(scores[row - 1, col], scores[row, col], scores[row + 1, col])
+        translation = translation + np.array([dx, dy]) * cell
+        window, yaw_window = 2 * cell, yaw_step if yaw_window > 0 else 0.0
+
+    # Overlap: points within one fine cell of a reference point.
+    world = _place(local, translation, yaw)
+    ix = np.floor((world[:, 0] - low[0]) / cell).astype(np.int64)
+    iy = np.floor((world[:, 1] - low[1]) / cell).astype(np.int64)
+    near = cv2.dilate(occupied.astype(np.uint8), np.ones((3, 3), np.uint8))
+    overlap = float(near[iy, ix].mean())
+    return translation, float(yaw), overlap
+
+
+def calibrate(rig, data, offsets, anchor=0, search=DEFAULT_SEARCH, yaw_search=DEFAULT_YAW_SEARCH,
+              passes=DEFAULT_PASSES, max_frames=DEFAULT_MAX_FRAMES):
+    """
+    Estimates the pose of every sensor but `anchor` from one capture.
+
+    Args:
+        rig (SensorRig): Starting layout (and sensor count, ranges, colours).
+        data, offsets: A capture as returned by chanfile.load_chan_array.
+        anchor (int): Sensor that defines the world frame; it is not moved.
+        search (float): Translation window (m, +-) around the starting layout.
+        yaw_search (float): Yaw window (deg, +-); 0 only solves translations.
+        passes (int): Alignment rounds; the first places the sensors one by one.
+        max_frames (int): Frames sampled for the static background.
+    Returns:
+        tuple: (calibrated SensorRig, per-sensor overlap in [0, 1]; 1 for the anchor).
+    """
+    background = background_points(rig, data, offsets, max_frames)
+    translations = rig.translations.copy()
+    yaws = rig.yaws.copy()
+    overlap = np.zeros(rig.num_sensors)
+    overlap[anchor] = 1.0
+    order = [s for s in range(rig.num_sensors) if s != anchor]
+    placed = [anchor]
+    for p in range(passes):
+        for s in order:
+            others = placed if p == 0 else [o for o in range(rig.num_sensors) if o != s]
+            reference = np.concatenate([_place(background[o], translations[o], yaws[o]) for o in others])
+            # later passes start from the previous estimate, so a narrower window will do
+            window = search if p == 0 else min(search, 2 * LEVELS[0][0])
+            yaw_window = yaw_search if p == 0 else min(yaw_search, LEVELS[0][1])
+            translations[s], yaws[s], overlap[s] = align_sensor(reference, background[s],
+                                                                translations[s], yaws[s],
+                                                                window, yaw_window)
+            if p == 0:
+                placed.append(s)
+    return rig.with_pose(translations, yaws), overlap
+
+
+def calibrate_file(chan_path, rig, use_cache=True, **options):
+    """calibrate() on a .chan file (through the .chanb sidecar unless use_cache is False)."""
+    if use_cache:
+        data, offsets = chanfile.load_chan_cached(chan_path, rig.num_sensors)
+    else:
+        data, offsets = chanfile.load_chan_array(chan_path, np.float64, rig.num_sensors)
+    if len(offsets) < 2:
+        raise ValueError(f"{chan_path} holds no frames.")
+    return calibrate(rig, data, offsets, **options)
+
+
+def format_translations(rig):
+    """Translations in the cli.py --translations format: 'x1,y1;x2,y2;...'."""
+    return ';'.join(f"{x:.3f},{y:.3f}" for x, y in rig.translations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate sensor poses from the static background of a .chan capture.")
+    parser.add_argument('chan', type=str, help=".chan capture with some static background in view of all sensors.")
+    parser.add_argument('--translations', type=parse_translations, default=None,
+                        help="Starting translations 'x1,y1;x2,y2;...', one pair per sensor.")
+    parser.add_argument('--rig', type=parse_rig, default=None, help="Starting sensor rig JSON file (see sensor_rig.py).")
+    parser.add_argument('--anchor', type=int, default=0, help="Sensor (0-based) that stays fixed (default: 0).")
+    parser.add_argument('--search', type=float, default=DEFAULT_SEARCH,
+                        help=f"Translation search window in metres, +- around the start (default: {DEFAULT_SEARCH}).")
+    parser.add_argument('--yaw_search', type=float, default=DEFAULT_YAW_SEARCH,
+                        help=f"Yaw search window in degrees, +- around the start; 0 keeps the yaws (default: {DEFAULT_YAW_SEARCH}).")
+    parser.add_argument('--passes', type=int, default=DEFAULT_PASSES, help=f"Alignment rounds (default: {DEFAULT_PASSES}).")
+    parser.add_argument('--max_frames', type=int, default=DEFAULT_MAX_FRAMES,
+                        help=f"Frames sampled for the background (default: {DEFAULT_MAX_FRAMES}).")
+    parser.add_argument('--save_rig', type=str, default=None, help="Write the calibrated rig to this JSON file (for --rig).")
+    parser.add_argument('--no_cache', action='store_true', help="Parse the .chan file directly instead of using its .chanb sidecar.")
+    args = parser.parse_args()
+
+    try:
+        rig = build_rig(args.rig, args.translations, DEFAULT_SENSOR_TRANSLATIONS)
+    except ValueError as e:
+        parser.error(str(e))
+    if not 0 <= args.anchor < rig.num_sensors:
+        parser.error(f"--anchor must be between 0 and {rig.num_sensors - 1}.")
+
+    calibrated, overlap = calibrate_file(args.chan, rig, not args.no_cache,
+                                         anchor=args.anchor, search=args.search,
+                                         yaw_search=args.yaw_search, passes=args.passes,
+                                         max_frames=args.max_frames)
+    for s in range(rig.num_sensors):
+        (x0, y0), (x, y) = rig.translations[s], calibrated.translations[s]
+        note = " (anchor)" if s == args.anchor else (" (low overlap, check this sensor)" if overlap[s] < MIN_OVERLAP else "")
+        print(f"S{s + 1}: x {x0:.3f} -> {x:.3f}, y {y0:.3f} -> {y:.3f}, "
+              f"yaw {rig.yaws[s]:.2f} -> {calibrated.yaws[s]:.2f}, overlap {overlap[s]:.2f}{note}")
+    print(f"--translations=\"{format_translations(calibrated)}\"")   # '=' as the first value is usually negative
+    if not np.allclose(calibrated.yaws, default_yaws(rig.num_sensors)):
+        # --translations alone restores the default yaws, so these translations need the solved yaws
+        print("Warning: the yaws were solved too and differ from the defaults; --translations alone would "
+              "render a misaligned rig. " + (f"Use --rig {args.save_rig}." if args.save_rig else
+              "Save the rig with --save_rig and pass it with --rig, or rerun with --yaw_search 0."))
+    if args.save_rig:
+        print(f"Rig saved to {calibrated.save(args.save_rig)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,478 @@
+# chanfile.py
+#
+# Bulk NumPy loader for .chan captures.
+#
+# A .chan file is whitespace separated text, one sample per row, two columns
+# per sensor:
+#     radius1 angle1 radius2 angle2 ... radiusN angleN
+# Rows starting with '#' and rows that do not hold exactly 2N numbers are skipped.
+# Angles are kept exactly as recorded: how each sensor is mounted (position and
+# yaw, e.g. the 180 deg of sensors 2 and 3 in the original rig) is applied at
+# projection time by sensor_rig.SensorRig, so a capture can be re-projected
+# under another calibration without parsing it again.
+# A new frame starts whenever sensor 0's angle jumps by more than 300 deg.
+
+import io
+import os
+import warnings
+import numpy as np
+
+NUM_SENSORS = 4                # the original rig; every loader takes num_sensors
+NUM_COLUMNS = NUM_SENSORS * 2
+FRAME_SPLIT_DEG = 300.0        # 角度跳變 => 新 frame
+
+
+def _valid_row_bytes(raw, columns=NUM_COLUMNS):
+    """
+    Returns the bytes of `raw` restricted to rows that hold exactly `columns`
+    tokens and are not comments. Token counting is done on the byte array, so no
+    Python code runs per line.
+    """
+    buf = np.frombuffer(raw, dtype=np.uint8)
+    if buf.size == 0:
+        return raw
+
+    newlines = np.flatnonzero(buf == 10)
+    line_start = np.concatenate(([0], newlines + 1))
+    line_end = np.concatenate((newlines, [buf.size]))
+
+    space = buf <= 32                                   # ' ', '\t', '\r', '\n'
+    prev_space = np.empty_like(space)
+    prev_space[0] = True
+    prev_space[1:] = space[:-1]
+    tok_start = np.flatnonzero(~space & prev_space)
+    del space, prev_space
+
+    tok_line = np.searchsorted(line_start, tok_start, side='right') - 1
+    counts = np.bincount(tok_line, minlength=line_start.size)
+
+    valid = counts == columns
+    valid[tok_line[buf[tok_start] == ord('#')]] = False  # 註解列
+
+    nonempty = counts > 0
+    if np.array_equal(valid, nonempty):
+        return raw                                      # 全部都是合法列
+
+    # Keep only the bytes of valid rows (plus their newline).
+    edges = np.zeros(buf.size + 1, dtype=np.int8)
+    edges[line_start[valid]] += 1
+    edges[np.minimum(line_end[valid] + 1, buf.size)] -= 1
+    keep = np.cumsum(edges[:-1], dtype=np.int8).astype(bool)
+    return buf[keep].tobytes()
+
+
+def _parse_rows_slow(raw, dtype, columns=NUM_COLUMNS):
+    """Per-line fallback used only when a row has the right token count but not all numbers."""
+    rows = []
+    for line in raw.splitlines():
+        try:
+            values = [float(v) for v in line.split()]
+        except ValueError:
+            continue                                    # 略過格式錯誤列
+        if len(values) == columns:
+            rows.append(values)
+    return np.array(rows, dtype=dtype).reshape(-1, columns)
+
+
+def parse_rows_bytes(raw, columns, dtype=np.float32):
+    """
+    Parses whitespace separated rows of `columns` numbers into an
+    (N, columns) array. Comments and malformed rows are skipped.
+    """
+    try:
+        # Fast path: well-formed capture, parsed by NumPy's C reader.
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)   # 空檔案
+            data = np.loadtxt(io.BytesIO(raw), dtype=dtype, comments='#', ndmin=2)
+        if data.shape[1] != columns:
+            raise ValueError('unexpected column count')
+    except ValueError:
+        raw = _valid_row_bytes(raw, columns)
+        try:
+            data = np.array(raw.split(), dtype=dtype).reshape(-1, columns)
+        except ValueError:
+            data = _parse_rows_slow(raw, dtype, columns)
+    return data
+
+
+def parse_chan_bytes(raw, dtype=np.float32, num_sensors=NUM_SENSORS):
+    """
+    Parses the raw bytes of a .chan capture into an (N, 2 * num_sensors)
+    array of raw radii and angles; frames are not split.
+    """
+    return parse_rows_bytes(raw, 2 * num_sensors, dtype)
+
+
+def find_frame_offsets(data):
+    """
+    Returns the frame offsets of an (N, 2 * num_sensors) sample array: frame k is
+    data[offsets[k]:offsets[k+1]], so len(offsets) == number of frames + 1.
+    """
+    n = data.shape[0]
+    if n == 0:
+        return np.zeros(1, dtype=np.int64)
+    jumps = np.abs(np.diff(data[:, 1])) > FRAME_SPLIT_DEG
+    return np.concatenate(([0], np.flatnonzero(jumps) + 1, [n])).astype(np.int64)
+
+
+def load_chan_array(input_path, dtype=np.float32, num_sensors=NUM_SENSORS):
+    """
+    Reads a whole .chan file in one pass.
+
+    Args:
+        input_path (str): Path to the .chan file.
+        dtype: Element type of the returned array (float32 by default).
+        num_sensors (int): Sensors in the capture (2 columns each).
+    Returns:
+        tuple: (data, offsets) where data is the (N, 2 * num_sensors) sample
+        array with raw angles and offsets is the int64 frame offset table.
+    """
+    with open(input_path, 'rb') as file:
+        raw = file.read()
+    data = parse_chan_bytes(raw, dtype, num_sensors)
+    return data, find_frame_offsets(data)
+
+
+def frame_view(data, offsets, k):
+    """
+    Returns (radii, angles) of frame k as (num_sensors, n) views into `data`
+    (row s is sensor s).
+    """
+    block = data[offsets[k]:offsets[k + 1]]
+    return block[:, 0::2].T, block[:, 1::2].T
+
+
+def frames_to_lists(data, offsets):
+    """
+    Compatibility view: converts (data, offsets) to the legacy
+    frame_radius[n][sensor][sample] / frame_angle[n][sensor][sample] lists.
+    """
+    frame_radius, frame_angle = [], []
+    for k in range(len(offsets) - 1):
+        radii, angles = frame_view(data, offsets, k)
+        frame_radius.append(radii.tolist())
+        frame_angle.append(angles.tolist())
+    return frame_radius, frame_angle
+
+
+# ─────────────────── .chanb binary sidecar ───────────────────────────
+#
+# Layout (little endian):
+#   header   CHANB_HEADER (64 bytes)
+#   columns  float64 (C, N)  – C = 2 * num_sensors; row 2s = radius of sensor s,
+#                              row 2s+1 = angle
+#   offsets  int64   (F+1,)  – frame offset table, see find_frame_offsets
+#
+# The header stores the mtime and size of the source .chan, so a sidecar is
+# only trusted while the source file is unchanged. Angles are stored raw
+# (version 2; version 1 sidecars held angles with the 180 deg of sensors 2
+# and 3 already added and are rebuilt). Values are stored as float64, the
+# precision the text path parses with, so reading through the sidecar gives
+# exactly the same frames (version 3; float32 version 2 sidecars are rebuilt).
+
+CHANB_MAGIC = b'CHANB\x00\x00\x03'
+CHANB_DTYPE = np.dtype('<f8')
+CHANB_SUFFIX = 'b'             # point1.chan -> point1.chanb
+CHANB_HEADER = np.dtype([
+    ('magic',      'S8'),
+    ('columns',    '<u4'),
+    ('reserved',   '<u4'),
+    ('samples',    '<i8'),
+    ('frames',     '<i8'),
+    ('src_mtime',  '<f8'),
+    ('src_size',   '<i8'),
+    ('pad',        'V16'),
+])
+
+
+def sidecar_path(chan_path):
+    """Returns the .chanb sidecar path for a .chan file."""
+    return chan_path + CHANB_SUFFIX
+
+
+def write_chanb(chanb_path, data, offsets, src_mtime=0.0, src_size=-1):
+    """
+    Writes (data, offsets) as a .chanb file. The file is written to a
+    temporary name first and then renamed, so readers never see a partial file.
+    """
+    header = np.zeros(1, dtype=CHANB_HEADER)
+    header['magic'] = CHANB_MAGIC
+    header['columns'] = data.shape[1]
+    header['samples'] = data.shape[0]
+    header['frames'] = len(offsets) - 1
+    header['src_mtime'] = src_mtime
+    header['src_size'] = src_size
+
+    tmp_path = chanb_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(header.tobytes())
+        file.write(np.ascontiguousarray(data.T, dtype=CHANB_DTYPE).tobytes())
+        file.write(np.asarray(offsets, dtype='<i8').tobytes())
+    os.replace(tmp_path, chanb_path)
+    return chanb_path
+
+
+def _read_chanb_header(chanb_path):
+    with open(chanb_path, 'rb') as file:
+        raw = file.read(CHANB_HEADER.itemsize)
+    if len(raw) != CHANB_HEADER.itemsize:
+        raise ValueError(f"Truncated .chanb header: {chanb_path}")
+    header = np.frombuffer(raw, dtype=CHANB_HEADER)[0]
+    if header['magic'] != CHANB_MAGIC or header['columns'] == 0 or header['columns'] % 2:
+        raise ValueError(f"Not a .chanb file: {chanb_path}")
+    return header
+
+
+def read_chanb(chanb_path):
+    """
+    Opens a .chanb file with np.memmap. Nothing is read until frames are
+    accessed, so opening a capture and jumping to frame k is O(1).
+
+    Returns:
+        tuple: (data, offsets) with the same meaning as load_chan_array;
+        data is an (N, 2 * num_sensors) view onto the memory-mapped columns.
+    """
+    header = _read_chanb_header(chanb_path)
+    n, f = int(header['samples']), int(header['frames'])
+    columns = int(header['columns'])
+    cols_offset = CHANB_HEADER.itemsize
+    offsets_offset = cols_offset + columns * n * CHANB_DTYPE.itemsize
+
+    if n:
+        cols = np.memmap(chanb_path, dtype=CHANB_DTYPE, mode='r',
+                         offset=cols_offset, shape=(columns, n))
+    else:
+        cols = np.zeros((columns, 0), dtype=CHANB_DTYPE)
+    offsets = np.memmap(chanb_path, dtype='<i8', mode='r',
+                        offset=offsets_offset, shape=(f + 1,))
+    return cols.T, offsets
+
+
+def sidecar_is_fresh(chan_path, chanb_path=None, num_sensors=NUM_SENSORS):
+    """
+    True if the sidecar exists and was built from the current source file
+    with the same sensor count.
+    """
+    chanb_path = chanb_path or sidecar_path(chan_path)
+    try:
+        st = os.stat(chan_path)
+        header = _read_chanb_header(chanb_path)
+    except (OSError, ValueError):
+        return False
+    return (header['src_mtime'] == st.st_mtime and header['src_size'] == st.st_size
+            and header['columns'] == 2 * num_sensors)
+
+
+def convert_to_chanb(chan_path, chanb_path=None, num_sensors=NUM_SENSORS):
+    """Parses a .chan file and writes its .chanb sidecar. Returns the sidecar path."""
+    chanb_path = chanb_path or sidecar_path(chan_path)
+    st = os.stat(chan_path)
+    data, offsets = load_chan_array(chan_path, np.float64, num_sensors)
+    return write_chanb(chanb_path, data, offsets, st.st_mtime, st.st_size)
+
+
+def load_chan_cached(chan_path, num_sensors=NUM_SENSORS):
+    """
+    Like load_chan_array, but goes through the .chanb sidecar: it is used
+    when fresh and (re)built otherwise. If the sidecar cannot be written
+    (e.g. read-only directory) the parsed arrays are returned directly.
+    """
+    chanb_path = sidecar_path(chan_path)
+    if not sidecar_is_fresh(chan_path, chanb_path, num_sensors):
+        try:
+            convert_to_chanb(chan_path, chanb_path, num_sensors)
+        except OSError:
+            return load_chan_array(chan_path, np.float64, num_sensors)
+    return read_chanb(chanb_path)
+
+
+def iter_frames(chan_path, use_cache=True, num_sensors=NUM_SENSORS):
+    """
+    Yields (radii, angles) for each frame of a capture, one at a time.
+    Both are (num_sensors, n) views (row s is sensor s); with the sidecar
+    they point straight into the memory map, so only the pages of the
+    current frame are touched. Both paths hold float64 values, matching
+    index.parse_data_file exactly.
+    """
+    if use_cache:
+        data, offsets = load_chan_cached(chan_path, num_sensors)
+    else:
+        data, offsets = load_chan_array(chan_path, np.float64, num_sensors)
+    for k in range(len(offsets) - 1):
+        yield frame_view(data, offsets, k)
+
+
+# ─────────────────── incremental reader for live captures ────────────
+
+class ChanTailReader:
+    """
+    Incremental .chan reader for captures that are still being appended to.
+
+    Remembers the byte offset already consumed, the trailing partial line,
+    and sensor 0's last angle, so each poll() parses only the newly appended
+    bytes. Samples accumulate in a growing buffer; after every poll, `data`
+    and `offsets` equal what load_chan_array returns for the file up to its
+    last complete line (the last frame is the one still being recorded).
+    """
+
+    def __init__(self, path=None, dtype=np.float32, num_sensors=NUM_SENSORS):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.num_sensors = num_sensors
+        self.columns = 2 * num_sensors
+        self.reset()
+
+    def reset(self):
+        self._pos = 0                  # bytes of the file consumed so far
+        self._partial = b''            # trailing bytes without a newline yet
+        self._buf = np.empty((4096, self.columns), dtype=self.dtype)
+        self._n = 0
+        self._frame_starts = []
+        self._prev_angle = None        # sensor 0 angle of the last sample
+
+    @property
+    def data(self):
+        return self._buf[:self._n]
+
+    @property
+    def offsets(self):
+        if self._n == 0:
+            return np.zeros(1, dtype=np.int64)
+        return np.array(self._frame_starts + [self._n], dtype=np.int64)
+
+    @property
+    def num_frames(self):
+        return len(self._frame_starts)
+
+    def _append_rows(self, rows):
+        need = self._n + rows.shape[0]
+        if need > self._buf.shape[0]:
+            grown = np.empty((max(need, 2 * self._buf.shape[0]), self.columns), dtype=self.dtype)
+            grown[:self._n] = self._buf[:self._n]
+            self._buf = grown
+
+        angles = rows[:, 1]
+        if self._prev_angle is None:
+            jumps = np.flatnonzero(np.abs(np.diff(angles)) > FRAME_SPLIT_DEG) + 1
+            self._frame_starts.append(self._n)
+        else:
+            prev = np.concatenate(([self._prev_angle], angles[:-1]))
+            jumps = np.flatnonzero(np.abs(angles - prev) > FRAME_SPLIT_DEG)
+        self._frame_starts.extend((jumps + self._n).tolist())
+
+        self._buf[self._n:need] = rows
+        self._n = need
+        self._prev_angle = angles[-1]
+
+    def feed(self, raw):
+        """
+        Parses appended bytes. Only complete lines are consumed; the rest is
+        kept until its newline arrives. Returns the number of new samples.
+        """
+        raw = self._partial + raw
+        cut = raw.rfind(b'\n') + 1
+        self._partial = raw[cut:]
+        if cut == 0:
+            return 0
+        rows = parse_chan_bytes(raw[:cut], self.dtype, self.num_sensors)
+        if rows.shape[0]:
+            self._append_rows(rows)
+        return rows.shape[0]
+
+    def flush(self):
+        """Parses a final line that has no trailing newline (capture finished)."""
+        return self.feed(b'\n') if self._partial else 0
+
+    def view(self, include_partial=False):
+        """
+        (data, offsets) like the properties. With include_partial a trailing
+        line without a newline is parsed into a temporary copy, leaving the
+        reader untouched: for text that may have stopped growing, where
+        flush() would break a line that is later completed.
+        """
+        data, offsets = self.data, self.offsets
+        if not include_partial or not self._partial.strip():
+            return data, offsets
+        rows = parse_chan_bytes(self._partial + b'\n', self.dtype, self.num_sensors)
+        if not rows.shape[0]:
+            return data, offsets
+        starts = list(self._frame_starts)
+        if self._prev_angle is None or abs(rows[0, 1] - self._prev_angle) > FRAME_SPLIT_DEG:
+            starts.append(self._n)
+        return np.concatenate((data, rows)), np.array(starts + [self._n + rows.shape[0]], dtype=np.int64)
+
+    def trim(self, num_frames):
+        """
+        Forgets the first `num_frames` frames (already consumed by a live
+        reader), so a stream that never ends keeps a bounded buffer.
+        Frame indices shift down by `num_frames`.
+        """
+        num_frames = min(num_frames, max(self.num_frames - 1, 0))   # keep the open frame
+        if num_frames <= 0:
+            return
+        cut = self._frame_starts[num_frames]
+        remaining = self._n - cut
+        self._buf[:remaining] = self._buf[cut:self._n]
+        self._n = remaining
+        self._frame_starts = [s - cut for s in self._frame_starts[num_frames:]]
+
+    def poll(self):
+        """
+        Reads whatever was appended to `path` since the last poll.
+        If the file shrank (replaced or truncated) the reader starts over.
+        Returns the number of new samples.
+        """
+        size = os.path.getsize(self.path)
+        if size < self._pos:
+            self.reset()
+        if size == self._pos:
+            return 0
+        with open(self.path, 'rb') as file:
+            file.seek(self._pos)
+            raw = file.read()
+        self._pos += len(raw)
+        return self.feed(raw)
+
+
+class FrameBlock:
+    """
+    Reusable (2 * num_sensors, n) float32 buffer holding one frame, row c =
+    column c (radius1, angle1, ..., radiusN, angleN). Meant for handing a
+    frame to a Script CHOP without building Python lists: load() is one bulk
+    copy and the buffer is only reallocated when a longer frame (or a rig
+    with more sensors) shows up.
+    """
+
+    def __init__(self):
+        self._buf = np.empty((NUM_COLUMNS, 0), dtype=np.float32)
+
+    def load(self, data, offsets, k):
+        start, stop = int(offsets[k]), int(offsets[k + 1])
+        n = stop - start
+        columns = data.shape[1]
+        if self._buf.shape[0] != columns or self._buf.shape[1] < n:
+            self._buf = np.empty((columns, max(n, self._buf.shape[1])), dtype=np.float32)
+        block = self._buf[:, :n]
+        np.copyto(block, data[start:stop].T)
+        return block
+
+
+def chan_names(num_sensors=NUM_SENSORS):
+    """Script CHOP channel names of a FrameBlock's rows: radius1, angle1, ..., radiusN, angleN."""
+    return ['{}{}'.format(kind, s + 1) for s in range(num_sensors) for kind in ('radius', 'angle')]
+
+
+def write_block(script_op, block, names):
+    """
+    Writes a (len(names), n) block into a Script CHOP, one row per channel.
+    The channels are only rebuilt when their count or length changes;
+    otherwise each row is one bulk copy into the existing channel.
+    """
+    n = block.shape[1]
+    if script_op.numChans != len(names) or script_op.numSamples != n:
+        script_op.clear()
+        script_op.numSamples = n
+        for name in names:
+            script_op.appendChan(name)
+    for i in range(len(names)):
+        script_op[i].vals = block[i]
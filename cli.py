@@ -11,35 +11,26 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 try:
     from index import (
         process_chan_file,
+        iter_video_frames,
         create_video_from_frames,
         DEFAULT_CANVAS_WIDTH_PX,
         DEFAULT_CANVAS_HEIGHT_PX,
         DEFAULT_DPI,
-        DEFAULT_SENSOR_COLORS,
         DEFAULT_PLOT_X_LIM_HALF,
         DEFAULT_PLOT_Y_LIM_HALF
     )
+    from parallel_render import encode_video_parallel
+    from sensor_rig import (
+        DEFAULT_SENSOR_TRANSLATIONS,
+        parse_translations,
+        parse_rig,
+        build_rig
+    )
 except ImportError as e:
     print(f"Error importing from index.py: {e}")
     print("Make sure index.py is in the same directory as cli.py or in the Python path.")
     sys.exit(1)
 
-def parse_translations(trans_str):
-    """Parses a translation string like 'x1,y1;x2,y2;...' into a list of tuples."""
-    if not trans_str:
-        return None
-    try:
-        pairs = trans_str.split(';')
-        translations = []
-        for pair in pairs:
-            x_str, y_str = pair.split(',')
-            translations.append((float(x_str), float(y_str)))
-        if len(translations) != 4:
-            raise ValueError("Exactly 4 translation pairs are required.")
-        return translations
-    except Exception as e:
-        raise argparse.ArgumentTypeError(f"Invalid format for translations: {e}. Expected 'x1,y1;x2,y2;x3,y3;x4,y4'")
-
 def main():
     parser = argparse.ArgumentParser(description="Process .chan files to generate PNGs or videos.")
     parser.add_argument('--input_dir', type=str, default=".",
@@ -55,7 +46,15 @@ def main():
 
     parser.add_argument('--fps', type=int, default=10, help="FPS for generated videos (default: 10).")
     parser.add_argument('--translations', type=parse_translations, default=None,
-                        help="Sensor translations as a string: 'x1,y1;x2,y2;x3,y3;x4,y4'. Uses default if not provided.")
+                        help="Sensor translations as a string: 'x1,y1;x2,y2;...', one pair per sensor. Uses default if not provided.")
+    parser.add_argument('--rig', type=parse_rig, default=None,
+                        help="Sensor rig JSON file (translation, yaw, max range, colour per sensor); any number of sensors.")
+    parser.add_argument('--cluster_backend', choices=['raster', 'occupancy', 'points'], default='raster',
+                        help="How people are grouped in video frames: 'raster' (dilate the canvas), 'occupancy' (dilate a 1-channel occupancy grid) or 'points' (cluster the projected points directly).")
+    parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(),
+                        help="Worker processes: files in parallel for PNGs, frame chunks in parallel for videos (default: all cores, 1 = serial).")
+    parser.add_argument('--no_cache', action='store_true',
+                        help="Always re-parse the text .chan files instead of using/writing .chanb sidecars.")
 
     args = parser.parse_args()
 
@@ -87,14 +86,13 @@ def main():
         print("No files selected for processing.")
         sys.exit(0)
 
-    # Determine translations
-    if args.translations:
-        sensor_translations = args.translations
-    else:
-        sensor_translations = [ # Default translations from index.py or your preference
-            (-6.7, -2.7+1), (6.7, 1.0+1),
-            (6.7, -2.7+1), (-6.7, 1.0+1)
-        ]
+    # Determine the sensor rig
+    try:
+        rig = build_rig(args.rig, args.translations, DEFAULT_SENSOR_TRANSLATIONS)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    sensor_translations = rig.translations.tolist()
 
     # Common parameters for process_chan_file
     common_params = {
@@ -103,9 +101,11 @@ def main():
         'canvas_h_px': DEFAULT_CANVAS_HEIGHT_PX,
         'plot_x_half': DEFAULT_PLOT_X_LIM_HALF,
         'plot_y_half': DEFAULT_PLOT_Y_LIM_HALF,
-        'sensor_trans': sensor_translations,
-        'colors_sensor': DEFAULT_SENSOR_COLORS,
-        'fixed_dpi': DEFAULT_DPI
+        'sensor_trans': rig,
+        'colors_sensor': rig.colors,
+        'fixed_dpi': DEFAULT_DPI,
+        'use_cache': not args.no_cache,
+        'cluster_backend': args.cluster_backend
     }
 
     if args.png:
@@ -118,7 +118,7 @@ def main():
                                  output_dir=output_png_dir,
                                  mode='png')
         
-        num_processes_to_use = min(multiprocessing.cpu_count(), len(files_to_process))
+        num_processes_to_use = min(max(args.jobs, 1), len(files_to_process))
         if num_processes_to_use > 0:
             print(f"Starting parallel PNG processing of {len(files_to_process)} files using up to {num_processes_to_use} processes...")
             with multiprocessing.Pool(processes=num_processes_to_use) as pool:
@@ -135,27 +135,28 @@ def main():
 
         for chan_file in files_to_process:
             print(f"Processing {chan_file} for video...")
-            image_frames = process_chan_file(
-                filename=chan_file,
-                **common_params,
-                output_dir=output_video_dir, # Not strictly used by video_frames mode for saving individual plot images
-                mode='video_frames'
-            )
-
-            if image_frames:
-                base_filename = os.path.splitext(chan_file)[0]
-                # Include translation parameters in video filename for uniqueness if desired
-                trans_str_parts = []
-                for t_pair in sensor_translations:
-                    trans_str_parts.append(f"{t_pair[0]:.2f}".replace('.', 'p').replace('-', 'm'))
-                    trans_str_parts.append(f"{t_pair[1]:.2f}".replace('.', 'p').replace('-', 'm'))
-                trans_filename_part = "_".join(trans_str_parts)
-                
-                output_video_path = os.path.join(output_video_dir, f'{base_filename}_params_{trans_filename_part}_fps{args.fps}.mp4')
-                
-                create_video_from_frames(image_frames, output_video_path, fps=args.fps)
+            base_filename = os.path.splitext(chan_file)[0]
+            # Include translation parameters in video filename for uniqueness if desired
+            trans_str_parts = []
+            for t_pair in sensor_translations:
+                trans_str_parts.append(f"{t_pair[0]:.2f}".replace('.', 'p').replace('-', 'm'))
+                trans_str_parts.append(f"{t_pair[1]:.2f}".replace('.', 'p').replace('-', 'm'))
+            trans_filename_part = "_".join(trans_str_parts)
+            
+            output_video_path = os.path.join(output_video_dir, f'{base_filename}_params_{trans_filename_part}_fps{args.fps}.mp4')
+
+            # Frames are rendered lazily and written straight into the encoder,
+            # so memory use does not grow with the capture length.
+            if args.jobs > 1:
+                # Workers render into shared-memory slots the encoder reads from
+                video_path = encode_video_parallel(filename=chan_file, **common_params,
+                                                   output_video_path=output_video_path,
+                                                   fps=args.fps, jobs=args.jobs)
             else:
-                print(f"No frames generated for {chan_file}, skipping video creation.")
+                image_frames = iter_video_frames(filename=chan_file, **common_params)
+                video_path = create_video_from_frames(image_frames, output_video_path, fps=args.fps)
+            if not video_path:
+                print(f"No video written for {chan_file}.")
         print("Video processing complete.")
 
 if __name__ == '__main__':
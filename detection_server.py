@@ -0,0 +1,483 @@
+# detection_server.py
+#
+# Headless LiDAR detection service, runnable without TouchDesigner.
+#
+# Frames come from one of:
+#   --chan FILE   a .chan capture replayed at --fps (optionally --loop)
+#   --udp PORT    datagrams of .chan text rows (2 columns per sensor)
+#   --tcp PORT    a stream of .chan text rows
+#   --sensors SPEC ...  one independent stream per sensor (udp:PORT, tcp:PORT
+#                 or file:PATH of "radius angle" rows), assembled into frames
+#                 by sensor_ingest
+# Each frame goes through the index pipeline (occupancy grid -> dilation ->
+# connected components, or point clustering), then tracker.MultiTracker, and
+# the result is served on one port:
+#   GET /detections   latest {"frame", "tracks": [...]} as JSON
+#   GET /stats        frames processed, mean detection time, clients
+#   WebSocket /       same protocol as ART2: 'detect', 'subscribe {...}',
+#                     'unsubscribe' (see broadcast.py for the push formats)
+#
+#   python detection_server.py --chan point1.chan --fps 10 --loop --port 8765
+#   python detection_server.py --udp 9000 --port 8765
+#   python detection_server.py --sensors udp:9001 udp:9002 udp:9003 udp:9004
+#
+# The WebSocket side is a small RFC 6455 implementation on asyncio streams,
+# so no extra package is needed.
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import time
+
+import numpy as np
+
+import broadcast
+import chanfile
+import sensor_ingest
+import tracker
+from sensor_rig import (
+    DEFAULT_SENSOR_TRANSLATIONS,
+    parse_translations,
+    parse_rig,
+    build_rig
+)
+from index import (
+    detect_frame_centroids,
+    DEFAULT_CANVAS_WIDTH_PX,
+    DEFAULT_CANVAS_HEIGHT_PX,
+    DEFAULT_PLOT_X_LIM_HALF,
+    DEFAULT_PLOT_Y_LIM_HALF
+)
+
+DEFAULT_PORT = 8765
+DEFAULT_REPLAY_FPS = 10.0
+DEFAULT_RADIUS_PX = 20
+LIVE_QUEUE_FRAMES = 2          # live frames waiting for detection; older ones are dropped
+MAX_CLIENT_BUFFER = 1 << 20    # bytes queued for a slow WebSocket client before messages are skipped
+MAX_MESSAGE_BYTES = 8 << 10    # largest client message ('detect', 'subscribe {...}'); bigger ones close the connection
+CLOSE_TOO_BIG = 1009           # RFC 6455 status: message too big
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_CONT, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+# ─────────────────── detection ───────────────────
+
+class Detector:
+    """One frame in, tracked people out (positions normalized to 0~1)."""
+
+    def __init__(self,
+                 sensor_trans,
+                 canvas_w_px=DEFAULT_CANVAS_WIDTH_PX,
+                 canvas_h_px=DEFAULT_CANVAS_HEIGHT_PX,
+                 plot_x_half=DEFAULT_PLOT_X_LIM_HALF,
+                 plot_y_half=DEFAULT_PLOT_Y_LIM_HALF,
+                 radius=DEFAULT_RADIUS_PX,
+                 cluster_backend='occupancy',
+                 gate=tracker.DEFAULT_GATE,
+                 flip=False):
+        self.args = (canvas_w_px, canvas_h_px, plot_x_half, plot_y_half, sensor_trans)
+        self.size = (canvas_w_px, canvas_h_px)
+        self.radius = radius
+        self.cluster_backend = cluster_backend
+        self.flip = flip
+        self.occupancy = np.zeros((canvas_h_px, canvas_w_px), dtype=np.uint8)
+        self.tracker = tracker.MultiTracker(gate=gate)
+        self.frames = 0
+        self.busy_seconds = 0.0
+
+    def process(self, radii, angles, timestamp):
+        start = time.perf_counter()
+        centroids = detect_frame_centroids(radii, angles, *self.args,
+                                           cluster_backend=self.cluster_backend,
+                                           r=self.radius, occupancy=self.occupancy)
+        w, h = self.size
+        if self.flip:       # same orientation as the td.py Script TOP output
+            points = [[(w - 1 - cx) / w, (h - 1 - cy) / h] for cx, cy in centroids]
+        else:
+            points = [[cx / w, cy / h] for cx, cy in centroids]
+        tracks = self.tracker.update(points, timestamp)
+        self.frames += 1
+        self.busy_seconds += time.perf_counter() - start
+        return tracks
+
+
+# ─────────────────── frame sources ───────────────────
+
+async def replay_chan(path, fps=DEFAULT_REPLAY_FPS, loop_forever=False, use_cache=True,
+                      num_sensors=chanfile.NUM_SENSORS):
+    """Yields (radii, angles, timestamp) from a capture at `fps` frames per second."""
+    if use_cache:
+        data, offsets = chanfile.load_chan_cached(path, num_sensors)
+    else:
+        data, offsets = chanfile.load_chan_array(path, np.float64, num_sensors)
+    total = len(offsets) - 1
+    if total == 0:
+        return
+    period = 1.0 / fps
+    next_time = time.monotonic()
+    while True:
+        for k in range(total):
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            radii, angles = chanfile.frame_view(data, offsets, k)
+            yield radii, angles, next_time
+            next_time += period
+        if not loop_forever:
+            return
+
+
+class LiveIngest:
+    """
+    Turns an unframed stream of .chan text into complete frames.
+    Frames wait in a small queue; when detection falls behind the oldest is
+    dropped, so the service always works on recent data.
+    """
+
+    def __init__(self, max_frames=LIVE_QUEUE_FRAMES, num_sensors=chanfile.NUM_SENSORS):
+        self.reader = chanfile.ChanTailReader(dtype=np.float64, num_sensors=num_sensors)
+        self.queue = asyncio.Queue(maxsize=max_frames)
+        self.dropped = 0
+
+    def feed(self, raw):
+        self.reader.feed(raw)
+        done = self.reader.num_frames - 1          # the last frame is still open
+        if done <= 0:
+            return
+        data, offsets = self.reader.data, self.reader.offsets
+        now = time.monotonic()
+        for k in range(done):
+            radii, angles = chanfile.frame_view(data, offsets, k)
+            if self.queue.full():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait((radii.copy(), angles.copy(), now))
+        self.reader.trim(done)
+
+    async def frames(self):
+        while True:
+            yield await self.queue.get()
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, ingest):
+        self.ingest = ingest
+
+    def datagram_received(self, data, addr):
+        self.ingest.feed(data if data.endswith(b'\n') else data + b'\n')
+
+
+async def udp_frames(ingest, host, port):
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(lambda: _UdpProtocol(ingest), local_addr=(host, port))
+    port = transport.get_extra_info('sockname')[1]     # --udp 0: the port the OS picked
+    print(f"Listening for .chan rows on udp://{host}:{port}")
+    async for frame in ingest.frames():
+        yield frame
+
+
+async def tcp_frames(ingest, host, port):
+    async def on_sensor(reader, writer):
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            ingest.feed(chunk)
+        writer.close()
+
+    server = await asyncio.start_server(on_sensor, host, port)
+    port = server.sockets[0].getsockname()[1]          # --tcp 0: the port the OS picked
+    print(f"Listening for .chan rows on tcp://{host}:{port}")
+    async for frame in ingest.frames():
+        yield frame
+
+
+async def sensor_frames(ingest):
+    """Yields frames assembled from independently streaming sensors."""
+    loop = asyncio.get_running_loop()
+    with ingest:
+        print(f"Assembling frames from {ingest.num_sensors} sensor streams")
+        while ingest.running:
+            frame = await loop.run_in_executor(None, ingest.next_frame, 0.5)
+            if frame is not None:
+                yield frame
+
+
+# ─────────────────── WebSocket ───────────────────
+
+def _ws_frame(opcode, payload):
+    n = len(payload)
+    if n < 126:
+        header = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return header + payload
+
+
+class MessageTooBig(Exception):
+    pass
+
+
+class WebSocket:
+    """Server side of one RFC 6455 connection (no extensions)."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.skipped = 0
+
+    def send(self, payload):
+        """Queues a message without waiting; skipped if the client is too far behind."""
+        if self.writer.is_closing():
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+            self.skipped += 1
+            return
+        if isinstance(payload, str):
+            self.writer.write(_ws_frame(OP_TEXT, payload.encode('utf-8')))
+        else:
+            self.writer.write(_ws_frame(OP_BINARY, payload))
+
+    def _close(self, status):
+        if not self.writer.is_closing():
+            self.writer.write(_ws_frame(OP_CLOSE, struct.pack('!H', status)))
+
+    async def _read_frame(self):
+        b0, b1 = await self.reader.readexactly(2)
+        opcode, n = b0 & 0x0F, b1 & 0x7F
+        if n == 126:
+            (n,) = struct.unpack('!H', await self.reader.readexactly(2))
+        elif n == 127:
+            (n,) = struct.unpack('!Q', await self.reader.readexactly(8))
+        if n > MAX_MESSAGE_BYTES:          # checked before reading: the length is client-controlled
+            raise MessageTooBig(n)
+        mask = await self.reader.readexactly(4) if b1 & 0x80 else None
+        payload = await self.reader.readexactly(n)
+        if mask:
+            payload = (np.frombuffer(payload, dtype=np.uint8) ^
+                       np.resize(np.frombuffer(mask, dtype=np.uint8), n)).tobytes()
+        return bool(b0 & 0x80), opcode, payload
+
+    async def messages(self):
+        """Yields (opcode, payload) for complete text/binary messages."""
+        parts, size, first_opcode = [], 0, None
+        while True:
+            try:
+                fin, opcode, payload = await self._read_frame()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            except MessageTooBig:
+                self._close(CLOSE_TOO_BIG)
+                return
+            if opcode == OP_CLOSE:
+                self.writer.write(_ws_frame(OP_CLOSE, payload[:2]))
+                return
+            if opcode == OP_PING:
+                self.writer.write(_ws_frame(OP_PONG, payload))
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode != OP_CONT:
+                first_opcode, parts, size = opcode, [], 0
+            size += len(payload)
+            if size > MAX_MESSAGE_BYTES:       # fragments add up to too much
+                self._close(CLOSE_TOO_BIG)
+                return
+            parts.append(payload)
+            if fin:
+                yield first_opcode, b''.join(parts)
+
+
+# ─────────────────── server ───────────────────
+
+class DetectionServer:
+    """HTTP + WebSocket front end over the latest tracked frame."""
+
+    def __init__(self, detector, ingest=None):
+        self.detector = detector
+        self.ingest = ingest
+        self.frame = -1
+        self.tracks = []
+        self.sockets = {}
+        self.broadcaster = broadcast.Broadcaster(self._send, self._send)
+
+    def _send(self, client, payload):
+        ws = self.sockets.get(client)
+        if ws is not None:
+            ws.send(payload)
+
+    def publish(self, frame, tracks):
+        self.frame, self.tracks = frame, tracks
+        self.broadcaster.publish(frame, tracks)
+
+    def stats(self):
+        d = self.detector
+        stats = {'frame': self.frame,
+                 'frames_processed': d.frames,
+                 'mean_detect_ms': 1000.0 * d.busy_seconds / d.frames if d.frames else 0.0,
+                 'tracks': len(self.tracks),
+                 'clients': len(self.sockets),
+                 'subscribers': len(self.broadcaster.subscribers),
+                 'dropped_frames': getattr(self.ingest, 'dropped', 0)}
+        if isinstance(self.ingest, sensor_ingest.SensorIngest):
+            stats['ingest'] = self.ingest.stats()
+        return stats
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode('latin-1').split('\r\n')
+        method, path = (lines[0].split(' ') + ['', ''])[:2]
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+
+        if headers.get('upgrade', '').lower() == 'websocket':
+            await self._websocket(reader, writer, headers)
+            return
+        if method == 'GET' and path.startswith('/detections'):
+            self._http(writer, 200, json.dumps({'frame': self.frame, 'tracks': self.tracks}))
+        elif method == 'GET' and path.startswith('/stats'):
+            self._http(writer, 200, json.dumps(self.stats()))
+        else:
+            self._http(writer, 404, json.dumps({'error': 'not found'}))
+        await writer.drain()
+        writer.close()
+
+    def _http(self, writer, status, body):
+        reason = {200: 'OK', 404: 'Not Found'}[status]
+        body = body.encode('utf-8')
+        writer.write((f"HTTP/1.1 {status} {reason}\r\n"
+                      "Content-Type: application/json\r\n"
+                      "Access-Control-Allow-Origin: *\r\n"
+                      f"Content-Length: {len(body)}\r\n"
+                      "Connection: close\r\n\r\n").encode('latin-1') + body)
+
+    async def _websocket(self, reader, writer, headers):
+        key = headers.get('sec-websocket-key', '')
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\n"
+                      "Upgrade: websocket\r\n"
+                      "Connection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode('latin-1'))
+        client = writer.get_extra_info('peername')
+        ws = WebSocket(reader, writer)
+        self.sockets[client] = ws
+        try:
+            async for opcode, payload in ws.messages():
+                if opcode != OP_TEXT:
+                    ws.send(payload)                         # echo, as ART2 does
+                    continue
+                text = payload.decode('utf-8', 'replace')
+                msg = text.strip().lower()
+                if msg == 'detect':
+                    ws.send(json.dumps(self.tracks))
+                elif msg.startswith('subscribe'):
+                    try:
+                        self.broadcaster.subscribe(client, **broadcast.parse_subscribe(text))
+                    except ValueError as e:
+                        ws.send(json.dumps({'error': f"bad subscribe options: {e}"}))
+                elif msg == 'unsubscribe':
+                    self.broadcaster.unsubscribe(client)
+                else:
+                    ws.send(text)
+        finally:
+            self.broadcaster.unsubscribe(client)
+            self.sockets.pop(client, None)
+            writer.close()
+
+
+async def serve(frames, detector, host, port, ingest=None):
+    server = DetectionServer(detector, ingest)
+    http = await asyncio.start_server(server.handle, host, port)
+    print(f"Serving detections on http://{host}:{port}/detections and ws://{host}:{port}/")
+    loop = asyncio.get_running_loop()
+    frame_idx = 0
+    async with http:
+        async for radii, angles, timestamp in frames:
+            # Detection runs off the event loop so sockets stay responsive.
+            tracks = await loop.run_in_executor(None, detector.process, radii, angles, timestamp)
+            server.publish(frame_idx, tracks)
+            frame_idx += 1
+        print(f"Source finished after {frame_idx} frames.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Standalone LiDAR detection server (WebSocket + HTTP).")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--chan', type=str, help=".chan capture to replay.")
+    source.add_argument('--udp', type=int, metavar='PORT', help="Receive .chan rows as UDP datagrams.")
+    source.add_argument('--tcp', type=int, metavar='PORT', help="Receive .chan rows over TCP.")
+    source.add_argument('--sensors', nargs='+', metavar='SPEC',
+                        help="One stream per sensor, in sensor order: udp:PORT, tcp:PORT or file:PATH.")
+    parser.add_argument('--fps', type=float, default=DEFAULT_REPLAY_FPS,
+                        help=f"Replay rate for --chan (default: {DEFAULT_REPLAY_FPS}).")
+    parser.add_argument('--loop', action='store_true', help="Replay --chan forever.")
+    parser.add_argument('--no_cache', action='store_true', help="Parse --chan text instead of using the .chanb sidecar.")
+    parser.add_argument('--host', type=str, default='0.0.0.0', help="Interface to listen on (default: 0.0.0.0).")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"HTTP/WebSocket port (default: {DEFAULT_PORT}).")
+    parser.add_argument('--translations', type=parse_translations, default=None,
+                        help="Sensor translations as a string: 'x1,y1;x2,y2;...', one pair per sensor.")
+    parser.add_argument('--rig', type=parse_rig, default=None,
+                        help="Sensor rig JSON file (see sensor_rig.py); any number of sensors.")
+    parser.add_argument('--radius', type=int, default=DEFAULT_RADIUS_PX,
+                        help=f"Cluster radius in canvas pixels (default: {DEFAULT_RADIUS_PX}).")
+    parser.add_argument('--cluster_backend', choices=['occupancy', 'points'], default='occupancy',
+                        help="'occupancy' (dilate a 1-channel grid) or 'points' (cluster the projected points).")
+    parser.add_argument('--gate', type=float, default=tracker.DEFAULT_GATE,
+                        help=f"Tracker gate in normalized units (default: {tracker.DEFAULT_GATE}).")
+    parser.add_argument('--max_wait', type=float, default=sensor_ingest.DEFAULT_MAX_WAIT,
+                        help=f"--sensors: seconds a frame waits for the slowest sensor (default: {sensor_ingest.DEFAULT_MAX_WAIT}).")
+    parser.add_argument('--max_age', type=float, default=sensor_ingest.DEFAULT_MAX_AGE,
+                        help=f"--sensors: seconds before a sensor's last sweep is dropped as stale (default: {sensor_ingest.DEFAULT_MAX_AGE}).")
+    parser.add_argument('--flip', action='store_true',
+                        help="Report positions in the td.py Script TOP orientation (both axes flipped).")
+    args = parser.parse_args()
+
+    try:
+        rig = build_rig(args.rig, args.translations, DEFAULT_SENSOR_TRANSLATIONS)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.sensors and len(args.sensors) != rig.num_sensors:
+        parser.error(f"{len(args.sensors)} sensor streams but the rig has {rig.num_sensors} sensors; "
+                     "pass --rig or --translations with one entry per stream.")
+    detector = Detector(rig,
+                        radius=args.radius,
+                        cluster_backend=args.cluster_backend,
+                        gate=args.gate,
+                        flip=args.flip)
+
+    async def run():
+        ingest = None
+        if args.chan:
+            frames = replay_chan(args.chan, args.fps, args.loop, not args.no_cache, rig.num_sensors)
+        elif args.sensors:
+            ingest = sensor_ingest.SensorIngest(args.sensors, args.host,
+                                                max_wait=args.max_wait, max_age=args.max_age)
+            frames = sensor_frames(ingest)
+        elif args.udp is not None:
+            ingest = LiveIngest(num_sensors=rig.num_sensors)
+            frames = udp_frames(ingest, args.host, args.udp)
+        elif args.tcp is not None:
+            ingest = LiveIngest(num_sensors=rig.num_sensors)
+            frames = tcp_frames(ingest, args.host, args.tcp)
+        await serve(frames, detector, args.host, args.port, ingest)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -12,38 +12,33 @@ sys.path.append(script_dir)
 
 try:
     import index as ntsec_processor
+    import calibration
+    from sensor_rig import SensorRig, DEFAULT_SENSOR_TRANSLATIONS
 except ImportError:
     messagebox.showerror("Error", "Could not import index.py. Make sure it's in the same directory as gui.py or in your PYTHONPATH.")
     sys.exit(1)
 
 class TranslationGUI:
-    def __init__(self, master):
+    def __init__(self, master, rig=None):
         self.master = master
         master.title("Translation Parameter Adjuster")
 
-        # Initial translation values from your selection
-        self.translations_vars = [
-            tk.DoubleVar(value=-6.7), tk.DoubleVar(value= -2.7+1),
-            tk.DoubleVar(value=6.7), tk.DoubleVar(value=1.0+1),
-            tk.DoubleVar(value=6.7), tk.DoubleVar(value=-2.7+1),
-            tk.DoubleVar(value=-6.7), tk.DoubleVar(value=1.0+1)
-        ]
-        self.steps_vars = [tk.DoubleVar(value=0.1) for _ in range(8)]
+        # The rig supplies the sensor count, yaws, ranges and colours;
+        # the GUI only edits its translations.
+        self.rig = rig if rig is not None else SensorRig(DEFAULT_SENSOR_TRANSLATIONS)
+        num_params = 2 * self.rig.num_sensors
+        self.translations_vars = [tk.DoubleVar(value=float(v)) for v in self.rig.translations.ravel()]
+        self.steps_vars = [tk.DoubleVar(value=0.1) for _ in range(num_params)]
 
         self.param_frame = ttk.LabelFrame(master, text="Translation Parameters (Sensor X, Y)")
         self.param_frame.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
         
-        param_labels = ["S1_X", "S1_Y", "S2_X", "S2_Y", "S3_X", "S3_Y", "S4_X", "S4_Y"]
+        param_labels = [f"S{s + 1}_{axis}" for s in range(self.rig.num_sensors) for axis in ("X", "Y")]
         self.entries = []
         self.step_entries = []
 
-        for i in range(8):
-            # Determine row and column for grid layout
-            # Each sensor pair (X,Y) gets a conceptual row in the UI, 
-            # but parameters are laid out horizontally.
-            # 4 sensors, 2 params (X,Y) each. We can do 4 rows in the grid for sensors.
-            # X params in one set of columns, Y in another.
-            sensor_idx_for_label = i // 2 
+        for i in range(num_params):
+            # Each parameter gets its own row in the grid: S1_X, S1_Y, S2_X, ...
             coord_label_text = param_labels[i] # "S1_X", "S1_Y", etc.
 
             # Layout: Label | Entry | Up | Down | StepLabel | StepEntry
@@ -85,6 +80,10 @@ class TranslationGUI:
 
         self.process_button = ttk.Button(self.controls_frame, text="Process and View", command=self.process_data)
         self.process_button.pack(side=tk.LEFT, padx=5)
+
+        # Solves the translations (and yaws) from the selected file's static background
+        self.calibrate_button = ttk.Button(self.controls_frame, text="Calibrate", command=self.calibrate_translations)
+        self.calibrate_button.pack(side=tk.LEFT, padx=5)
         
         self.input_dir_label = ttk.Label(self.controls_frame, text=f"Input Dir: {os.path.abspath(script_dir)}") # Use script_dir
         self.input_dir_label.pack(side=tk.LEFT, padx=5, pady=5)
@@ -134,7 +133,7 @@ class TranslationGUI:
              return
 
         current_translations_paired = []
-        for i in range(0, 8, 2):
+        for i in range(0, len(current_translations_flat), 2):
             current_translations_paired.append((current_translations_flat[i], current_translations_flat[i+1]))
 
         # process_first = self.process_first_var.get() # Old logic
@@ -161,7 +160,7 @@ class TranslationGUI:
             self.master.update_idletasks()
 
             image_path = ntsec_processor.run_processing_for_gui(
-                translations=current_translations_paired,
+                translations=self.rig.with_translations(current_translations_paired),
                 # process_first_file=process_first, # Old parameter
                 selected_file_option=actual_file_selection, # New parameter
                 output_directory=gui_output_dir,
@@ -188,6 +187,45 @@ class TranslationGUI:
             messagebox.showerror("Processing Error", f"An unexpected error occurred: {str(e)}")
             print(traceback.format_exc())
 
+    def calibrate_translations(self):
+        selected_option_str = self.file_selection_var.get()
+        if selected_option_str.endswith(".chan"):
+            chan_file = selected_option_str
+        else: # "first" / "all": calibrate on the first file, the rig is the same for all of them
+            chan_files = sorted(f for f in os.listdir(script_dir) if f.endswith(".chan"))
+            if not chan_files:
+                messagebox.showwarning("No Data", "No .chan files found to calibrate on.")
+                return
+            chan_file = chan_files[0]
+
+        try:
+            start_translations = [(self.translations_vars[i].get(), self.translations_vars[i + 1].get())
+                                  for i in range(0, len(self.translations_vars), 2)]
+        except tk.TclError:
+            messagebox.showerror("Input Error", "Invalid character in translation values. Please use numbers.")
+            return
+
+        try:
+            self.master.config(cursor="watch")
+            self.master.update_idletasks()
+            rig, overlap = calibration.calibrate_file(os.path.join(script_dir, chan_file),
+                                                      self.rig.with_translations(start_translations))
+            self.master.config(cursor="")
+        except Exception as e:
+            self.master.config(cursor="")
+            messagebox.showerror("Calibration Error", f"Could not calibrate on {chan_file}: {str(e)}")
+            print(traceback.format_exc())
+            return
+
+        self.rig = rig
+        for var, value in zip(self.translations_vars, rig.translations.ravel()):
+            var.set(round(float(value), 4))
+        doubtful = [f"S{s + 1}" for s in range(rig.num_sensors) if overlap[s] < calibration.MIN_OVERLAP]
+        if doubtful:
+            messagebox.showwarning("Calibration", f"Little overlap with the other sensors for {', '.join(doubtful)}; "
+                                                  "check those values in the image.")
+        self.process_data()
+
     def display_image(self, image_path):
         try:
             img = Image.open(image_path)
@@ -221,6 +259,7 @@ class TranslationGUI:
 
 
 if __name__ == '__main__':
+    # Optional argument: a sensor rig JSON file (see sensor_rig.py) for rigs other than the default 4 sensors
     root = tk.Tk()
-    gui = TranslationGUI(root)
+    gui = TranslationGUI(root, SensorRig.load(sys.argv[1]) if len(sys.argv) > 1 else None)
     root.mainloop()
\ No newline at end of file
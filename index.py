@@ -6,7 +6,131 @@ import os
 import multiprocessing
 from functools import partial
 import imageio # Added for video creation
+import queue
+import threading
+import time
 import cv2
+from chanfile import load_chan_array, load_chan_cached, frames_to_lists, frame_view, iter_frames
+from sensor_rig import as_rig, DEFAULT_MAX_RANGE, SENSOR_COLORS
+
+def _component_centroids(labels, num_labels, mask):
+    """
+    Centroids of the `mask` pixels of every connected component, in one pass.
+    Only foreground pixels are visited: their labels are accumulated with
+    np.bincount instead of scanning the whole label image once per component.
+    Returns a list of integer (cx, cy), in label order, skipping components
+    that contain no `mask` pixel.
+    """
+    ys, xs = np.nonzero(mask)
+    lab = labels[ys, xs]
+    counts = np.bincount(lab, minlength=num_labels)
+    sum_x = np.bincount(lab, weights=xs, minlength=num_labels)
+    sum_y = np.bincount(lab, weights=ys, minlength=num_labels)
+
+    centroids = []
+    for label in range(1, num_labels):
+        n = counts[label]
+        if n == 0:
+            continue
+        centroids.append((int(sum_x[label] / n), int(sum_y[label] / n)))
+    return centroids
+
+DILATE_BACKENDS = ('ellipse', 'separable')
+DEFAULT_DILATE_BACKEND = 'separable'
+
+_ellipse_kernels = {}   # r -> MORPH_ELLIPSE structuring element
+_separable_plans = {}   # r -> [(row kernel or None, column kernel), ...]
+
+def _ellipse_kernel(r):
+    kernel = _ellipse_kernels.get(r)
+    if kernel is None:
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2*r+1, 2*r+1))
+        _ellipse_kernels[r] = kernel
+    return kernel
+
+def _separable_plan(r):
+    """
+    Splits the (2r+1)^2 ellipse kernel into bands of rows that share the same
+    half-width w. Each band is a 1 x (2w+1) row dilation (grown incrementally
+    from the previous band's) followed by a sparse column dilation that only
+    hits that band's row offsets; the union of the bands is the ellipse.
+    Built from the OpenCV kernel itself, so the result is identical.
+    """
+    plan = _separable_plans.get(r)
+    if plan is not None:
+        return plan
+    kernel = _ellipse_kernel(r)
+    half_widths = kernel.sum(axis=1).astype(np.int64) // 2   # row i covers [r-w, r+w]
+    dys = np.arange(-r, r + 1)
+    plan = []
+    current = 0
+    for w in np.unique(half_widths):
+        row_kernel = None
+        if w > current:
+            row_kernel = np.ones((1, 2 * (w - current) + 1), dtype=np.uint8)
+            current = w
+        col_kernel = (half_widths == w).astype(np.uint8).reshape(-1, 1)
+        # trim the unused outer rows but keep the kernel centred
+        reach = int(np.abs(dys[half_widths == w]).max())
+        plan.append((row_kernel, col_kernel[r - reach:r + reach + 1]))
+    _separable_plans[r] = plan
+    return plan
+
+def dilate_disk(mask: np.ndarray, r: int, backend: str = None) -> np.ndarray:
+    """
+    Dilates a uint8 mask by the MORPH_ELLIPSE disk of radius r.
+    Args:
+        mask (np.ndarray): 2-D uint8 image.
+        r (int): Disk radius in pixels.
+        backend (str): 'ellipse' is a single cv2.dilate with the full kernel,
+            O(r^2) per pixel; 'separable' gives the same pixels from row and
+            column dilations (see _separable_plan), O(r) per pixel.
+            Defaults to DEFAULT_DILATE_BACKEND.
+    Returns:
+        np.ndarray: The dilated mask.
+    """
+    backend = backend or DEFAULT_DILATE_BACKEND
+    if backend == 'ellipse':
+        return cv2.dilate(mask, _ellipse_kernel(r))
+    if backend != 'separable':
+        raise ValueError(f"Unknown dilate backend: {backend!r}")
+    out = None
+    rows = mask
+    for row_kernel, col_kernel in _separable_plan(r):
+        if row_kernel is not None:
+            rows = cv2.dilate(rows, row_kernel)
+        band = cv2.dilate(rows, col_kernel)
+        if out is None:
+            out = band
+        else:
+            cv2.max(out, band, dst=out)
+    return out
+
+def raster_centroids(mask: np.ndarray, x_pct: float, y_pct: float, r: int, dilate_backend: str = None):
+    """
+    Clustering step of group_and_draw_circles on a single-channel mask.
+    Args:
+        mask (np.ndarray): 2-D occupancy (bool or uint8, nonzero = occupied).
+        x_pct (float): Percentage of width to neglect on left and right edges (0-100).
+        y_pct (float): Percentage of height to neglect on top and bottom edges (0-100).
+        r (int): Radius used to merge neighbouring pixels.
+        dilate_backend (str): See dilate_disk.
+    Returns:
+        list: Integer (cx, cy) centroids of the clusters.
+    """
+    h, w = mask.shape[:2]
+    x0, x1, y0, y1 = _margin_box(w, h, x_pct, y_pct)
+
+    # Build full-size mask with neglected edges zeroed
+    mask_full = np.zeros((h, w), dtype=np.uint8)
+    mask_full[y0:y1, x0:x1] = mask[y0:y1, x0:x1] != 0
+
+    # Dilate to merge circles of radius r
+    mask_dilated = dilate_disk(mask_full, r, dilate_backend)
+
+    # Find connected components in the dilated mask
+    num_labels, labels = cv2.connectedComponents(mask_dilated)
+    return _component_centroids(labels, num_labels, mask_full)
 
 def group_and_draw_circles(img: np.ndarray, x_pct: float, y_pct: float, r: int) -> np.ndarray:
     """
@@ -22,14 +146,6 @@ def group_and_draw_circles(img: np.ndarray, x_pct: float, y_pct: float, r: int)
     #print("這有在跑嗎?")
     # Make a copy for output
     output = img.copy()
-    h, w = img.shape[:2]
-    # Compute margins in pixels
-    dx = int(w * x_pct / 100.0)
-    dy = int(h * y_pct / 100.0)
-    x0, x1 = dx, w - dx
-    y0, y1 = dy, h - dy
-    if x1 <= x0 or y1 <= y0:
-        raise ValueError("Neglect percentages too large, resulting in empty region.")
 
     # Create a binary mask of non-white pixels
     if img.ndim == 3:
@@ -39,30 +155,12 @@ def group_and_draw_circles(img: np.ndarray, x_pct: float, y_pct: float, r: int)
         # Grayscale
         mask = img < 255
 
-    # Crop the mask to neglect edges
-    mask_crop = mask[y0:y1, x0:x1]
-    # Build full-size mask with neglected edges zeroed
-    mask_full = np.zeros_like(mask)
-    mask_full[y0:y1, x0:x1] = mask_crop
-
-    # Dilate to merge circles of radius r
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2*r+1, 2*r+1))
-    mask_dilated = cv2.dilate(mask_full.astype(np.uint8), kernel)
-
-    # Find connected components in the dilated mask
-    num_labels, labels = cv2.connectedComponents(mask_dilated)
-
     # Ensure output is BGR for drawing colored circles
     if output.ndim == 2:
         output = cv2.cvtColor(output, cv2.COLOR_GRAY2BGR)
 
     # For each component (excluding background), compute centroid and draw circle
-    for label in range(1, num_labels):
-        ys, xs = np.where((labels == label) & mask_full)
-        if xs.size == 0:
-            continue
-        cx = int(xs.mean())
-        cy = int(ys.mean())
+    for cx, cy in raster_centroids(mask, x_pct, y_pct, r):
         cv2.circle(output, (cx, cy), r, (0, 0, 255), 2)
 
     # Save a debug PNG of the output image for inspection
@@ -76,79 +174,227 @@ def group_and_draw_circles(img: np.ndarray, x_pct: float, y_pct: float, r: int)
 
 
 
+def _grid_neighbor_pairs(xs, ys, cell):
+    """
+    Candidate point pairs (i, j), i < j, whose grid cells (size `cell`) are
+    equal or adjacent. Points are sorted by cell key once; for each of the
+    4 forward neighbour offsets plus the own cell, the matching run of
+    points is found with np.searchsorted and expanded with np.repeat.
+    """
+    gx = np.floor_divide(xs, cell).astype(np.int64)
+    gy = np.floor_divide(ys, cell).astype(np.int64)
+    gx -= gx.min() - 1
+    gy -= gy.min() - 1
+    stride = gy.max() + 2
+    key = gx * stride + gy
+
+    order = np.argsort(key, kind='stable')
+    sorted_key = key[order]
+
+    pairs_i, pairs_j = [], []
+    for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+        target = key + dx * stride + dy
+        lo = np.searchsorted(sorted_key, target, side='left')
+        hi = np.searchsorted(sorted_key, target, side='right')
+        counts = hi - lo
+        total = counts.sum()
+        if total == 0:
+            continue
+        i = np.repeat(np.arange(key.size), counts)
+        starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        j = order[starts + np.arange(total)]
+        if dx == 0 and dy == 0:
+            keep = i < j                # same cell: each pair once
+            i, j = i[keep], j[keep]
+        pairs_i.append(i)
+        pairs_j.append(j)
+
+    if not pairs_i:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+def _union_find_labels(n, pairs_i, pairs_j):
+    """
+    Connected-component labels of n nodes linked by (pairs_i, pairs_j), using
+    vectorized min-label propagation with pointer jumping.
+    Returns labels in 0..k-1, numbered in order of first appearance.
+    """
+    parent = np.arange(n)
+    while True:
+        root_i = parent[pairs_i]
+        root_j = parent[pairs_j]
+        low = np.minimum(root_i, root_j)
+        new_parent = parent.copy()
+        np.minimum.at(new_parent, root_i, low)
+        np.minimum.at(new_parent, root_j, low)
+        # Pointer jumping until every node points at a root
+        while True:
+            jumped = new_parent[new_parent]
+            if np.array_equal(jumped, new_parent):
+                break
+            new_parent = jumped
+        if np.array_equal(new_parent, parent):
+            break
+        parent = new_parent
+    _, labels = np.unique(parent, return_inverse=True)
+    return labels
+
+_link_tables = {}       # r -> (tables, reach), see _link_table
+
+def _link_table(r):
+    """
+    Pixel offsets (dx, dy) at which two nodes end up in the same connected
+    component of the mask dilated by the MORPH_ELLIPSE disk of radius r, i.e.
+    their dilated disks overlap or are 8-adjacent. A node is a single pixel
+    (kind 0) or a whole radius-1 dot (kind 1, the DOT_STAMP footprint);
+    tables[kind_i + kind_j][dy + reach, dx + reach] tells whether the pair links.
+    Pixel-pixel is the disk dilated by itself and by a 3x3 square; every dot
+    in the pair grows that set by the footprint once more.
+    Returns (tables, reach).
+    """
+    cached = _link_tables.get(r)
+    if cached is not None:
+        return cached
+    reach = 2 * r + 3
+    stamp = np.zeros((3, 3), dtype=np.uint8)
+    stamp[1 + DOT_STAMP_DY, 1 + DOT_STAMP_DX] = 1
+    table = np.zeros((2 * reach + 1, 2 * reach + 1), dtype=np.uint8)
+    table[reach, reach] = 1
+    table = cv2.dilate(cv2.dilate(table, _ellipse_kernel(r)), _ellipse_kernel(r))
+    table = cv2.dilate(table, np.ones((3, 3), dtype=np.uint8))
+    tables = [table]
+    for _ in range(2):
+        tables.append(cv2.dilate(tables[-1], stamp))
+    cached = (np.stack(tables).astype(bool), reach)
+    _link_tables[r] = cached
+    return cached
+
+def _margin_box(w, h, x_pct, y_pct):
+    """Kept region (x0, x1, y0, y1) of a w x h canvas after neglecting the edge percentages."""
+    dx = int(w * x_pct / 100.0)
+    dy = int(h * y_pct / 100.0)
+    x0, x1 = dx, w - dx
+    y0, y1 = dy, h - dy
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError("Neglect percentages too large, resulting in empty region.")
+    return x0, x1, y0, y1
+
+def cluster_points(x_pixel, y_pixel, r, box=None):
+    """
+    Groups points (pixel coordinates of dot centres) exactly as the dilate +
+    connectedComponents step of raster_centroids does, without building an
+    image. Every point stands for its radius-1 dot (DOT_STAMP); the margin
+    `box` = (x0, x1, y0, y1) drops footprint pixels outside it, as it does on
+    the canvas, so dots it cuts are split into their remaining pixels. Dots and
+    pixels link when their dilated disks touch (_link_table). Centroids are the
+    mean of the distinct footprint pixels of each cluster, the pixel mass that
+    raster_centroids averages, so both give the same clusters and centroids
+    (in a different order).
+    Returns a list of integer (cx, cy) cluster centroids.
+    """
+    if len(x_pixel) == 0:
+        return []
+    dots = np.unique(np.stack([np.asarray(x_pixel, dtype=np.int64),
+                               np.asarray(y_pixel, dtype=np.int64)], axis=1), axis=0)
+    if box is None:
+        pixels = np.empty((0, 2), dtype=np.int64)
+    else:
+        x0, x1, y0, y1 = box
+        whole = ((dots[:, 0] > x0) & (dots[:, 0] < x1 - 1) &
+                 (dots[:, 1] > y0) & (dots[:, 1] < y1 - 1))
+        cut = dots[~whole]
+        dots = dots[whole]
+        pixels = np.stack([(cut[:, :1] + DOT_STAMP_DX).ravel(),
+                           (cut[:, 1:] + DOT_STAMP_DY).ravel()], axis=1)
+        inside = ((pixels[:, 0] >= x0) & (pixels[:, 0] < x1) &
+                  (pixels[:, 1] >= y0) & (pixels[:, 1] < y1))
+        pixels = np.unique(pixels[inside], axis=0)
+    nodes = np.concatenate([dots, pixels])
+    if nodes.shape[0] == 0:
+        return []
+    xs, ys = nodes[:, 0], nodes[:, 1]
+    kind = np.zeros(nodes.shape[0], dtype=np.int64)
+    kind[:len(dots)] = 1
+
+    tables, reach = _link_table(r)
+    pairs_i, pairs_j = _grid_neighbor_pairs(xs, ys, reach + 1)
+    off_x = xs[pairs_j] - xs[pairs_i]
+    off_y = ys[pairs_j] - ys[pairs_i]
+    close = (np.abs(off_x) <= reach) & (np.abs(off_y) <= reach)
+    close[close] = tables[kind[pairs_i][close] + kind[pairs_j][close],
+                          off_y[close] + reach, off_x[close] + reach]
+    labels = _union_find_labels(xs.size, pairs_i[close], pairs_j[close])
+
+    # Centroid over the distinct footprint pixels; touching footprints share a
+    # cluster, so a pixel never carries two labels.
+    mass = np.concatenate([np.stack([(dots[:, :1] + DOT_STAMP_DX).ravel(),
+                                     (dots[:, 1:] + DOT_STAMP_DY).ravel()], axis=1),
+                           pixels])
+    mass_labels = np.concatenate([np.repeat(labels[:len(dots)], DOT_STAMP_DX.size),
+                                  labels[len(dots):]])
+    mass, first = np.unique(mass, axis=0, return_index=True)
+    mass_labels = mass_labels[first]
+    counts = np.bincount(mass_labels)
+    sum_x = np.bincount(mass_labels, weights=mass[:, 0])
+    sum_y = np.bincount(mass_labels, weights=mass[:, 1])
+    return [(int(sx / n), int(sy / n)) for sx, sy, n in zip(sum_x, sum_y, counts)]
+
+def group_points_and_draw_circles(img: np.ndarray, x_pixel, y_pixel, x_pct: float, y_pct: float, r: int) -> np.ndarray:
+    """
+    Point-cloud counterpart of group_and_draw_circles: clusters the projected
+    points directly (cluster_points) instead of dilating the canvas, so the cost
+    scales with the number of points rather than the image size. `img` is only
+    used as the background for the circle overlay.
+    Args:
+        img (np.ndarray): Image to draw the circles on (grayscale or BGR).
+        x_pixel, y_pixel: Pixel coordinates of the frame's dot centres.
+        x_pct (float): Percentage of width to neglect on left and right edges (0-100).
+        y_pct (float): Percentage of height to neglect on top and bottom edges (0-100).
+        r (int): Radius of circles to draw and cluster.
+    Returns:
+        np.ndarray: Output image with drawn circles at cluster centroids.
+    """
+    output = img.copy()
+    h, w = img.shape[:2]
+    box = _margin_box(w, h, x_pct, y_pct)
+
+    if output.ndim == 2:
+        output = cv2.cvtColor(output, cv2.COLOR_GRAY2BGR)
+
+    for cx, cy in cluster_points(x_pixel, y_pixel, r, box):
+        cv2.circle(output, (cx, cy), r, (0, 0, 255), 2)
+    return output
+
+
 def parse_data_file(input_path, output_path):
-    var_radius = [[] for _ in range(4)]
-    var_angle = [[] for _ in range(4)]
-    var_radius_frame = [[] for _ in range(4)]
-    var_angle_frame = [[] for _ in range(4)]
-    rows = []
-    frame_radius=[]
-    frame_angle=[]
-
-    with open(input_path, 'r') as file:
-        for line in file:
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-            values = list(map(float, line.split()))
-            if len(values) != 8:
-                continue  # Skip invalid lines
-            for i in range(4):
-                var_radius[i].append(values[i*2])
-                current_angle = values[i*2+1]
-                if i == 1 or i == 2:  # Sensor 1 (index 1) or Sensor 2 (index 2)
-                    current_angle = (current_angle + 180) % 360
-                var_angle[i].append(current_angle)
-            rows.append(values)
-
-    # Ensure var_angle[0] is not empty before proceeding
-    if not var_angle[0]:
-        # Handle case with no data or only invalid lines
-        # Append an empty frame if var_radius_frame has any data (though unlikely here)
-        if any(sf for sf in var_radius_frame): # Check if any sublist in var_radius_frame is non-empty
-             frame_radius.append(var_radius_frame)
-             frame_angle.append(var_angle_frame)
-        return frame_radius, frame_angle
-
-
-    for i, angle in enumerate(var_angle[0]):
-        raw_angle_difference = 0
-        if i > 0:
-            # Calculate the raw difference from the previous angle of sensor 0
-            raw_angle_difference = abs(angle - var_angle[0][i-1])
-
-        # Frame splitting condition: use raw_angle_difference with the 300 threshold
-        if raw_angle_difference > 300:
-            # If the current var_radius_frame contains data, append it as a completed frame
-            if var_radius_frame[0]: # Check if sensor 0 has data; implies frame is not empty
-                frame_radius.append(var_radius_frame)
-                frame_angle.append(var_angle_frame)
-            
-            # Reset var_radius_frame and var_angle_frame for the new frame
-            var_radius_frame = [[] for _ in range(4)]
-            var_angle_frame = [[] for _ in range(4)]
-            
-            # Add the current data point to the newly started frame
-            for j in range(4):
-                var_radius_frame[j].append(var_radius[j][i])
-                var_angle_frame[j].append(var_angle[j][i])
-        else:
-            # Continue with the current frame: add the current data point
-            for j in range(4):
-                var_radius_frame[j].append(var_radius[j][i])
-                var_angle_frame[j].append(var_angle[j][i])
+    """
+    Legacy entry point: returns frame_radius[n][sensor][sample] and
+    frame_angle[n][sensor][sample] lists.
+    Parsing is done in bulk by chanfile.load_chan_array; this is only the
+    list-of-lists compatibility view over its (data, offsets) result.
+    Angles are raw: sensors 2 and 3 are turned by 180 deg only when the
+    frame is projected (SensorRig yaw), not here.
+    """
+    data, offsets = load_chan_array(input_path, dtype=np.float64)
+    return frames_to_lists(data, offsets)
 
-    # After the loop, append the last frame's data if it exists
-    # Check if the first sensor's list in the last var_radius_frame has data
-    if var_radius_frame[0]:
-        frame_radius.append(var_radius_frame)
-        frame_angle.append(var_angle_frame)
+MAX_SENSOR_RANGE = DEFAULT_MAX_RANGE # Default distance threshold (world units); per sensor in SensorRig
 
-    total_frames = len(frame_radius)
-    # Suppress print for CLI video generation, can be re-enabled if needed for GUI
-    # print(f"Total number of frames: {total_frames}")
+# Pixels covered by cv2.circle(img, c, 1, color, -1): a 3x3 plus centred on c.
+DOT_STAMP_DX = np.array([0, -1, 1, 0, 0])
+DOT_STAMP_DY = np.array([0, 0, 0, -1, 1])
 
-    return frame_radius, frame_angle
+def _project_sensor_points(frame_radii_data, frame_angles_data, sensor_trans):
+    """
+    Vectorized polar-to-world projection.
+    `sensor_trans` is a SensorRig or a list of (x, y) translations, one per sensor.
+    Returns a list of (x_array, y_array) in global coordinates, one per sensor.
+    Points beyond each sensor's max range are dropped.
+    """
+    rig = as_rig(sensor_trans)
+    x_world, y_world, sensor = rig.project(frame_radii_data, frame_angles_data)
+    return [(x_world[start:stop], y_world[start:stop]) for start, stop in rig.split(sensor)]
 
 # NEW HELPER FUNCTION to process sensor data for drawing
 def _process_sensor_data(frame_radii_data, frame_angles_data, sensor_trans):
@@ -156,34 +402,8 @@ def _process_sensor_data(frame_radii_data, frame_angles_data, sensor_trans):
     Process sensor data and return global coordinates for all sensors.
     Returns a list of (x_coords, y_coords) for each sensor.
     """
-    sensor_coords = []
-    
-    for sensor_idx in range(4):
-        sensor_global_x_coords = []
-        sensor_global_y_coords = []
-
-        if sensor_idx < len(frame_radii_data) and \
-           frame_radii_data[sensor_idx] and \
-           sensor_idx < len(frame_angles_data) and \
-           frame_angles_data[sensor_idx]:
-        
-            radii_for_sensor = frame_radii_data[sensor_idx]
-            angles_deg_for_sensor_data = frame_angles_data[sensor_idx]
-            tx, ty = sensor_trans[sensor_idx]
-
-            for r, angle_deg in zip(radii_for_sensor, angles_deg_for_sensor_data):
-                if r <= 15.0: # Distance threshold
-                    angle_rad = np.deg2rad(angle_deg)
-                    x_local = r * np.sin(angle_rad) 
-                    y_local = r * np.cos(angle_rad)
-                    x_global = x_local + tx
-                    y_global = y_local + ty
-                    sensor_global_x_coords.append(x_global)
-                    sensor_global_y_coords.append(y_global)
-        
-        sensor_coords.append((sensor_global_x_coords, sensor_global_y_coords))
-    
-    return sensor_coords
+    return [(x.tolist(), y.tolist())
+            for x, y in _project_sensor_points(frame_radii_data, frame_angles_data, sensor_trans)]
 
 def _world_to_pixel(x_world, y_world, canvas_w_px, canvas_h_px, plot_x_half, plot_y_half):
     """
@@ -203,6 +423,103 @@ def _world_to_pixel(x_world, y_world, canvas_w_px, canvas_h_px, plot_x_half, plo
     
     return x_pixel, y_pixel
 
+def _world_to_pixel_batch(x_world, y_world, canvas_w_px, canvas_h_px, plot_x_half, plot_y_half):
+    """
+    Array version of _world_to_pixel (same arithmetic, same truncation and clamping).
+    """
+    x_norm = (x_world + plot_x_half) / (2 * plot_x_half)
+    y_norm = (y_world + plot_y_half) / (2 * plot_y_half)
+
+    # astype truncates toward zero like int()
+    x_pixel = (x_norm * canvas_w_px).astype(np.int64)
+    y_pixel = ((1 - y_norm) * canvas_h_px).astype(np.int64)  # Flip y-axis
+
+    np.clip(x_pixel, 0, canvas_w_px - 1, out=x_pixel)
+    np.clip(y_pixel, 0, canvas_h_px - 1, out=y_pixel)
+    return x_pixel, y_pixel
+
+def _stamp_dots(image, x_pixel, y_pixel, color):
+    """
+    Draws a radius-1 filled dot at every (x_pixel, y_pixel) with fancy-index
+    writes of DOT_STAMP; equivalent to calling cv2.circle(image, p, 1, color, -1)
+    for each point.
+    """
+    h, w = image.shape[:2]
+    for dx, dy in zip(DOT_STAMP_DX, DOT_STAMP_DY):
+        xs = x_pixel + dx
+        ys = y_pixel + dy
+        inside = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+        image[ys[inside], xs[inside]] = color
+
+def _draw_frame_points(image, frame_radii_data, frame_angles_data,
+                       plot_x_half, plot_y_half, sensor_trans, colors_sensor):
+    """
+    Projects one frame's points in a single stacked transform and rasterizes
+    them onto `image` in place, sensor by sensor (later sensors overwrite
+    earlier ones, as with per-point drawing). Colours are reused cyclically
+    when there are more sensors than colours.
+    Returns the pixel coordinates (x_pixel, y_pixel) of all drawn points.
+    """
+    canvas_h_px, canvas_w_px = image.shape[:2]
+    rig = as_rig(sensor_trans)
+    x_world, y_world, sensor = rig.project(frame_radii_data, frame_angles_data)
+    x_pixel, y_pixel = _world_to_pixel_batch(x_world, y_world, canvas_w_px, canvas_h_px,
+                                             plot_x_half, plot_y_half)
+    for sensor_idx, (start, stop) in enumerate(rig.split(sensor)):
+        if stop > start:
+            color = _get_color_bgr(colors_sensor[sensor_idx % len(colors_sensor)])
+            _stamp_dots(image, x_pixel[start:stop], y_pixel[start:stop], color)
+    return x_pixel, y_pixel
+
+def render_occupancy(frame_radii_data, frame_angles_data,
+                     canvas_w_px, canvas_h_px,
+                     plot_x_half, plot_y_half,
+                     sensor_trans, out=None):
+    """
+    Rasterizes one frame straight into a single-channel uint8 occupancy grid
+    (255 where any sensor has a dot, 0 elsewhere), with the same dot footprint
+    as the coloured canvas but a third of the memory traffic and no channel
+    reduction. `out` is reused when given.
+    Returns (occupancy, x_pixel, y_pixel).
+    """
+    if out is None:
+        out = np.zeros((canvas_h_px, canvas_w_px), dtype=np.uint8)
+    else:
+        out.fill(0)
+    x_world, y_world, _ = as_rig(sensor_trans).project(frame_radii_data, frame_angles_data)
+    x_pixel, y_pixel = _world_to_pixel_batch(x_world, y_world, canvas_w_px, canvas_h_px,
+                                             plot_x_half, plot_y_half)
+    _stamp_dots(out, x_pixel, y_pixel, 255)
+    return out, x_pixel, y_pixel
+
+def detect_frame_centroids(frame_radii_data, frame_angles_data,
+                           canvas_w_px, canvas_h_px,
+                           plot_x_half, plot_y_half,
+                           sensor_trans,
+                           cluster_backend='occupancy',
+                           r=20, x_pct=5.0, y_pct=5.0,
+                           occupancy=None):
+    """
+    Detection without the coloured view: returns the (cx, cy) pixel centroids
+    that frame2opencvIMG would circle. 'raster' and 'occupancy' both cluster
+    the single-channel occupancy grid (`occupancy` is an optional reusable
+    buffer); 'points' clusters the projected points and builds no grid at all,
+    with the same clusters and centroids (see cluster_points).
+    """
+    if cluster_backend == 'points':
+        x_world, y_world, _ = as_rig(sensor_trans).project(frame_radii_data, frame_angles_data)
+        x_pixel, y_pixel = _world_to_pixel_batch(x_world, y_world,
+                                                 canvas_w_px, canvas_h_px, plot_x_half, plot_y_half)
+        return cluster_points(x_pixel, y_pixel, r,
+                              _margin_box(canvas_w_px, canvas_h_px, x_pct, y_pct))
+    if cluster_backend not in ('raster', 'occupancy'):
+        raise ValueError(f"Unknown cluster backend: {cluster_backend!r}")
+    occupancy, _, _ = render_occupancy(frame_radii_data, frame_angles_data,
+                                       canvas_w_px, canvas_h_px,
+                                       plot_x_half, plot_y_half,
+                                       sensor_trans, out=occupancy)
+    return raster_centroids(occupancy, x_pct, y_pct, r)
+
 def _get_color_bgr(color_name):
     """
     Convert color name to BGR tuple for OpenCV.
@@ -212,6 +529,10 @@ def _get_color_bgr(color_name):
         'green': (0, 255, 0),
         'blue': (255, 0, 0),
         'purple': (128, 0, 128),
+        'orange': (0, 165, 255),
+        'cyan': (255, 255, 0),
+        'magenta': (255, 0, 255),
+        'brown': (42, 42, 165),
         'black': (0, 0, 0),
         'white': (255, 255, 255)
     }
@@ -226,26 +547,33 @@ def frame2opencvIMG(frame_radii_data,
                     plot_y_half, 
                     sensor_trans, 
                     colors_sensor, 
-                    fixed_dpi):
+                    fixed_dpi,
+                    cluster_backend='raster'):
     """
     Generates an image (NumPy array) for a single frame's data using pure OpenCV.
+    `cluster_backend` selects how people are grouped: 'raster' dilates the
+    canvas (group_and_draw_circles), 'occupancy' dilates a single-channel
+    occupancy grid drawn from the points instead of reducing the colour
+    canvas, 'points' clusters the projected points directly
+    (group_points_and_draw_circles).
     """
     # Create white background image
     image = np.full((canvas_h_px, canvas_w_px, 3), 255, dtype=np.uint8)
     
-    # Process sensor data to get coordinates
-    sensor_coords = _process_sensor_data(frame_radii_data, frame_angles_data, sensor_trans)
-    
-    # Draw points for each sensor
-    for sensor_idx, (x_coords, y_coords) in enumerate(sensor_coords):
-        if x_coords and y_coords:
-            color_bgr = _get_color_bgr(colors_sensor[sensor_idx])
-            
-            for x_world, y_world in zip(x_coords, y_coords):
-                x_pixel, y_pixel = _world_to_pixel(x_world, y_world, canvas_w_px, canvas_h_px, plot_x_half, plot_y_half)
-                # Draw a small circle for each point (radius=1 for small dots)
-                cv2.circle(image, (x_pixel, y_pixel), 1, color_bgr, -1)
+    # Project and draw all points of the frame in bulk
+    x_pixel, y_pixel = _draw_frame_points(image, frame_radii_data, frame_angles_data,
+                                          plot_x_half, plot_y_half, sensor_trans, colors_sensor)
     
+    if cluster_backend == 'points':
+        return group_points_and_draw_circles(image, x_pixel, y_pixel, 5.0, 5.0, 20)
+    if cluster_backend == 'occupancy':
+        occupancy = np.zeros((canvas_h_px, canvas_w_px), dtype=np.uint8)
+        _stamp_dots(occupancy, x_pixel, y_pixel, 255)
+        for cx, cy in raster_centroids(occupancy, 5.0, 5.0, 20):
+            cv2.circle(image, (cx, cy), 20, (0, 0, 255), 2)
+        return image
+    if cluster_backend != 'raster':
+        raise ValueError(f"Unknown cluster backend: {cluster_backend!r}")
     return group_and_draw_circles(image, 5.0, 5.0, 20)
 
 # MODIFIED process_chan_file:
@@ -263,15 +591,24 @@ def process_chan_file(filename,
                       sensor_trans, 
                       colors_sensor,
                       fixed_dpi,
-                      mode='png'): # 'png' or 'video_frames'
+                      mode='png', # 'png' or 'video_frames'
+                      use_cache=True, # read through the .chanb sidecar
+                      cluster_backend='raster'): # 'raster' or 'points', see frame2opencvIMG
     
     current_input_path = os.path.join(input_dir, filename)
     # Suppress print for CLI video generation
     # print(f"Processing file: {current_input_path} with translations: {sensor_trans}")
 
-    all_frames_radii, all_frames_angles = parse_data_file(current_input_path, 'dummy.html')
+    # sensor_trans may be a SensorRig or a list of (x, y); the rig's sensor
+    # count drives parsing, its poses are applied when a frame is drawn
+    rig = as_rig(sensor_trans)
+    if use_cache:
+        data, offsets = load_chan_cached(current_input_path, rig.num_sensors)
+    else:
+        data, offsets = load_chan_array(current_input_path, np.float64, rig.num_sensors)
+    total_data_frames = len(offsets) - 1
 
-    if not all_frames_radii or not any(any(sensor_data for sensor_data in frame_data) for frame_data in all_frames_radii):
+    if total_data_frames == 0:
         print(f"No data to plot for {filename}.")
         return None 
 
@@ -280,7 +617,7 @@ def process_chan_file(filename,
     base_filename = os.path.splitext(filename)[0]
     
     trans_str_parts = []
-    for t_pair in sensor_trans:
+    for t_pair in rig.translations:
         trans_str_parts.append(f"{t_pair[0]:.2f}".replace('.', 'p').replace('-', 'm'))
         trans_str_parts.append(f"{t_pair[1]:.2f}".replace('.', 'p').replace('-', 'm'))
     trans_filename_part = "_".join(trans_str_parts)
@@ -290,22 +627,12 @@ def process_chan_file(filename,
         image = np.full((canvas_h_px, canvas_w_px, 3), 255, dtype=np.uint8)
         
         # Process all frames and overlay them on the same image
-        for frame_idx in range(len(all_frames_radii)):
-            current_frame_radii_data = all_frames_radii[frame_idx]
-            current_frame_angles_data = all_frames_angles[frame_idx]
+        for frame_idx in range(total_data_frames):
+            current_frame_radii_data, current_frame_angles_data = frame_view(data, offsets, frame_idx)
 
-            # Process sensor data to get coordinates
-            sensor_coords = _process_sensor_data(current_frame_radii_data, current_frame_angles_data, sensor_trans)
-            
-            # Draw points for each sensor
-            for sensor_idx, (x_coords, y_coords) in enumerate(sensor_coords):
-                if x_coords and y_coords:
-                    color_bgr = _get_color_bgr(colors_sensor[sensor_idx])
-                    
-                    for x_world, y_world in zip(x_coords, y_coords):
-                        x_pixel, y_pixel = _world_to_pixel(x_world, y_world, canvas_w_px, canvas_h_px, plot_x_half, plot_y_half)
-                        # Draw a small circle for each point (radius=1 for small dots)
-                        cv2.circle(image, (x_pixel, y_pixel), 1, color_bgr, -1)
+            # Project and draw this frame's points on top of the previous ones
+            _draw_frame_points(image, current_frame_radii_data, current_frame_angles_data,
+                               plot_x_half, plot_y_half, sensor_trans, colors_sensor)
         
         output_png_filename = os.path.join(output_dir, f'{base_filename}_params_{trans_filename_part}_canvas.png')
         
@@ -320,12 +647,10 @@ def process_chan_file(filename,
     
     elif mode == 'video_frames':
         image_frames = []
-        total_data_frames = len(all_frames_radii)
         print(f"Generating {total_data_frames} frames for video from {filename}...")
 
         for frame_idx in range(total_data_frames):
-            current_frame_radii_data = all_frames_radii[frame_idx]
-            current_frame_angles_data = all_frames_angles[frame_idx]
+            current_frame_radii_data, current_frame_angles_data = frame_view(data, offsets, frame_idx)
             
             # Call frame2opencvIMG to get the image for the current frame
             image = frame2opencvIMG(current_frame_radii_data,
@@ -336,7 +661,8 @@ def process_chan_file(filename,
                                     plot_y_half,
                                     sensor_trans,
                                     colors_sensor,
-                                    fixed_dpi)
+                                    fixed_dpi,
+                                    cluster_backend)
             image_frames.append(image)
             
             # Progress indicator
@@ -344,12 +670,48 @@ def process_chan_file(filename,
         print("\\nVideo frames generated.") # Original had \\n, keeping consistent for now. Consider changing to \n.
         return image_frames
 
+def iter_video_frames(filename,
+                      input_dir,
+                      canvas_w_px,
+                      canvas_h_px,
+                      plot_x_half,
+                      plot_y_half,
+                      sensor_trans,
+                      colors_sensor,
+                      fixed_dpi,
+                      use_cache=True,
+                      cluster_backend='raster'):
+    """
+    Streaming counterpart of process_chan_file(mode='video_frames').
+    Yields one rendered frame at a time, so feeding it to
+    create_video_from_frames keeps only a couple of frames alive no
+    matter how long the capture is.
+    """
+    current_input_path = os.path.join(input_dir, filename)
+    frame_idx = 0
+    for radii, angles in iter_frames(current_input_path, use_cache, as_rig(sensor_trans).num_sensors):
+        image = frame2opencvIMG(radii,
+                                angles,
+                                canvas_w_px,
+                                canvas_h_px,
+                                plot_x_half,
+                                plot_y_half,
+                                sensor_trans,
+                                colors_sensor,
+                                fixed_dpi,
+                                cluster_backend)
+        frame_idx += 1
+        print(f"  Rendered frame {frame_idx}", end='\r')
+        yield image
+    if frame_idx:
+        print()
+
 # --- Add these constants and the new function before your `if __name__ == '__main__':` block ---
 
 DEFAULT_CANVAS_WIDTH_PX = 1280
 DEFAULT_CANVAS_HEIGHT_PX = 720
 DEFAULT_DPI = 100
-DEFAULT_SENSOR_COLORS = ['red', 'green', 'blue', 'purple']
+DEFAULT_SENSOR_COLORS = SENSOR_COLORS[:4] # 'red', 'green', 'blue', 'purple'; see SensorRig.colors for N sensors
 
 # Calculate default plot limits (consistent with original script logic)
 # The key idea was that 15 units of world space map to the canvas width.
@@ -358,11 +720,14 @@ DEFAULT_PLOT_X_LIM_HALF = UNITS_TO_COVER_WIDTH / 2.0
 DEFAULT_PLOT_Y_LIM_HALF = (DEFAULT_CANVAS_HEIGHT_PX * (UNITS_TO_COVER_WIDTH / DEFAULT_CANVAS_WIDTH_PX)) / 2.0
 
 
-def run_processing_for_gui(translations, selected_file_option, output_directory, input_directory="."):
+def run_processing_for_gui(translations, selected_file_option, output_directory, input_directory=".", use_cache=True):
     """
     Callable function from GUI to process .chan files.
     Returns path to the generated image, or None.
+    `translations` is a list of (x, y) pairs, one per sensor, or a SensorRig.
     `selected_file_option` can be a filename, "__FIRST__", or "__ALL__".
+    With `use_cache`, captures are read through their .chanb sidecar, so
+    repeated "Process and View" clicks do not re-parse the text files.
     """
     os.makedirs(output_directory, exist_ok=True)
 
@@ -371,7 +736,7 @@ def run_processing_for_gui(translations, selected_file_option, output_directory,
     fixed_dpi = DEFAULT_DPI
     plot_x_half = DEFAULT_PLOT_X_LIM_HALF
     plot_y_half = DEFAULT_PLOT_Y_LIM_HALF
-    sensor_colors = DEFAULT_SENSOR_COLORS
+    sensor_colors = as_rig(translations).colors
 
     try:
         chan_files = [f for f in os.listdir(input_directory) if f.endswith(".chan")]
@@ -436,7 +801,8 @@ def run_processing_for_gui(translations, selected_file_option, output_directory,
             sensor_trans=translations,
             colors_sensor=sensor_colors,
             fixed_dpi=fixed_dpi,
-            mode='png' 
+            mode='png',
+            use_cache=use_cache
         )
         if current_image_path:
             last_image_path = current_image_path
@@ -449,19 +815,120 @@ def run_processing_for_gui(translations, selected_file_option, output_directory,
             
     return last_image_path
 
+DEFAULT_ENCODER_QUEUE = 8 # frames buffered between producer and encoder thread
+
+class AsyncVideoWriter:
+    """
+    imageio writer running on a background thread behind a bounded queue.
+    append_data() only enqueues the frame, so the producer (serial renderer,
+    worker pool, live source) keeps rendering while the previous frames are
+    being encoded; when the queue is full it blocks, which is the backpressure.
+    An optional `release` callback is called once a frame has been encoded,
+    for producers that reuse their frame buffers.
+    """
+
+    def __init__(self, output_video_path, fps=10, max_queue=DEFAULT_ENCODER_QUEUE):
+        self.output_video_path = output_video_path
+        self.fps = fps
+        self.frames_encoded = 0
+        self.encode_seconds = 0.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="video-encoder", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            with imageio.get_writer(self.output_video_path, fps=self.fps) as writer:
+                while True:
+                    item = self._queue.get()
+                    if item is None:
+                        break
+                    frame, release = item
+                    t0 = time.perf_counter()
+                    writer.append_data(frame)
+                    self.encode_seconds += time.perf_counter() - t0
+                    self.frames_encoded += 1
+                    del frame
+                    if release is not None:
+                        release()
+        except Exception as e:
+            self._error = e
+            # Drain so a blocked producer wakes up and sees the error; the
+            # None sentinel may already be gone, so never block here.
+            self._drain()
+
+    def _drain(self):
+        """Drops queued frames without encoding them, still releasing their buffers."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and item[1] is not None:
+                item[1]()
+
+    @property
+    def failed(self):
+        """True once the encoder thread has stopped on an error."""
+        return self._error is not None
+
+    def append_data(self, frame, release=None):
+        while True:
+            if self._error is not None:
+                raise self._error
+            try:
+                self._queue.put((frame, release), timeout=0.5)
+            except queue.Full:
+                continue
+            if self._error is not None:   # failed while we were putting: our frame may be stranded
+                self._drain()
+                raise self._error
+            return
+
+    def close(self):
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    @property
+    def throughput_fps(self):
+        return self.frames_encoded / self.encode_seconds if self.encode_seconds else 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
 def create_video_from_frames(image_frames, output_video_path, fps=10):
     """
-    Creates a video from a list of image frames.
+    Creates a video from image frames.
+    `image_frames` may be a list or any iterable (e.g. iter_video_frames);
+    frames are handed to an AsyncVideoWriter as they arrive, so producing the
+    next frame overlaps with encoding the previous ones.
     """
-    if not image_frames:
+    frames_iter = iter(image_frames)
+    first_frame = next(frames_iter, None)
+    if first_frame is None:
         print("No frames to create video.")
         return None
     
     try:
-        with imageio.get_writer(output_video_path, fps=fps) as writer:
-            for frame in image_frames:
+        with AsyncVideoWriter(output_video_path, fps=fps) as writer:
+            writer.append_data(first_frame)
+            del first_frame
+            for frame in frames_iter:
                 writer.append_data(frame)
-        print(f"Video saved to {output_video_path}")
+        print(f"Video saved to {output_video_path} "
+              f"({writer.frames_encoded} frames, encoder {writer.throughput_fps:.1f} fps)")
         return output_video_path
     except Exception as e:
         print(f"Error creating video {output_video_path}: {e}")
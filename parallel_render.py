@@ -0,0 +1,297 @@
+# parallel_render.py
+#
+# Frame-level multi-core rendering for the --video path of cli.py.
+#
+# The capture is split into chunks of consecutive frames that are rendered by
+# a multiprocessing.Pool. Workers never receive the samples as pickled lists:
+#   - with the .chanb cache they memory-map the sidecar themselves,
+#   - without it the parsed (N, 8) array is placed in a SharedMemory block.
+# Rendered frames do not travel back through pickling either: workers write
+# them into a FrameRing, a SharedMemory block of preallocated canvas slots,
+# and only slot indices cross process boundaries. Chunks are collected in
+# submission order, so frames come out in capture order, and a slot is handed
+# back to the workers as soon as the consumer has moved on to the next frame,
+# so rendering and encoding overlap.
+
+import multiprocessing
+import os
+import queue
+from collections import deque
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import chanfile
+from index import AsyncVideoWriter, frame2opencvIMG
+from sensor_rig import as_rig
+
+DEFAULT_CHUNK_SIZE = 4         # frames per task
+RELEASE_POLL = 0.5             # s between checks of `cancelled` while waiting for a free slot
+
+_worker = {}                   # per-process state set up by _init_worker
+
+
+def share_array(data):
+    """
+    Copies `data` into a new SharedMemory block.
+    Returns (shm, source) where `source` describes the block for _open_source.
+    The caller must close() and unlink() `shm` when done.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+    view = np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)
+    view[...] = data
+    return shm, ('shm', shm.name, data.shape, data.dtype.str)
+
+
+def _open_source(source):
+    """Returns (data, keepalive) for a source created by share_array or ('chanb', path)."""
+    if source[0] == 'chanb':
+        data, _ = chanfile.read_chanb(source[1])
+        return data, None
+    _, name, shape, dtype = source
+    shm = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf), shm
+
+
+class FrameRing:
+    """
+    Preallocated frame slots living in one SharedMemory block.
+    The creating process owns (and unlinks) the block; workers attach to it
+    by name through `spec`.
+    """
+
+    def __init__(self, num_slots, frame_shape, dtype=np.uint8, name=None):
+        self.num_slots = num_slots
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        nbytes = num_slots * int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.frames = np.ndarray((num_slots,) + self.frame_shape, dtype=self.dtype,
+                                 buffer=self.shm.buf)
+
+    @property
+    def spec(self):
+        return (self.num_slots, self.frame_shape, self.dtype.str, self.shm.name)
+
+    @classmethod
+    def attach(cls, spec):
+        num_slots, frame_shape, dtype, name = spec
+        return cls(num_slots, frame_shape, dtype, name=name)
+
+    def close(self):
+        self.frames = None      # drop our view before releasing the buffer
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _init_worker(source, offsets, render_args, ring_spec):
+    data, keepalive = _open_source(source)
+    _worker['data'] = data
+    _worker['keepalive'] = keepalive
+    _worker['offsets'] = offsets
+    _worker['render_args'] = render_args
+    _worker['ring'] = FrameRing.attach(ring_spec)
+
+
+def _render_chunk(start, slots):
+    """Renders frames start, start+1, ... into the given ring slots (one per frame)."""
+    data, offsets = _worker['data'], _worker['offsets']
+    frames = _worker['ring'].frames
+    for k, slot in enumerate(slots, start):
+        radii, angles = chanfile.frame_view(data, offsets, k)
+        np.copyto(frames[slot], frame2opencvIMG(radii, angles, *_worker['render_args']))
+    return start
+
+
+class RingRenderer:
+    """
+    Renders one capture on a worker pool into a FrameRing.
+    Use as a context manager and iterate `slots()`; each yielded slot index
+    is valid (ring.frames[slot]) until the next one is requested.
+    """
+
+    def __init__(self,
+                 chan_path,
+                 canvas_w_px,
+                 canvas_h_px,
+                 plot_x_half,
+                 plot_y_half,
+                 sensor_trans,
+                 colors_sensor,
+                 fixed_dpi,
+                 use_cache=True,
+                 cluster_backend='raster',
+                 jobs=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.render_args = (canvas_w_px, canvas_h_px, plot_x_half, plot_y_half,
+                            sensor_trans, colors_sensor, fixed_dpi, cluster_backend)
+        self.frame_shape = (canvas_h_px, canvas_w_px, 3)
+        self.chan_path = chan_path
+        self.num_sensors = as_rig(sensor_trans).num_sensors
+        self.use_cache = use_cache
+        self.data_shm = None
+        self.ring = None
+        self.pool = None
+
+    def __enter__(self):
+        if self.use_cache:
+            data, offsets = chanfile.load_chan_cached(self.chan_path, self.num_sensors)
+            if isinstance(data.base, np.memmap):
+                source = ('chanb', chanfile.sidecar_path(self.chan_path))
+            else:
+                self.data_shm, source = share_array(np.ascontiguousarray(data))  # sidecar not writable
+        else:
+            data, offsets = chanfile.load_chan_array(self.chan_path, np.float64, self.num_sensors)
+            self.data_shm, source = share_array(data)
+        self.offsets = np.array(offsets)
+        del data
+        self.total_frames = len(self.offsets) - 1
+
+        # Two chunks per worker in flight: one being rendered, one waiting.
+        self.ring = FrameRing(2 * self.jobs * self.chunk_size, self.frame_shape)
+        self.pool = multiprocessing.Pool(processes=self.jobs, initializer=_init_worker,
+                                         initargs=(source, self.offsets, self.render_args,
+                                                   self.ring.spec))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+        if self.ring is not None:
+            self.ring.close()
+        if self.data_shm is not None:
+            self.data_shm.close()
+            self.data_shm.unlink()
+        return False
+
+    def release(self, slot):
+        """Returns a slot to the workers; thread-safe (used by the encoder thread)."""
+        self._released.put(slot)
+
+    def slots(self, auto_release=True, cancelled=None):
+        """
+        Yields ring slot indices in frame order. With auto_release a slot is
+        recycled when the next one is requested; otherwise the consumer must
+        call release(slot) once it no longer needs the frame.
+        `cancelled` (callable) is polled while waiting for released slots;
+        once it returns True the iteration stops (e.g. the encoder failed).
+        """
+        self._released = queue.Queue()
+        free = deque(range(self.ring.num_slots))
+        pending = deque()            # (async result, slots) in frame order
+        next_start = 0
+        done = 0
+
+        def submit():
+            """Queues chunks while slots are free; False if `cancelled` stopped the wait."""
+            nonlocal next_start
+            while next_start < self.total_frames:
+                while not self._released.empty():
+                    free.append(self._released.get_nowait())
+                stop = min(next_start + self.chunk_size, self.total_frames)
+                if len(free) < stop - next_start:
+                    if pending:
+                        return True
+                    try:
+                        free.append(self._released.get(timeout=RELEASE_POLL))   # wait for the encoder
+                    except queue.Empty:
+                        if cancelled is not None and cancelled():
+                            return False
+                    continue
+                chunk_slots = [free.popleft() for _ in range(stop - next_start)]
+                pending.append((self.pool.apply_async(_render_chunk, (next_start, chunk_slots)),
+                                chunk_slots))
+                next_start = stop
+            return True
+
+        if not submit():
+            return
+        while pending:
+            result, chunk_slots = pending.popleft()
+            result.get()
+            for slot in chunk_slots:
+                done += 1
+                print(f"  Rendered frame {done}/{self.total_frames}", end='\r')
+                yield slot
+                if auto_release:
+                    free.append(slot)    # consumer is done with it
+            if not submit():
+                break
+        if done:
+            print()
+
+
+def iter_video_frames_parallel(filename,
+                               input_dir,
+                               canvas_w_px,
+                               canvas_h_px,
+                               plot_x_half,
+                               plot_y_half,
+                               sensor_trans,
+                               colors_sensor,
+                               fixed_dpi,
+                               use_cache=True,
+                               cluster_backend='raster',
+                               jobs=None,
+                               chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Parallel counterpart of index.iter_video_frames: yields the same frames,
+    in order, rendered by `jobs` worker processes (default: all cores).
+    Frames are copied out of the ring so callers may keep them; use
+    encode_video_parallel to feed the encoder straight from the ring.
+    """
+    with RingRenderer(os.path.join(input_dir, filename), canvas_w_px, canvas_h_px,
+                      plot_x_half, plot_y_half, sensor_trans, colors_sensor, fixed_dpi,
+                      use_cache, cluster_backend, jobs, chunk_size) as renderer:
+        for slot in renderer.slots():
+            yield renderer.ring.frames[slot].copy()
+
+
+def encode_video_parallel(filename,
+                          input_dir,
+                          output_video_path,
+                          canvas_w_px,
+                          canvas_h_px,
+                          plot_x_half,
+                          plot_y_half,
+                          sensor_trans,
+                          colors_sensor,
+                          fixed_dpi,
+                          fps=10,
+                          use_cache=True,
+                          cluster_backend='raster',
+                          jobs=None,
+                          chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Renders a capture on `jobs` workers and encodes it on a background
+    AsyncVideoWriter, reading each frame directly from its shared-memory slot
+    (no copies, no pickled frames). A slot goes back to the workers only after
+    its frame has been encoded.
+    Returns the video path, or None if there was nothing to encode.
+    """
+    with RingRenderer(os.path.join(input_dir, filename), canvas_w_px, canvas_h_px,
+                      plot_x_half, plot_y_half, sensor_trans, colors_sensor, fixed_dpi,
+                      use_cache, cluster_backend, jobs, chunk_size) as renderer:
+        if renderer.total_frames == 0:
+            print("No frames to create video.")
+            return None
+        try:
+            with AsyncVideoWriter(output_video_path, fps=fps) as writer:
+                for slot in renderer.slots(auto_release=False, cancelled=lambda: writer.failed):
+                    writer.append_data(renderer.ring.frames[slot],
+                                       release=partial(renderer.release, slot))
+            print(f"Video saved to {output_video_path} "
+                  f"({writer.frames_encoded} frames, encoder {writer.throughput_fps:.1f} fps)")
+            return output_video_path
+        except Exception as e:
+            print(f"Error creating video {output_video_path}: {e}")
+            return None
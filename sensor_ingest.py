@@ -0,0 +1,432 @@
+# sensor_ingest.py
+#
+# Live ingest for sensors that stream independently (one Hokuyo unit per
+# connection, as with the op('hokuyo1')...op('hokuyo4') CHOPs in td.py)
+# instead of arriving pre-interleaved as 8-column .chan rows.
+#
+#   reader thread (one per sensor)        assembler (consumer)
+#   bytes -> SweepSplitter -> SweepRing  ─┐
+#   bytes -> SweepSplitter -> SweepRing  ─┼─> FrameAssembler -> (radii, angles, t)
+#   ...                                  ─┘
+#
+# Each sensor sends text rows "radius angle" (comments and malformed rows are
+# skipped, as in chanfile). A sweep ends where the angle wraps around
+# (a jump of more than chanfile.FRAME_SPLIT_DEG); the completed sweep is
+# stamped with its arrival time and published to that sensor's SweepRing.
+# Angles are passed on raw; the consumer projects them with a sensor_rig pose.
+#
+# SweepRing is single-producer / single-consumer and takes no lock: the reader
+# fills a preallocated slot and then publishes it by bumping a sequence
+# counter (one int store); the assembler copies the newest slot and re-checks
+# the counter to detect the rare case where the reader lapped it mid-copy.
+#
+# The assembler builds a frame from each sensor's most recent complete sweep.
+# It emits as soon as every live sensor has a new sweep, or `max_wait` after
+# the first new sweep, so one slow sensor delays a frame by at most max_wait.
+# Sweeps older than `max_age` relative to the newest one are left out (that
+# sensor contributes no points) rather than stalling the others. Any number
+# of sensors is supported.
+#
+#   ingest = SensorIngest(['udp:9001', 'udp:9002', 'udp:9003', 'udp:9004'])
+#   with ingest:
+#       while True:
+#           frame = ingest.next_frame(timeout=0.5)
+#           if frame is not None:
+#               radii, angles, timestamp = frame
+
+import os
+import socket
+import threading
+import time
+
+import numpy as np
+
+import chanfile
+
+DEFAULT_MAX_POINTS = 2048       # samples kept per sweep (longer sweeps are truncated)
+DEFAULT_RING_SLOTS = 4
+DEFAULT_MAX_WAIT = 0.05         # s a frame may wait for the slowest live sensor
+DEFAULT_MAX_AGE = 0.25          # s before a sensor's last sweep counts as stale
+READ_TIMEOUT = 0.2              # s between checks of the stop flag
+
+
+class SweepRing:
+    """
+    Lock-free single-producer / single-consumer ring of complete sweeps.
+    Slots are preallocated; `seq` counts the sweeps published so far and the
+    newest one lives in slot (seq - 1) % num_slots.
+    """
+
+    def __init__(self, num_slots=DEFAULT_RING_SLOTS, max_points=DEFAULT_MAX_POINTS):
+        self.num_slots = num_slots
+        self.max_points = max_points
+        self.radii = np.zeros((num_slots, max_points))
+        self.angles = np.zeros((num_slots, max_points))
+        self.counts = np.zeros(num_slots, dtype=np.int64)
+        self.stamps = np.zeros(num_slots)
+        self.truncated = 0
+        self.seq = 0
+
+    def push(self, radii, angles, stamp):
+        """Producer side: copies one sweep into the next slot and publishes it."""
+        slot = self.seq % self.num_slots
+        n = len(radii)
+        if n > self.max_points:
+            n = self.max_points
+            self.truncated += 1
+        self.radii[slot, :n] = radii[:n]
+        self.angles[slot, :n] = angles[:n]
+        self.counts[slot] = n
+        self.stamps[slot] = stamp
+        self.seq += 1                       # publish (single writer)
+
+    def latest_stamp(self):
+        """(seq, timestamp) of the newest sweep, or (0, None) if there is none."""
+        seq = self.seq
+        if seq == 0:
+            return 0, None
+        return seq, float(self.stamps[(seq - 1) % self.num_slots])
+
+    def latest(self):
+        """
+        Consumer side: returns (seq, radii, angles, timestamp) copies of the
+        newest sweep, or None if nothing was published yet.
+        """
+        while True:
+            seq = self.seq
+            if seq == 0:
+                return None
+            slot = (seq - 1) % self.num_slots
+            n = int(self.counts[slot])
+            stamp = float(self.stamps[slot])
+            radii = self.radii[slot, :n].copy()
+            angles = self.angles[slot, :n].copy()
+            # The producer writes slot seq' % num_slots; ours is safe unless it
+            # has come all the way round to it while we were copying.
+            if self.seq - seq < self.num_slots - 1:
+                return seq, radii, angles, stamp
+
+
+class SweepSplitter:
+    """
+    Turns one sensor's unframed "radius angle" text into complete sweeps.
+    Partial lines and the open sweep are kept between feed() calls;
+    every completed sweep goes to `ring` stamped with `clock()`.
+    """
+
+    def __init__(self, ring, clock=time.monotonic):
+        self.ring = ring
+        self.clock = clock
+        self.sweeps = 0
+        self._partial = b''
+        self._open = []                  # (radii, angles) chunks of the open sweep
+        self._prev_angle = None
+
+    def feed(self, raw):
+        """Parses appended bytes. Returns the number of sweeps completed."""
+        raw = self._partial + raw
+        cut = raw.rfind(b'\n') + 1
+        self._partial = raw[cut:]
+        if cut == 0:
+            return 0
+        rows = chanfile.parse_rows_bytes(raw[:cut], 2, np.float64)
+        if rows.shape[0] == 0:
+            return 0
+        radii, angles = rows[:, 0], rows[:, 1]
+
+        prev = np.empty_like(angles)
+        prev[0] = angles[0] if self._prev_angle is None else self._prev_angle
+        prev[1:] = angles[:-1]
+        starts = np.flatnonzero(np.abs(angles - prev) > chanfile.FRAME_SPLIT_DEG)
+        self._prev_angle = angles[-1]
+
+        now = self.clock()
+        done = 0
+        start = 0
+        for stop in starts.tolist():
+            self._open.append((radii[start:stop], angles[start:stop]))
+            self._publish(now)
+            done += 1
+            start = stop
+        self._open.append((radii[start:], angles[start:]))
+        return done
+
+    def _publish(self, stamp):
+        chunks, self._open = self._open, []
+        if len(chunks) == 1:
+            radii, angles = chunks[0]
+        else:
+            radii = np.concatenate([r for r, _ in chunks])
+            angles = np.concatenate([a for _, a in chunks])
+        if radii.size:
+            self.ring.push(radii, angles, stamp)
+            self.sweeps += 1
+
+
+# ─────────────────── byte sources ───────────────────
+#
+# A source is a callable read(timeout) -> bytes; it returns b'' when nothing
+# arrived within `timeout` and None once the stream has ended for good.
+
+def udp_source(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+
+    def read(timeout):
+        sock.settimeout(timeout)
+        try:
+            data = sock.recv(65536)
+        except socket.timeout:
+            return b''
+        return data if data.endswith(b'\n') else data + b'\n'
+
+    read.close = sock.close
+    return read
+
+
+def tcp_source(host, port):
+    """Listens on `port` and reads from one sensor connection at a time."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen(1)
+    conn = [None]
+
+    def read(timeout):
+        if conn[0] is None:
+            server.settimeout(timeout)
+            try:
+                conn[0], _ = server.accept()
+            except socket.timeout:
+                return b''
+        conn[0].settimeout(timeout)
+        try:
+            data = conn[0].recv(65536)
+        except socket.timeout:
+            return b''
+        if not data:                     # sensor disconnected; wait for the next one
+            conn[0].close()
+            conn[0] = None
+        return data
+
+    def close():
+        if conn[0] is not None:
+            conn[0].close()
+        server.close()
+
+    read.close = close
+    return read
+
+
+def file_source(path, follow=True):
+    """Reads a text file of "radius angle" rows, then keeps tailing it if `follow`."""
+    file = open(path, 'rb')
+
+    def read(timeout):
+        data = file.read(65536)
+        if data:
+            return data
+        if not follow:
+            return None
+        time.sleep(timeout)
+        return b''
+
+    read.close = file.close
+    return read
+
+
+def open_source(spec, host='0.0.0.0'):
+    """
+    Opens a source from a spec string: 'udp:PORT', 'tcp:PORT' or 'file:PATH'.
+    """
+    kind, _, arg = spec.partition(':')
+    kind = kind.lower()
+    if kind == 'udp':
+        return udp_source(host, int(arg))
+    if kind == 'tcp':
+        return tcp_source(host, int(arg))
+    if kind == 'file':
+        return file_source(os.path.expanduser(arg))
+    raise ValueError(f"Unknown sensor source {spec!r}; expected udp:PORT, tcp:PORT or file:PATH.")
+
+
+class SensorReader(threading.Thread):
+    """Reader thread for one sensor: source bytes -> SweepSplitter -> SweepRing."""
+
+    def __init__(self, index, read, splitter, on_sweep=None):
+        super().__init__(name=f"sensor-{index}", daemon=True)
+        self.index = index
+        self.read = read
+        self.splitter = splitter
+        self.on_sweep = on_sweep
+        self.stop_event = threading.Event()
+        self.error = None
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                data = self.read(READ_TIMEOUT)
+                if data is None:
+                    self.splitter.feed(b'\n')     # last line without a newline
+                    break
+                if data and self.splitter.feed(data) and self.on_sweep is not None:
+                    self.on_sweep()
+        except OSError as e:
+            if not self.stop_event.is_set():
+                self.error = e
+        finally:
+            close = getattr(self.read, 'close', None)
+            if close is not None:
+                close()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class FrameAssembler:
+    """
+    Builds frames from the newest complete sweep of every sensor (see the
+    module comment for the emit and staleness rules).
+    """
+
+    def __init__(self, rings, max_wait=DEFAULT_MAX_WAIT, max_age=DEFAULT_MAX_AGE,
+                 clock=time.monotonic):
+        self.rings = list(rings)
+        self.max_wait = max_wait
+        self.max_age = max_age
+        self.clock = clock
+        self.used = [0] * len(self.rings)    # seq of the newest sweep each sensor had at the last frame
+        self.pending_since = None
+        self.frames = 0
+        self.stale = [0] * len(self.rings)   # frames each sensor was left out of
+        self.skew = 0.0                      # timestamp spread of the last frame
+
+    def poll(self, now=None):
+        """
+        Returns (radii, angles, timestamp) when a frame is due, else None.
+        radii/angles hold one array per sensor (empty for stale sensors);
+        timestamp is that of the newest sweep used.
+        """
+        now = self.clock() if now is None else now
+        heads = [ring.latest_stamp() for ring in self.rings]
+        fresh = [seq > used for (seq, _), used in zip(heads, self.used)]
+        if not any(fresh):
+            return None
+        if self.pending_since is None:
+            self.pending_since = now
+        live = [stamp is not None and now - stamp <= self.max_age for _, stamp in heads]
+        waiting = any(l and not f for l, f in zip(live, fresh))
+        if waiting and now - self.pending_since < self.max_wait:
+            return None
+        return self._assemble()
+
+    def _assemble(self):
+        self.pending_since = None
+        sweeps = [ring.latest() for ring in self.rings]
+        newest = max(s[3] for s in sweeps if s is not None)
+        radii, angles, used_stamps = [], [], []
+        empty = np.empty(0)
+        for i, sweep in enumerate(sweeps):
+            if sweep is None:
+                radii.append(empty)
+                angles.append(empty)
+                self.stale[i] += 1
+                continue
+            seq, r, a, stamp = sweep
+            # A stale sweep is consumed too, or the next poll() would see it
+            # as new and emit another frame from it.
+            self.used[i] = seq
+            if newest - stamp > self.max_age:
+                radii.append(empty)
+                angles.append(empty)
+                self.stale[i] += 1
+                continue
+            radii.append(r)
+            angles.append(a)
+            used_stamps.append(stamp)
+        self.skew = newest - min(used_stamps)
+        self.frames += 1
+        return radii, angles, newest
+
+
+class SensorIngest:
+    """
+    One reader thread and ring per sensor plus the assembler.
+    `sources` are spec strings (see open_source) or read callables, in
+    sensor order. Use as a context manager.
+    """
+
+    def __init__(self, sources, host='0.0.0.0',
+                 max_points=DEFAULT_MAX_POINTS,
+                 max_wait=DEFAULT_MAX_WAIT,
+                 max_age=DEFAULT_MAX_AGE):
+        self.new_sweep = threading.Event()
+        self.rings, self.splitters, self.readers = [], [], []
+        for i, source in enumerate(sources):
+            read = open_source(source, host) if isinstance(source, str) else source
+            ring = SweepRing(max_points=max_points)
+            splitter = SweepSplitter(ring)
+            self.rings.append(ring)
+            self.splitters.append(splitter)
+            self.readers.append(SensorReader(i, read, splitter, self.new_sweep.set))
+        self.assembler = FrameAssembler(self.rings, max_wait, max_age)
+
+    @property
+    def num_sensors(self):
+        return len(self.rings)
+
+    def start(self):
+        for reader in self.readers:
+            reader.start()
+        return self
+
+    def stop(self):
+        for reader in self.readers:
+            reader.stop()
+        for reader in self.readers:
+            reader.join()
+        self.new_sweep.set()             # wake a consumer blocked in next_frame
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    @property
+    def running(self):
+        return any(reader.is_alive() for reader in self.readers)
+
+    def next_frame(self, timeout=None):
+        """
+        Blocks until a frame is assembled and returns (radii, angles,
+        timestamp); returns None after `timeout` seconds without one.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # Clear before polling: a sweep published after the poll sets it again.
+            self.new_sweep.clear()
+            frame = self.assembler.poll()
+            if frame is not None:
+                return frame
+            wait = self.assembler.max_wait
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                wait = min(wait, remaining)
+            self.new_sweep.wait(wait)
+
+    def stats(self):
+        a = self.assembler
+        return {'frames': a.frames,
+                'skew_ms': 1000.0 * a.skew,
+                'sensors': [{'sweeps': s.sweeps,
+                             'stale_frames': stale,
+                             'truncated': ring.truncated,
+                             'alive': reader.is_alive(),
+                             'error': str(reader.error) if reader.error else None}
+                            for s, ring, reader, stale in zip(self.splitters, self.rings,
+                                                              self.readers, a.stale)]}
@@ -0,0 +1,250 @@
+# sensor_rig.py
+#
+# Description of a LiDAR rig with any number of sensors.
+#
+# Every sensor has a pose and two display settings:
+#   translation    (x, y) position in world units
+#   yaw            mounting rotation in degrees, added to the sensor's raw
+#                  angles (units mounted backwards get 180)
+#   max_range      returns farther than this are dropped (world units)
+#   color          colour name of its dots (see index._get_color_bgr)
+# A capture of an N-sensor rig has 2N columns per .chan row:
+#     radius1 angle1 radius2 angle2 ... radiusN angleN
+# and the angles are stored as recorded; the pose is only applied here.
+#
+# The pose of sensor s is precomputed as a 2x3 affine matrix (self.poses[s]):
+#     [x]   [ cos(yaw)  sin(yaw)  tx ]   [r * sin(angle)]
+#     [y] = [-sin(yaw)  cos(yaw)  ty ] @ [r * cos(angle)]
+#                                        [      1       ]
+# project() = local_points() + transform(). local_points() turns a frame into
+# sensor-frame points once; transform() maps them with every sensor's matrix
+# in one stacked operation, so re-projecting a capture under a new calibration
+# (with_pose / with_translations) is an array multiply, not a re-parse.
+# The per-sensor parameters are looked up through a sensor-index array, so the
+# cost grows with the number of points, not with the number of sensors.
+#
+# Rigs can be stored as JSON:
+#   {"sensors": [{"x": -6.7, "y": -1.7, "yaw": 0, "max_range": 15, "color": "red"},
+#                ...]}
+# parse_translations / parse_rig / build_rig are the shared --translations and
+# --rig handling of the command-line tools (cli.py, calibration.py,
+# detection_server.py).
+
+import argparse
+import json
+
+import numpy as np
+
+DEFAULT_MAX_RANGE = 15.0        # world units, as the original 4-sensor code
+DEFAULT_YAWS = (0.0, 180.0, 180.0, 0.0)     # 原始 4 台感測器: 2、3 反向安裝
+SENSOR_COLORS = ['red', 'green', 'blue', 'purple', 'orange', 'cyan', 'magenta', 'brown']
+# Default sensor translations (one (x, y) pair per sensor), used by cli.py,
+# gui.py, calibration.py and detection_server.py when no rig is given
+DEFAULT_SENSOR_TRANSLATIONS = [(-6.7, -1.7), (6.7, 2.0),
+                               (6.7, -1.7), (-6.7, 2.0)]
+
+
+def default_yaws(num_sensors):
+    """The original 4-unit rig has sensors 2 and 3 mounted backwards; other rigs start at 0."""
+    if num_sensors == len(DEFAULT_YAWS):
+        return list(DEFAULT_YAWS)
+    return [0.0] * num_sensors
+
+
+def pose_matrices(translations, yaws):
+    """
+    (N, 2, 3) affine matrices of N sensor poses (see the header). cos/sin of
+    multiples of 90 deg are exact, so a 180 deg unit maps (x, y) to (-x, -y).
+    """
+    translations = np.asarray(translations, dtype=np.float64)
+    yaw = np.deg2rad(np.asarray(yaws, dtype=np.float64))
+    c, s = np.cos(yaw), np.sin(yaw)
+    c[np.abs(c) < 1e-12] = 0.0
+    s[np.abs(s) < 1e-12] = 0.0
+    poses = np.empty((translations.shape[0], 2, 3))
+    poses[:, 0, 0], poses[:, 0, 1], poses[:, 0, 2] = c, s, translations[:, 0]
+    poses[:, 1, 0], poses[:, 1, 1], poses[:, 1, 2] = -s, c, translations[:, 1]
+    return poses
+
+
+def default_colors(num_sensors):
+    return [SENSOR_COLORS[s % len(SENSOR_COLORS)] for s in range(num_sensors)]
+
+
+class SensorRig:
+    """Per-sensor pose (translation + yaw), max range and colour of an N-sensor rig."""
+
+    def __init__(self, translations, yaws=None, max_ranges=None, colors=None):
+        translations = np.asarray(translations, dtype=np.float64)
+        if translations.ndim != 2 or translations.shape[1] != 2 or translations.shape[0] == 0:
+            raise ValueError("translations must be a non-empty list of (x, y) pairs.")
+        n = translations.shape[0]
+        if yaws is None:
+            yaws = default_yaws(n)
+        if max_ranges is None:
+            max_ranges = DEFAULT_MAX_RANGE
+        self.translations = translations
+        self.yaws = self._per_sensor(yaws, n, 'yaws')
+        self.max_ranges = self._per_sensor(max_ranges, n, 'max_ranges')
+        self.colors = list(colors) if colors else default_colors(n)
+        if len(self.colors) != n:
+            raise ValueError(f"Expected {n} colors, got {len(self.colors)}.")
+        self.poses = pose_matrices(self.translations, self.yaws)
+
+    @staticmethod
+    def _per_sensor(values, n, name):
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 0:
+            return np.full(n, float(values))
+        if values.shape != (n,):
+            raise ValueError(f"Expected {n} {name}, got {values.size}.")
+        return values.copy()
+
+    @property
+    def num_sensors(self):
+        return self.translations.shape[0]
+
+    @property
+    def num_columns(self):
+        return 2 * self.num_sensors
+
+    def __len__(self):
+        return self.num_sensors
+
+    def __repr__(self):
+        return f"SensorRig({self.translations.tolist()}, {self.yaws.tolist()}, " \
+               f"{self.max_ranges.tolist()}, {self.colors})"
+
+    def with_translations(self, translations):
+        """Same rig with new translations (e.g. from --translations or the GUI)."""
+        if len(translations) != self.num_sensors:
+            raise ValueError(f"This rig has {self.num_sensors} sensors, got {len(translations)} translations.")
+        return SensorRig(translations, self.yaws, self.max_ranges, self.colors)
+
+    def with_pose(self, translations=None, yaws=None):
+        """Same rig with a new calibration; omitted parts are kept."""
+        return SensorRig(self.translations if translations is None else translations,
+                         self.yaws if yaws is None else yaws,
+                         self.max_ranges, self.colors)
+
+    def project(self, frame_radii, frame_angles):
+        """
+        Polar-to-world projection of one frame of raw angles.
+        frame_radii / frame_angles hold one sequence per sensor, or are
+        (N, n) arrays as returned by chanfile.frame_view.
+        Returns (x, y, sensor) arrays of the points within range, in sensor
+        order; `sensor` is the index of the sensor each point came from.
+        """
+        return self.transform(*self.local_points(frame_radii, frame_angles))
+
+    def local_points(self, frame_radii, frame_angles):
+        """
+        Range-gated points of one frame in each sensor's own frame, before
+        its pose is applied. Returns (lx, ly, sensor) as in project(); keep
+        them to re-project the frame under other poses with transform().
+        """
+        n = min(self.num_sensors, len(frame_radii), len(frame_angles))
+        if isinstance(frame_radii, np.ndarray) and frame_radii.ndim == 2:
+            radii = np.asarray(frame_radii[:n], dtype=np.float64).ravel()
+            angles = np.asarray(frame_angles[:n], dtype=np.float64).ravel()
+            sensor = np.repeat(np.arange(n), frame_radii.shape[1])
+        else:
+            parts_r = [np.asarray(frame_radii[s], dtype=np.float64).ravel() for s in range(n)]
+            parts_a = [np.asarray(frame_angles[s], dtype=np.float64).ravel() for s in range(n)]
+            counts = [min(r.size, a.size) for r, a in zip(parts_r, parts_a)]
+            if not counts or not sum(counts):
+                empty = np.empty(0, dtype=np.float64)
+                return empty, empty, np.empty(0, dtype=np.int64)
+            radii = np.concatenate([r[:c] for r, c in zip(parts_r, counts)])
+            angles = np.concatenate([a[:c] for a, c in zip(parts_a, counts)])
+            sensor = np.repeat(np.arange(n), counts)
+
+        keep = radii <= self.max_ranges[sensor]
+        r, sensor = radii[keep], sensor[keep]
+        a = np.deg2rad(angles[keep])
+        return r * np.sin(a), r * np.cos(a), sensor
+
+    def transform(self, lx, ly, sensor):
+        """Applies each point's sensor pose matrix: sensor-frame -> world (x, y, sensor)."""
+        m = self.poses[sensor]
+        x = m[:, 0, 0] * lx + m[:, 0, 1] * ly + m[:, 0, 2]
+        y = m[:, 1, 0] * lx + m[:, 1, 1] * ly + m[:, 1, 2]
+        return x, y, sensor
+
+    def split(self, sensor):
+        """Slice bounds of each sensor's points in project() output: [(start, stop), ...]."""
+        bounds = np.searchsorted(sensor, np.arange(self.num_sensors + 1))
+        return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    def to_dict(self):
+        return {'sensors': [{'x': float(x), 'y': float(y),
+                             'yaw': float(yaw),
+                             'max_range': float(rng),
+                             'color': color}
+                            for (x, y), yaw, rng, color in zip(self.translations, self.yaws,
+                                                               self.max_ranges, self.colors)]}
+
+    @classmethod
+    def from_dict(cls, config):
+        sensors = config['sensors']
+        n = len(sensors)
+        yaws = default_yaws(n)
+        colors = default_colors(n)
+        # 'angle_offset' is the earlier name of 'yaw' (same meaning, degrees)
+        return cls([(s['x'], s['y']) for s in sensors],
+                   [s.get('yaw', s.get('angle_offset', yaws[i])) for i, s in enumerate(sensors)],
+                   [s.get('max_range', DEFAULT_MAX_RANGE) for s in sensors],
+                   [s.get('color', colors[i]) for i, s in enumerate(sensors)])
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as file:
+            return cls.from_dict(json.load(file))
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, indent=2)
+        return path
+
+
+def as_rig(sensor_trans):
+    """Accepts a SensorRig or a plain list of (x, y) translations."""
+    if isinstance(sensor_trans, SensorRig):
+        return sensor_trans
+    return SensorRig(sensor_trans)
+
+
+def parse_translations(trans_str):
+    """Parses a translation string like 'x1,y1;x2,y2;...' (one pair per sensor) into a list of tuples; argparse type for --translations."""
+    if not trans_str:
+        return None
+    try:
+        pairs = trans_str.split(';')
+        translations = []
+        for pair in pairs:
+            x_str, y_str = pair.split(',')
+            translations.append((float(x_str), float(y_str)))
+        return translations
+    except Exception as e:
+        raise argparse.ArgumentTypeError(f"Invalid format for translations: {e}. Expected 'x1,y1;x2,y2;...', one pair per sensor")
+
+
+def parse_rig(path):
+    """Loads a sensor rig JSON file (see the header); argparse type for --rig."""
+    try:
+        return SensorRig.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        raise argparse.ArgumentTypeError(f"Invalid sensor rig file {path!r}: {e}")
+
+
+def build_rig(rig, translations, default_translations=DEFAULT_SENSOR_TRANSLATIONS):
+    """
+    Combines --rig and --translations: translations replace the rig's,
+    without a rig they define one (4 pairs = the original layout with
+    sensors 2 and 3 turned 180 deg).
+    """
+    if rig is None:
+        return SensorRig(translations or default_translations)
+    if translations:
+        return rig.with_translations(translations)
+    return rig
@@ -4,9 +4,22 @@ import math, cv2, numpy as np
 # ========================參數=========================
 prams_visual_debug = False
 human_circle_fill = True
+prams_inplace_render = True   # 使用 RenderContext：預先配置的畫布，穩定狀態下每次 cook 幾乎不再配置整張圖
+prams_output_channels = 3     # RenderContext 輸出格式：1 = 單通道、3 = RGB、4 = RGBA（依 TOP 需要的格式）
+prams_detect_cell_cm = None   # 偵測格每格幾公分（例如 5.0）；None = 直接在輸出解析度上找群
+prams_dilate_backend = 'separable'  # 'separable' = 列/行分解（結果相同、快很多）；'ellipse' = 原本的 cv2.dilate 整顆橢圓核
+prams_results_table = None    # 例如 'detections'：另外把偵測結果寫進這個 Table DAT（x, y, r，0~1 正規化）
+# 感測器配置：幾支感測器就幾組（script_chop1 的 radius1..N / angle1..N 要對得上）
+prams_sensor_trans = [(-6.7, -1.7), (6.7, 1.0),
+                      (6.7, -1.7), (-6.7, 1.0)]     # 每支感測器的 (x, y) 位置（世界單位）
+prams_sensor_yaw = [0, 180, 180, 0]  # 每支感測器的安裝角（度，加在原始角度上）；感測器 2、3 反裝 = 180；沒列到的當 0
+prams_sensor_colors = ['red', 'green', 'blue', 'purple', 'orange', 'cyan', 'magenta', 'brown']  # 不夠就循環使用
+prams_sensor_max_range = 15.0 # 超過這個距離的點丟掉；可以是單一數字或每支感測器一個值的 list（不夠的補 15）
 
 # ───────────────────  HELPERS  ──────────────────────────────────
 
+DEFAULT_SENSOR_MAX_RANGE = 15.0   # 原本 4 支感測器的距離門檻
+
 def flip_image_both_axes(img: np.ndarray) -> np.ndarray:
     """
     對一張 BGR 圖像進行水平與垂直翻轉（不含 alpha 通道）
@@ -24,14 +37,18 @@ def flip_image_both_axes(img: np.ndarray) -> np.ndarray:
 
     # flipCode = -1 表示水平 + 垂直翻轉
     return cv2.flip(img, -1)
-def process_image_white_BG_2_black_BG(img: np.ndarray) -> np.ndarray:
+def process_image_white_BG_2_black_BG(img: np.ndarray, dst: np.ndarray = None) -> np.ndarray:
     """
     處理不含 alpha 的 BGR 圖像：
     - 將非黑非白像素設為白色
     - 黑色變白色，白色變黑色
 
+    兩步合起來就是「純黑 → 白，其餘 → 黑」，所以只用一次 inRange 取出純黑，
+    再一次寫出 3 通道結果，不再建四個整張的布林遮罩與三次 fancy-index 寫入。
+
     Parameters:
         img (np.ndarray): 3 通道 BGR 圖像
+        dst (np.ndarray): 可選，(h, w, 3) uint8 輸出緩衝區
 
     Returns:
         np.ndarray: 處理後的圖像
@@ -39,27 +56,29 @@ def process_image_white_BG_2_black_BG(img: np.ndarray) -> np.ndarray:
     if img.ndim != 3 or img.shape[2] != 3:
         raise ValueError("輸入圖像需為 BGR 格式（三通道）")
 
-    bgr = img.copy()
-
-    # 建立黑與白的遮罩
-    black_mask = np.all(bgr == [0, 0, 0], axis=-1)
-    white_mask = np.all(bgr == [255, 255, 255], axis=-1)
-    other_mask = ~(black_mask | white_mask)
-
-    # 將非黑非白像素設為白色
-    bgr[other_mask] = [255, 255, 255]
+    black = cv2.inRange(img, (0, 0, 0), (0, 0, 0))   # 純黑 → 255，其餘 → 0
+    return cv2.cvtColor(black, cv2.COLOR_GRAY2BGR, dst=dst)
 
-    # 更新遮罩
-    black_mask = np.all(bgr == [0, 0, 0], axis=-1)
-    white_mask = np.all(bgr == [255, 255, 255], axis=-1)
-
-    # 黑白反轉
-    bgr[black_mask] = [255, 255, 255]
-    bgr[white_mask] = [0, 0, 0]
-
-    return bgr
 
 
+def _component_centroids(labels, num_labels, mask, flip_size=None):
+    """
+    一次算出所有連通區塊中 mask 像素的重心（只走訪前景像素，用 np.bincount 累加），
+    不再對每個 label 掃一次整張圖。回傳依 label 順序的整數 (cx, cy) 清單。
+    flip_size=(w, h) 表示 labels/mask 是上下左右翻轉過的影像：
+    取整仍在未翻轉的座標下做，再翻回來，結果和「先算再 cv2.flip」一致。
+    """
+    ys, xs = np.nonzero(mask)
+    lab = labels[ys, xs]
+    counts = np.bincount(lab, minlength=num_labels)
+    sum_x = np.bincount(lab, weights=xs, minlength=num_labels)
+    sum_y = np.bincount(lab, weights=ys, minlength=num_labels)
+    if flip_size is None:
+        return [(int(sum_x[l] / counts[l]), int(sum_y[l] / counts[l]))
+                for l in range(1, num_labels) if counts[l]]
+    w1, h1 = flip_size[0] - 1, flip_size[1] - 1
+    return [(w1 - int(w1 - sum_x[l] / counts[l]), h1 - int(h1 - sum_y[l] / counts[l]))
+            for l in range(1, num_labels) if counts[l]]
 
 def group_and_draw_circles(img: np.ndarray, x_pct: float, y_pct: float, r: int) -> np.ndarray:
     h, w  = img.shape[:2]
@@ -67,19 +86,18 @@ def group_and_draw_circles(img: np.ndarray, x_pct: float, y_pct: float, r: int)
     mask   = np.any(img != 255, axis=2)
     mask_crop = mask[dy:h-dy, dx:w-dx]
     mask_full = np.zeros_like(mask); mask_full[dy:h-dy, dx:w-dx] = mask_crop
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2*r+1, 2*r+1))
-    _, labels = cv2.connectedComponents(cv2.dilate(mask_full.astype(np.uint8), kernel))
+    dilate, dilated = _get_legacy_dilator(mask.shape)
+    dilate(mask_full.astype(np.uint8), r, dilated)
+    num_labels, labels = cv2.connectedComponents(dilated)
     out = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-    for lab in range(1, labels.max()+1):
-        ys, xs = np.where((labels == lab) & mask_full)
-        if xs.size:
-            fill_config = 2 # default circle edge px
-            if human_circle_fill:
-                fill_config = -1
-            else:
-                fill_config = 2
-            cv2.circle(out, (int(xs.mean()), int(ys.mean())), r, _get_color_bgr('black'),fill_config)#(0, 0, 255), 2)
-            # ^^^^^^^^^^^^^^^^^^ 這是五月底才調整的，原本不是黑色，我後來調成黑色
+    for cx, cy in _component_centroids(labels, num_labels, mask_full):
+        fill_config = 2 # default circle edge px
+        if human_circle_fill:
+            fill_config = -1
+        else:
+            fill_config = 2
+        cv2.circle(out, (cx, cy), r, _get_color_bgr('black'),fill_config)#(0, 0, 255), 2)
+        # ^^^^^^^^^^^^^^^^^^ 這是五月底才調整的，原本不是黑色，我後來調成黑色
     #return out
     out_and_flip=flip_image_both_axes(out)
     if prams_visual_debug:
@@ -87,20 +105,86 @@ def group_and_draw_circles(img: np.ndarray, x_pct: float, y_pct: float, r: int)
     else: 
         return process_image_white_BG_2_black_BG(out_and_flip)
 
+def _sensor_max_ranges(num_sensors):
+    """
+    prams_sensor_max_range 展開成每支感測器一個值。
+    list 比感測器少時，沒列到的感測器用原本的 15（和 prams_sensor_yaw 一樣補齊，不會 IndexError）。
+    """
+    if np.ndim(prams_sensor_max_range) == 0:
+        return np.full(num_sensors, float(prams_sensor_max_range))
+    ranges = np.full(num_sensors, DEFAULT_SENSOR_MAX_RANGE)
+    given = np.asarray(prams_sensor_max_range, dtype=np.float64).ravel()[:num_sensors]
+    ranges[:given.size] = given
+    return ranges
+
+_poses = {'key': None, 'poses': None}
+
+def _sensor_poses(sensor_trans, num_sensors):
+    """
+    每支感測器的姿態（位移 + prams_sensor_yaw）預先算成 2x3 仿射矩陣，shape (N, 2, 3)：
+        [x]   [ cos(yaw)  sin(yaw)  tx ]   [r·sin(角度)]
+        [y] = [-sin(yaw)  cos(yaw)  ty ] @ [r·cos(角度)]
+                                           [     1     ]
+    參數沒變就沿用上次的矩陣。90° 倍數的 cos/sin 取精確值（180° 就是 (x, y) → (-x, -y)）。
+    """
+    trans = np.asarray(sensor_trans, dtype=np.float64)[:num_sensors]
+    yaw = np.zeros(num_sensors)
+    given = np.asarray(prams_sensor_yaw, dtype=np.float64).ravel()[:num_sensors]
+    yaw[:given.size] = given
+    key = (trans.tobytes(), yaw.tobytes())
+    if _poses['key'] != key:
+        c, s = np.cos(np.radians(yaw)), np.sin(np.radians(yaw))
+        c[np.abs(c) < 1e-12] = 0.0
+        s[np.abs(s) < 1e-12] = 0.0
+        poses = np.empty((num_sensors, 2, 3))
+        poses[:, 0, 0], poses[:, 0, 1], poses[:, 0, 2] = c, s, trans[:, 0]
+        poses[:, 1, 0], poses[:, 1, 1], poses[:, 1, 2] = -s, c, trans[:, 1]
+        _poses['key'], _poses['poses'] = key, poses
+    return _poses['poses']
+
+def _project_points(radii_frame, angles_frame, sensor_trans):
+    """
+    所有感測器的點一次投影到世界座標：先把各支的樣本接成一條，再用感測器編號陣列
+    查每支的最大距離與姿態矩陣（_sensor_poses），成本只跟點數有關，跟感測器支數無關。
+    角度是原始值，反裝的 180° 在這裡由矩陣套用。
+    回傳 (x_world, y_world, bounds)，第 s 支的點是 [bounds[s], bounds[s+1])。
+    """
+    n = min(len(sensor_trans), len(radii_frame), len(angles_frame))
+    radii = [np.asarray(radii_frame[s], dtype=np.float64).ravel() for s in range(n)]
+    angles = [np.asarray(angles_frame[s], dtype=np.float64).ravel() for s in range(n)]
+    counts = [min(r.size, a.size) for r, a in zip(radii, angles)]
+    if not counts or not sum(counts):
+        empty = np.empty(0, dtype=np.float64)
+        return empty, empty, np.zeros(n + 1, dtype=np.int64)
+    radii = np.concatenate([r[:c] for r, c in zip(radii, counts)])
+    angles = np.concatenate([a[:c] for a, c in zip(angles, counts)])
+    sensor = np.repeat(np.arange(n), counts)
+    keep = radii <= _sensor_max_ranges(n)[sensor]
+    r, sensor = radii[keep], sensor[keep]
+    a = np.radians(angles[keep])
+    lx, ly = r * np.sin(a), r * np.cos(a)              # 感測器自己的座標
+    m = _sensor_poses(sensor_trans, n)[sensor]
+    x_world = m[:, 0, 0] * lx + m[:, 0, 1] * ly + m[:, 0, 2]
+    y_world = m[:, 1, 0] * lx + m[:, 1, 1] * ly + m[:, 1, 2]
+    return x_world, y_world, np.searchsorted(sensor, np.arange(n + 1))
+
 #def _draw_frame_on_ax(ax, radii_frame, angles_frame, sensor_trans, colors_sensor):
 def _process_sensor_data(radii_frame, angles_frame, sensor_trans):
     sensor_coords = []
-    for s in range(4):
-        if not radii_frame[s]:
+    max_ranges = _sensor_max_ranges(len(sensor_trans))
+    poses = _sensor_poses(sensor_trans, len(sensor_trans))
+    for s in range(min(len(sensor_trans), len(radii_frame))):
+        if not len(radii_frame[s]):
             continue
-        tx, ty = sensor_trans[s]
+        (c, sn, tx), (_, _, ty) = poses[s]
         ptsx, ptsy = [], []
         for r, ang_deg in zip(radii_frame[s], angles_frame[s]):
-            if r > 15.0:
+            if r > max_ranges[s]:
                 continue
             a = math.radians(ang_deg)
-            ptsx.append(r * math.sin(a) + tx)
-            ptsy.append(r * math.cos(a) + ty)
+            lx, ly = r * math.sin(a), r * math.cos(a)
+            ptsx.append(c * lx + sn * ly + tx)
+            ptsy.append(-sn * lx + c * ly + ty)
         #if ptsx:
         #    ax.scatter(ptsx, ptsy, s=1, color=colors_sensor[s], marker='.')
         sensor_coords.append((ptsx, ptsy))
@@ -116,6 +200,10 @@ def _get_color_bgr(color_name):
         'green': (0, 255, 0),
         'blue': (255, 0, 0),
         'purple': (128, 0, 128),
+        'orange': (0, 165, 255),
+        'cyan': (255, 255, 0),
+        'magenta': (255, 0, 255),
+        'brown': (42, 42, 165),
         'black': (0, 0, 0),
         'white': (255, 255, 255)
     }
@@ -169,7 +257,7 @@ def frame2opencvIMG(frame_radii_data, frame_angles_data,
     # Draw points for each sensor
     for sensor_idx, (x_coords, y_coords) in enumerate(sensor_coords):
         if x_coords and y_coords:
-            color_bgr = _get_color_bgr(colors_sensor[sensor_idx])
+            color_bgr = _get_color_bgr(colors_sensor[sensor_idx % len(colors_sensor)])
             
             for x_world, y_world in zip(x_coords, y_coords):
                 x_pixel, y_pixel = _world_to_pixel(x_world, y_world, canvas_w_px, canvas_h_px, plot_x_half, plot_y_half)
@@ -180,6 +268,312 @@ def frame2opencvIMG(frame_radii_data, frame_angles_data,
     # ==============這裡是參數，很重要，55那個值如果調成20會顯示雙腳，55會是人的肚子的腰圍=========================
     # 5.0、5.0 是 邊界 margin 的百分比
 
+# ───────────────────  IN-PLACE RENDER CONTEXT  ──────────────────
+def _world_to_pixel_flipped(x_world, y_world, canvas_w_px, canvas_h_px, plot_x_half, plot_y_half):
+    """
+    _world_to_pixel 的陣列版本，並把 flip_image_both_axes 直接折進座標轉換：
+    回傳的是「翻轉後」影像上的像素座標 (w-1-x, h-1-y)，截斷與夾限規則不變。
+    """
+    x_norm = (x_world + plot_x_half) / (2 * plot_x_half)
+    y_norm = (y_world + plot_y_half) / (2 * plot_y_half)
+    x_pixel = np.clip((x_norm * canvas_w_px).astype(np.int64), 0, canvas_w_px - 1)
+    y_pixel = np.clip(((1 - y_norm) * canvas_h_px).astype(np.int64), 0, canvas_h_px - 1)
+    return canvas_w_px - 1 - x_pixel, canvas_h_px - 1 - y_pixel
+
+# cv2.circle(img, p, 1, color, -1) 畫出的就是這個十字形的 5 個像素
+_DOT_DX = (0, -1, 1, 0, 0)
+_DOT_DY = (0, 0, 0, -1, 1)
+
+# ───────────────────  DILATION  ─────────────────────────────────
+_ellipse_kernels = {}   # r -> MORPH_ELLIPSE 結構元素
+_separable_plans = {}   # r -> [(列核 or None, 行核), ...]
+
+def _ellipse_kernel(r):
+    k = _ellipse_kernels.get(r)
+    if k is None:
+        k = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2*r+1, 2*r+1))
+        _ellipse_kernels[r] = k
+    return k
+
+def _separable_plan(r):
+    """
+    把 (2r+1)² 的橢圓核依「每一列的半寬 w」分組：每組先做 1×(2w+1) 的水平膨脹
+    （從上一組的結果再長一點），再用只含該組列位移的稀疏直行核做垂直膨脹，
+    全部取聯集就是原本的橢圓。直接由 OpenCV 的核推出來，所以結果逐像素相同。
+    """
+    plan = _separable_plans.get(r)
+    if plan is not None:
+        return plan
+    half_widths = _ellipse_kernel(r).sum(axis=1).astype(np.int64) // 2
+    dys = np.arange(-r, r + 1)
+    plan, current = [], 0
+    for w in np.unique(half_widths):
+        row_k = None
+        if w > current:
+            row_k = np.ones((1, 2 * (w - current) + 1), dtype=np.uint8)
+            current = w
+        reach = int(np.abs(dys[half_widths == w]).max())
+        col_k = (half_widths == w).astype(np.uint8).reshape(-1, 1)[r - reach:r + reach + 1]
+        plan.append((row_k, col_k))
+    _separable_plans[r] = plan
+    return plan
+
+class Dilator:
+    """和 cv2.dilate(src, 橢圓核 r) 結果相同的膨脹，暫存緩衝區只配置一次。"""
+
+    def __init__(self, shape):
+        self.rows = (np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint8))
+        self.band = np.empty(shape, dtype=np.uint8)
+
+    def __call__(self, src, r, dst):
+        if prams_dilate_backend == 'ellipse':
+            return cv2.dilate(src, _ellipse_kernel(r), dst=dst)
+        rows, first = src, True
+        for i, (row_k, col_k) in enumerate(_separable_plan(r)):
+            if row_k is not None:
+                rows = cv2.dilate(rows, row_k, dst=self.rows[i % 2])
+            if first:
+                cv2.dilate(rows, col_k, dst=dst)
+                first = False
+            else:
+                cv2.dilate(rows, col_k, dst=self.band)
+                cv2.max(dst, self.band, dst=dst)
+        return dst
+
+_legacy_dilator = None
+
+def _get_legacy_dilator(shape):
+    """舊版 group_and_draw_circles 用：遮罩尺寸改變時才重新配置 Dilator 與輸出緩衝區。"""
+    global _legacy_dilator
+    if _legacy_dilator is None or _legacy_dilator[0] != shape:
+        _legacy_dilator = (shape, Dilator(shape), np.empty(shape, dtype=np.uint8))
+    return _legacy_dilator[1], _legacy_dilator[2]
+
+class DetectionGrid:
+    """
+    和輸出解析度脫鉤的偵測格：以世界單位（公尺）切成每格 cell_cm 公分，
+    找群（膨脹 + 連通元件）都在這張小格子上做，最後只把圓心換回輸出畫布的像素。
+    膨脹成本只跟場地大小與 cell_cm 有關，TOP 輸出開到 4K 也不會變慢。
+    """
+
+    def __init__(self, canvas_w_px, canvas_h_px, plot_x_half, plot_y_half, cell_cm):
+        self.key = (canvas_w_px, canvas_h_px, plot_x_half, plot_y_half, cell_cm)
+        self.canvas_size = (canvas_w_px, canvas_h_px)
+        self.gw = max(1, int(math.ceil(2 * plot_x_half * 100.0 / cell_cm)))
+        self.gh = max(1, int(math.ceil(2 * plot_y_half * 100.0 / cell_cm)))
+        self.cell_px = canvas_w_px / self.gw          # 一格在輸出畫布上是幾個像素
+        self.occ     = np.empty((self.gh, self.gw), dtype=np.uint8)
+        self.dilated = np.empty((self.gh, self.gw), dtype=np.uint8)
+        self.labels  = np.empty((self.gh, self.gw), dtype=np.int32)
+        self.dilate  = Dilator((self.gh, self.gw))
+
+    def radius_cells(self, r):
+        """輸出畫布上的 r 像素換成格數（至少 1 格）。"""
+        return max(1, int(round(r / self.cell_px)))
+
+    def clear(self):
+        self.occ.fill(0)
+
+    def add_points(self, x_world, y_world, plot_x_half, plot_y_half):
+        """把世界座標點寫進（已翻轉的）格子，規則和 _world_to_pixel_flipped 相同。"""
+        gx, gy = _world_to_pixel_flipped(x_world, y_world, self.gw, self.gh,
+                                         plot_x_half, plot_y_half)
+        self.occ[gy, gx] = 255
+
+    def find_centroids(self, x_pct, y_pct, r):
+        """回傳輸出畫布像素座標（翻轉後）的圓心清單。"""
+        gw, gh = self.gw, self.gh
+        dx, dy = int(gw*x_pct/100), int(gh*y_pct/100)
+        occ = self.occ
+        occ[:dy] = 0; occ[gh-dy:] = 0
+        occ[:, :dx] = 0; occ[:, gw-dx:] = 0
+        self.dilate(occ, self.radius_cells(r), self.dilated)
+        num_labels, _ = cv2.connectedComponents(self.dilated, labels=self.labels)
+        ys, xs = np.nonzero(occ)
+        lab = self.labels[ys, xs]
+        counts = np.bincount(lab, minlength=num_labels)
+        sum_x = np.bincount(lab, weights=xs, minlength=num_labels)
+        sum_y = np.bincount(lab, weights=ys, minlength=num_labels)
+        # 格子中心 (g + 0.5) 換回畫布像素
+        sx = self.canvas_size[0] / gw
+        sy = self.canvas_size[1] / gh
+        return [(int((sum_x[l] / counts[l] + 0.5) * sx), int((sum_y[l] / counts[l] + 0.5) * sy))
+                for l in range(1, num_labels) if counts[l]]
+
+class RenderContext:
+    """
+    Script TOP 的可重複使用繪圖緩衝區（依輸出尺寸建立一次）。
+    清空、畫點、找群、畫圓、黑白反轉都在同一組陣列上就地完成，
+    偵測直接跑在由投影點寫成的單通道佔據格上，彩色畫布只在除錯檢視時才畫；
+    OpenCV 呼叫一律用 dst= 寫回既有緩衝區；翻轉已折進 _world_to_pixel_flipped，
+    所以不用再 cv2.flip，也不需要 BGR→RGB 轉換（兩次通道交換互相抵消）。
+    黑底白圓的輸出直接畫在單通道 out1 上（不經過彩色畫布再反轉），
+    需要 RGB / RGBA 時才展開一次。
+    輸出與 frame2opencvIMG + cvtColor(BGR2RGB) 逐像素相同。
+    """
+
+    def __init__(self, canvas_w_px, canvas_h_px):
+        self.size = (canvas_w_px, canvas_h_px)
+        self.canvas  = np.empty((canvas_h_px, canvas_w_px, 3), dtype=np.uint8)  # 彩色點 + 圓（已翻轉），只有需要時才畫
+        self.mask    = np.empty((canvas_h_px, canvas_w_px), dtype=np.uint8)     # 單通道佔據格（有點 = 255）
+        self.dilated = np.empty((canvas_h_px, canvas_w_px), dtype=np.uint8)
+        self.labels  = np.empty((canvas_h_px, canvas_w_px), dtype=np.int32)
+        self.out1    = np.empty((canvas_h_px, canvas_w_px), dtype=np.uint8)     # 黑底白圓輸出（單通道）
+        self._expanded = {}      # channels -> 展開後的輸出緩衝區
+        self.dilate  = Dilator((canvas_h_px, canvas_w_px))
+        self.grid = None         # DetectionGrid，prams_detect_cell_cm 有設定時才建立
+        self.centroids = []
+        self._black_dots = False # 有感測器的點顏色剛好是黑色（反轉後會變白）
+
+    def draw_points(self, radii_frame, angles_frame, plot_x_half, plot_y_half,
+                    sensor_trans, colors_sensor, colored=False):
+        """
+        把所有感測器的點（一次堆疊投影，支數不限）直接寫進單通道佔據格 mask
+        （偵測只看這張，不必從 3 通道畫布再縮減）。
+        colored=True（或有感測器顏色剛好是黑色）時才另外把彩色點逐支畫到白底 canvas 上。
+        """
+        w, h = self.size
+        n = min(len(sensor_trans), len(radii_frame), len(angles_frame))
+        colors = [_get_color_bgr(colors_sensor[s % len(colors_sensor)]) for s in range(n)]
+        self._black_dots = (0, 0, 0) in colors
+        colored = colored or self._black_dots
+        grid = self.grid
+        mask = self.mask
+        if grid is None:
+            mask.fill(0)
+        else:
+            grid.clear()
+        canvas = self.canvas
+        if colored:
+            canvas.fill(255)
+        x_world, y_world, bounds = _project_points(radii_frame, angles_frame, sensor_trans)
+        if grid is not None:
+            grid.add_points(x_world, y_world, plot_x_half, plot_y_half)
+            if not colored:
+                return
+        xs, ys = _world_to_pixel_flipped(x_world, y_world, w, h, plot_x_half, plot_y_half)
+        if grid is None:
+            for dx, dy in zip(_DOT_DX, _DOT_DY):
+                px, py = xs + dx, ys + dy
+                inside = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+                mask[py[inside], px[inside]] = 255
+        if not colored:
+            return
+        for s in range(n):
+            sx, sy = xs[bounds[s]:bounds[s+1]], ys[bounds[s]:bounds[s+1]]
+            for dx, dy in zip(_DOT_DX, _DOT_DY):
+                px, py = sx + dx, sy + dy
+                inside = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+                canvas[py[inside], px[inside]] = colors[s]
+
+    def find_centroids(self, x_pct, y_pct, r):
+        """group_and_draw_circles 的找群部分（座標在翻轉後的空間），結果存在 self.centroids。"""
+        if self.grid is not None:
+            self.centroids = self.grid.find_centroids(x_pct, y_pct, r)
+            return self.centroids
+        w, h = self.size
+        dx, dy = int(w*x_pct/100), int(h*y_pct/100)
+        mask = self.mask
+        # 邊界 margin 對稱，翻轉前後裁掉的是同一圈
+        mask[:dy] = 0; mask[h-dy:] = 0
+        mask[:, :dx] = 0; mask[:, w-dx:] = 0
+        self.dilate(mask, r, self.dilated)
+        num_labels, _ = cv2.connectedComponents(self.dilated, labels=self.labels)
+        self.centroids = _component_centroids(self.labels, num_labels, mask, flip_size=self.size)
+        return self.centroids
+
+    def draw_circles(self, target, r, color):
+        fill_config = -1 if human_circle_fill else 2
+        for cx, cy in self.centroids:
+            cv2.circle(target, (cx, cy), r, color, fill_config)
+
+    def render_binary(self, r):
+        """
+        直接畫出 process_image_white_BG_2_black_BG 的結果：黑底，圓（與黑色的點）為白，
+        每個像素只寫一次（清零），圓再蓋上去。
+        """
+        out1 = self.out1
+        if self._black_dots:
+            # 少見的設定：沒被其他感測器蓋掉的黑點也要變白
+            cv2.inRange(self.canvas, (0, 0, 0), (0, 0, 0), dst=out1)
+        else:
+            out1.fill(0)
+        self.draw_circles(out1, r, 255)
+        return out1
+
+    def _expand(self, src, code, channels):
+        buf = self._expanded.get(channels)
+        if buf is None:
+            w, h = self.size
+            buf = np.empty((h, w, channels), dtype=np.uint8)
+            self._expanded[channels] = buf
+        return cv2.cvtColor(src, code, dst=buf)
+
+    def set_detection_grid(self, plot_x_half, plot_y_half, cell_cm):
+        """cell_cm 為 None 時回到全解析度偵測；參數沒變就沿用現有格子。"""
+        if not cell_cm:
+            self.grid = None
+            return
+        key = self.size + (plot_x_half, plot_y_half, cell_cm)
+        if self.grid is None or self.grid.key != key:
+            self.grid = DetectionGrid(self.size[0], self.size[1], plot_x_half, plot_y_half, cell_cm)
+
+    def render(self, radii_frame, angles_frame, plot_x_half, plot_y_half,
+               sensor_trans, colors_sensor, x_pct=5.0, y_pct=5.0, r=55, channels=None):
+        """
+        回傳可直接交給 scriptOp.copyNumpyArray 的影像（指向內部緩衝區，
+        下一次 render 會被覆寫）。channels 為 1 / 3 / 4，預設用 prams_output_channels。
+        """
+        channels = channels or prams_output_channels
+        self.set_detection_grid(plot_x_half, plot_y_half, prams_detect_cell_cm)
+        self.draw_points(radii_frame, angles_frame, plot_x_half, plot_y_half,
+                         sensor_trans, colors_sensor, colored=prams_visual_debug)
+        self.find_centroids(x_pct, y_pct, r)
+        if prams_visual_debug:
+            self.draw_circles(self.canvas, r, _get_color_bgr('black'))
+            if channels == 1:
+                return self._expand(self.canvas, cv2.COLOR_RGB2GRAY, 1)
+            if channels == 4:
+                return self._expand(self.canvas, cv2.COLOR_RGB2RGBA, 4)
+            return self.canvas
+        out1 = self.render_binary(r)
+        if channels == 1:
+            return out1[:, :, None]
+        if channels == 4:
+            return self._expand(out1, cv2.COLOR_GRAY2RGBA, 4)
+        return self._expand(out1, cv2.COLOR_GRAY2RGB, 3)
+
+_render_ctx = None
+
+def _get_render_context(canvas_w_px, canvas_h_px):
+    """輸出尺寸改變時才重新配置緩衝區。"""
+    global _render_ctx
+    if _render_ctx is None or _render_ctx.size != (canvas_w_px, canvas_h_px):
+        _render_ctx = RenderContext(canvas_w_px, canvas_h_px)
+    return _render_ctx
+
+# ───────────────────  RESULTS CHANNEL  ──────────────────────────
+RESULTS_KEY = 'detections'    # scriptOp.store() 的 key，ART2 用 fetch() 讀
+
+def publish_detections(scriptOp, centroids, r, size):
+    """
+    把這一次 cook 找到的圓心與半徑發佈出去，ART2 不必再把整張圖讀回 CPU 跑 HoughCircles。
+    座標用輸出影像（copyNumpyArray 的陣列）的像素除以寬高，和 ART2 原本的 [x / w, y / h] 一致。
+    """
+    w, h = size
+    circles = [[cx / w, cy / h, r / w] for cx, cy in centroids]
+    scriptOp.store(RESULTS_KEY, {'frame': absTime.frame,
+                                 'seconds': absTime.seconds,
+                                 'size': [w, h],
+                                 'circles': circles})
+    if prams_results_table:
+        table = op(prams_results_table)
+        if table is not None:
+            table.clear()
+            table.appendRow(['x', 'y', 'r'])
+            for c in circles:
+                table.appendRow(c)
+
 # ───────────────────  PARAM STUB  ───────────────────────────────
 def onSetupParameters(scriptOp):
     # 無自訂參數
@@ -188,15 +582,18 @@ def onSetupParameters(scriptOp):
 # ───────────────────  MAIN COOK  ────────────────────────────────
 def onCook(scriptOp):
     
+    # radius1..N / angle1..N，N 由 prams_sensor_trans 決定
     chop = op('script_chop1')
-    r_vals_1 = chop['radius1'].vals  # numpy array	
-    r_vals_2 = chop['radius2'].vals
-    r_vals_3 = chop['radius3'].vals
-    r_vals_4 = chop['radius4'].vals
-    a_vals_1 = chop['angle1'].vals
-    a_vals_2  = chop['angle2'].vals
-    a_vals_3  = chop['angle3'].vals
-    a_vals_4  = chop['angle4'].vals
+    num_sensors = len(prams_sensor_trans)
+    radii_frame, angles_frame = [], []
+    for s in range(num_sensors):
+        r_ch, a_ch = chop['radius{}'.format(s + 1)], chop['angle{}'.format(s + 1)]
+        if r_ch is None or a_ch is None:       # CHOP 的感測器比配置少：這支當作沒資料
+            radii_frame.append(np.empty(0))
+            angles_frame.append(np.empty(0))
+            continue
+        radii_frame.append(r_ch.vals)          # numpy array
+        angles_frame.append(a_ch.vals)
     
     # 1️⃣  逐支感測器抓資料 —— 你要的變數名稱
     #chop = op('hokuyo1')
@@ -215,20 +612,25 @@ def onCook(scriptOp):
     #r_vals_4 = chop['radius'].vals
     #a_vals_4 = chop['angle'].vals
 
-    # 2️⃣  把四組資料組成函式需要的 list
-    radii_frame  = [r_vals_1, r_vals_2, r_vals_3, r_vals_4]
-    angles_frame = [a_vals_1, a_vals_2, a_vals_3, a_vals_4]
+    # 2️⃣  radii_frame / angles_frame 已在上面依感測器順序組好
 
     # 3️⃣  固定參數
     W, H   = 1920,1080#1280, 720
     DPI    = 100
     plot_x_half = 6.7
     plot_y_half = 6.7 * H / W
-    sensor_trans = [(-6.7, -1.7), (6.7, 1.0),
-                    (6.7, -1.7), (-6.7, 1.0)]
-    colors_sensor = ['red', 'green', 'blue', 'purple']
+    sensor_trans = prams_sensor_trans
+    colors_sensor = prams_sensor_colors
 
     # 4️⃣  產生影像→傳給 Script TOP
+    if prams_inplace_render:
+        ctx = _get_render_context(W, H)
+        scriptOp.copyNumpyArray(ctx.render(radii_frame, angles_frame,
+                                           plot_x_half, plot_y_half,
+                                           sensor_trans, colors_sensor))
+        publish_detections(scriptOp, ctx.centroids, 55, ctx.size)
+        return
+    scriptOp.unstore(RESULTS_KEY)   # 舊流程不發佈結果，ART2 會退回 HoughCircles
     img_bgr = frame2opencvIMG(radii_frame, angles_frame,
                               W, H, plot_x_half, plot_y_half,
                               sensor_trans, colors_sensor, DPI)
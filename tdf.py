@@ -8,14 +8,30 @@
 
 import os
 
+try:                     # chanfile.py 放在專案資料夾（或同名 Text DAT）即可使用 .chanb 快取
+    import chanfile
+except ImportError:
+    chanfile = None
+
+# ========================參數=========================
+zero_copy_chans = True   # True：每幀放進預先配置的 (2×感測器數, N) float32 區塊，一次整批寫進 channel
+                         #       （需要 chanfile；樣本數沒變就沿用原本的 channel）
+
+NUM_SENSORS = 4          # 資料每列 2×NUM_SENSORS 欄：radius1 angle1 … radiusN angleN
+                         # 角度照原始值輸出；感測器 2、3 反裝的 180° 由 td.py 的 prams_sensor_yaw 在投影時套用
+
+# zero_copy_chans：(2×感測器數, n) 區塊用 chanfile.write_block 寫進 CHOP（channel 數與長度沒變就不重建）
+CHAN_NAMES = chanfile.chan_names(NUM_SENSORS) if chanfile is not None else None
+_block = chanfile.FrameBlock() if chanfile is not None else None
+
 ######################################################################
 # 1. 直接引用你提供的 parse_data_file()  ============================
 ######################################################################
 def parse_data_file(input_path):
-    var_radius = [[] for _ in range(4)]
-    var_angle  = [[] for _ in range(4)]
-    var_radius_frame = [[] for _ in range(4)]
-    var_angle_frame  = [[] for _ in range(4)]
+    var_radius = [[] for _ in range(NUM_SENSORS)]
+    var_angle  = [[] for _ in range(NUM_SENSORS)]
+    var_radius_frame = [[] for _ in range(NUM_SENSORS)]
+    var_angle_frame  = [[] for _ in range(NUM_SENSORS)]
     frame_radius, frame_angle = [], []
 
     with open(input_path, 'r') as file:
@@ -24,14 +40,11 @@ def parse_data_file(input_path):
             if not line or line.startswith('#'):      # 空行/註解
                 continue
             values = list(map(float, line.split()))
-            if len(values) != 8:                      # 略過格式錯誤列
+            if len(values) != 2 * NUM_SENSORS:        # 略過格式錯誤列
                 continue
-            for i in range(4):
+            for i in range(NUM_SENSORS):
                 var_radius[i].append(values[i*2])
-                cur_ang = values[i*2+1]
-                if i in (1, 2):                       # 感測器 2、3 需補 180°
-                    cur_ang = (cur_ang + 180) % 360
-                var_angle[i].append(cur_ang)
+                var_angle[i].append(values[i*2+1])
 
     if not var_angle[0]:          # 無有效資料
         return frame_radius, frame_angle
@@ -42,10 +55,10 @@ def parse_data_file(input_path):
             if var_radius_frame[0]:
                 frame_radius.append(var_radius_frame)
                 frame_angle.append(var_angle_frame)
-            var_radius_frame = [[] for _ in range(4)]
-            var_angle_frame  = [[] for _ in range(4)]
+            var_radius_frame = [[] for _ in range(NUM_SENSORS)]
+            var_angle_frame  = [[] for _ in range(NUM_SENSORS)]
 
-        for j in range(4):        # 加入目前點
+        for j in range(NUM_SENSORS):  # 加入目前點
             var_radius_frame[j].append(var_radius[j][i])
             var_angle_frame [j].append(var_angle [j][i])
 
@@ -61,25 +74,61 @@ def parse_data_file(input_path):
 _cache = {
     'path':        None,   # 絕對路徑
     'mtime':       None,   # 最後修改時間
-    'frames_r':    [],     # [[sensor][sample] …]
+    'size':        None,   # 檔案大小
+    'frames_r':    [],     # [[sensor][sample] …]（沒有 chanfile 時使用）
     'frames_a':    [],
+    'data':        None,   # (N, 2×感測器數) .chanb memmap（有 chanfile 時使用）
+    'offsets':     None,   # frame 偏移表
+    'reader':      None,   # ChanTailReader（檔案錄製中、持續變大時使用）
+    'num_frames':  0,
     'frame_index': 0       # 下一次 onCook 要輸出的 frame 編號
 }
 
 def _rebuild_cache():
-    """如果檔案路徑或修改時間有變就重新解析。"""
+    """
+    如果檔案路徑、修改時間或大小有變就更新快取。
+    檔案只是往後長（錄製中）時，只解析新增的位元組，不整檔重讀。
+    """
     dat       = op('filein1')
     file_path = dat.par.file.eval() if dat else ''
     if not file_path:        # 沒有資料檔
         return
-    mtime = os.path.getmtime(file_path)
+    st = os.stat(file_path)
+
+    if file_path == _cache['path'] and st.st_mtime == _cache['mtime'] \
+            and st.st_size == _cache['size']:
+        return               # 沒變
 
-    if file_path != _cache['path'] or mtime != _cache['mtime']:
+    if chanfile is None:
         _cache['frames_r'], _cache['frames_a'] = parse_data_file(file_path)
-        _cache['path']        = file_path
-        _cache['mtime']       = mtime
+        _cache['num_frames']  = len(_cache['frames_r'])
+        _cache['frame_index'] = 0     # 重新開始循環
+    elif file_path == _cache['path'] and st.st_size > _cache['size']:
+        # 錄製中：檔案只有往後追加 → 增量解析（保留播放位置）
+        if _cache['reader'] is None:
+            _cache['reader'] = chanfile.ChanTailReader(file_path, num_sensors=NUM_SENSORS)
+        _cache['reader'].poll()
+        _cache['data']       = _cache['reader'].data
+        _cache['offsets']    = _cache['reader'].offsets
+        _cache['num_frames'] = len(_cache['offsets']) - 1
+    else:
+        # 新檔案或被覆寫：.chanb 比原始檔新就直接 memmap，否則解析一次並寫出 sidecar
+        _cache['reader'] = None
+        _cache['data'], _cache['offsets'] = chanfile.load_chan_cached(file_path, NUM_SENSORS)
+        _cache['num_frames']  = len(_cache['offsets']) - 1
         _cache['frame_index'] = 0     # 重新開始循環
 
+    _cache['path']  = file_path
+    _cache['mtime'] = st.st_mtime
+    _cache['size']  = st.st_size
+
+def _get_frame(idx):
+    """回傳第 idx 幀的 (r_frame, a_frame)，皆為 [sensor][sample]。"""
+    if _cache['data'] is not None:
+        r_frame, a_frame = chanfile.frame_view(_cache['data'], _cache['offsets'], idx)
+        return r_frame.tolist(), a_frame.tolist()
+    return _cache['frames_r'][idx], _cache['frames_a'][idx]
+
 ######################################################################
 # 3. Script CHOP 標準回呼 ===========================================
 ######################################################################
@@ -88,8 +137,13 @@ def onSetupParameters(scriptOp):
     _cache = {
         'path':        None,   # 絕對路徑
         'mtime':       None,   # 最後修改時間
+        'size':        None,   # 檔案大小
         'frames_r':    [],     # [[sensor][sample] …]
         'frames_a':    [],
+        'data':        None,
+        'offsets':     None,
+        'reader':      None,
+        'num_frames':  0,
         'frame_index': 0       # 下一次 onCook 要輸出的 frame 編號
     }
     return
@@ -99,21 +153,25 @@ def onPulse(par):
 
 def onCook(scriptOp):
     _rebuild_cache()            # ← 你的快取函式，保持不變
-    scriptOp.clear()            # 清掉舊 channel
 
-    frames_r = _cache['frames_r']
-    frames_a = _cache['frames_a']
-    if not frames_r:
+    num_frames = _cache['num_frames']
+    if not num_frames:
+        scriptOp.clear()
         return                  # 沒資料就提早結束
 
-    idx        = _cache['frame_index']
-    r_frame    = frames_r[idx]  # [sensor][sample]
-    a_frame    = frames_a[idx]
+    idx = _cache['frame_index']
+    if zero_copy_chans and _cache['data'] is not None:
+        chanfile.write_block(scriptOp, _block.load(_cache['data'], _cache['offsets'], idx), CHAN_NAMES)
+        _cache['frame_index'] = (idx + 1) % num_frames
+        return
+
+    scriptOp.clear()            # 清掉舊 channel
+    r_frame, a_frame = _get_frame(idx)  # [sensor][sample]
 
     num_samples = len(r_frame[0])
     scriptOp.numSamples = num_samples      # ① 設定長度
 
-    for s in range(4):
+    for s in range(NUM_SENSORS):
         # radius channel
         ch = scriptOp.appendChan('radius{}'.format(s + 1))  # ② 建立
         ch.vals = r_frame[s]                                # ③ 填值
@@ -123,4 +181,4 @@ def onCook(scriptOp):
         ch.vals = a_frame[s]
 
     # 下一幀（循環播放）
-    _cache['frame_index'] = (idx + 1) % len(frames_r)
\ No newline at end of file
+    _cache['frame_index'] = (idx + 1) % num_frames
\ No newline at end of file
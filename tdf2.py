@@ -7,14 +7,30 @@
 #
 # -------------------------------------------------------------------
 
+try:                     # chanfile.py 放在專案資料夾（或同名 Text DAT）即可增量解析
+    import chanfile
+except ImportError:
+    chanfile = None
+
+# ========================參數=========================
+zero_copy_chans = True   # True：每幀放進預先配置的 (2×感測器數, N) float32 區塊，一次整批寫進 channel
+                         #       （需要 chanfile；樣本數沒變就沿用原本的 channel）
+
+NUM_SENSORS = 4          # 資料每列 2×NUM_SENSORS 欄：radius1 angle1 … radiusN angleN
+                         # 角度照原始值輸出；感測器 2、3 反裝的 180° 由 td.py 的 prams_sensor_yaw 在投影時套用
+
+# zero_copy_chans：(2×感測器數, n) 區塊用 chanfile.write_block 寫進 CHOP（channel 數與長度沒變就不重建）
+CHAN_NAMES = chanfile.chan_names(NUM_SENSORS) if chanfile is not None else None
+_block = chanfile.FrameBlock() if chanfile is not None else None
+
 ######################################################################
 # 1. 解析函式：直接吃「文字行清單」而非檔案路徑  =====================
 ######################################################################
 def parse_data_lines(lines):
-    var_radius = [[] for _ in range(4)]
-    var_angle  = [[] for _ in range(4)]
-    var_radius_frame = [[] for _ in range(4)]
-    var_angle_frame  = [[] for _ in range(4)]
+    var_radius = [[] for _ in range(NUM_SENSORS)]
+    var_angle  = [[] for _ in range(NUM_SENSORS)]
+    var_radius_frame = [[] for _ in range(NUM_SENSORS)]
+    var_angle_frame  = [[] for _ in range(NUM_SENSORS)]
     frame_radius, frame_angle = [], []
 
     for raw in lines:
@@ -22,14 +38,11 @@ def parse_data_lines(lines):
         if not line or line.startswith('#'):          # 空行/註解
             continue
         values = list(map(float, line.split()))
-        if len(values) != 8:                          # 略過格式錯誤列
+        if len(values) != 2 * NUM_SENSORS:            # 略過格式錯誤列
             continue
-        for i in range(4):
+        for i in range(NUM_SENSORS):
             var_radius[i].append(values[i*2])
-            cur_ang = values[i*2+1]
-            if i in (1, 2):                           # 感測器 2、3 需補 180°
-                cur_ang = (cur_ang + 180) % 360
-            var_angle[i].append(cur_ang)
+            var_angle[i].append(values[i*2+1])
 
     if not var_angle[0]:                              # 無有效資料
         return frame_radius, frame_angle
@@ -40,10 +53,10 @@ def parse_data_lines(lines):
             if var_radius_frame[0]:
                 frame_radius.append(var_radius_frame)
                 frame_angle.append(var_angle_frame)
-            var_radius_frame = [[] for _ in range(4)]
-            var_angle_frame  = [[] for _ in range(4)]
+            var_radius_frame = [[] for _ in range(NUM_SENSORS)]
+            var_angle_frame  = [[] for _ in range(NUM_SENSORS)]
 
-        for j in range(4):                            # 加入目前點
+        for j in range(NUM_SENSORS):                  # 加入目前點
             var_radius_frame[j].append(var_radius[j][i])
             var_angle_frame [j].append(var_angle [j][i])
 
@@ -54,10 +67,81 @@ def parse_data_lines(lines):
     return frame_radius, frame_angle                  # frame_radius[n][sensor][sample]
 
 ######################################################################
-# 2. 全域狀態：只留一個 frame_index 來決定輸出哪一幀 ================
+# 2. 全域狀態：frame_index 決定輸出哪一幀 ===========================
 ######################################################################
 frame_index = 0      # 由 onCook 負責遞增（循環播放）
 
+# 增量解析狀態：DAT 文字只往後追加時，只解析新增的部分
+_tail = {
+    'reader':   None,   # chanfile.ChanTailReader
+    'text_len': 0,      # 已餵給 reader 的字元數
+    'anchor':   '',     # 已解析文字的最後一小段，用來確認只是追加
+}
+_ANCHOR_LEN = 64
+
+def _update_tail(text):
+    """把 DAT 新增的文字餵給 ChanTailReader；文字被改寫（非追加）就從頭來。"""
+    n = _tail['text_len']
+    reader = _tail['reader']
+    if reader is None or len(text) < n or text[max(0, n - _ANCHOR_LEN):n] != _tail['anchor']:
+        reader = _tail['reader'] = chanfile.ChanTailReader(num_sensors=NUM_SENSORS)
+        n = 0
+    if len(text) > n:
+        reader.feed(text[n:].encode())
+        _tail['text_len'] = len(text)
+        _tail['anchor']   = text[max(0, len(text) - _ANCHOR_LEN):]
+    return reader
+
+# 解析結果快取：DAT 沒有重新 cook（或內容 hash 沒變）就完全不碰文字
+_capture = {
+    'key':        None,   # (DAT id, totalCooks) 或 文字 hash
+    'data':       None,   # (N, 2×感測器數) 連續陣列
+    'offsets':    None,   # frame 偏移表：第 k 幀 = data[offsets[k]:offsets[k+1]]
+    'frames_r':   [],     # 沒有 chanfile 時的 [[sensor][sample] …]
+    'frames_a':   [],
+    'num_frames': 0,
+    'complete':   True,   # 最後一行（沒有換行）已經算進 data 了
+}
+
+def _refresh_capture(dat):
+    """只有 filein1 重新 cook 過（內容可能變了）才更新快取。"""
+    cooks = getattr(dat, 'totalCooks', None)
+    if cooks is not None:
+        key = (dat.id, cooks)
+        if key == _capture['key']:
+            _complete_capture()
+            return
+        text = dat.text
+    else:                          # 舊版 TD：退而用內容 hash
+        text = dat.text
+        key = hash(text)
+        if key == _capture['key']:
+            _complete_capture()
+            return
+    _capture['key'] = key
+
+    if chanfile is not None:
+        # 只解析 DAT 新增的文字（最後一行若還沒換行會留到下次）
+        reader = _update_tail(text)
+        _capture['data']       = reader.data
+        _capture['offsets']    = reader.offsets
+        _capture['num_frames'] = reader.num_frames
+        _capture['complete']   = False
+    else:
+        _capture['frames_r'], _capture['frames_a'] = parse_data_lines(text.splitlines())
+        _capture['num_frames'] = len(_capture['frames_r'])
+
+def _complete_capture():
+    """
+    DAT 兩次 cook 之間沒變：檔案最後一行就算沒有換行也算完整，放進暫時的副本裡
+    （reader 本身不動，之後文字若繼續追加，那一行照常接上）。
+    """
+    if _capture['complete'] or _tail['reader'] is None:
+        return
+    _capture['complete'] = True
+    _capture['data'], _capture['offsets'] = _tail['reader'].view(include_partial=True)
+    _capture['num_frames'] = len(_capture['offsets']) - 1
+
 ######################################################################
 # 3. Script CHOP 標準回呼 ==========================================
 ######################################################################
@@ -65,6 +149,8 @@ def onSetupParameters(scriptOp):
     print("這是一個除錯訊息，錄製光達回放起始")
     global frame_index
     frame_index = 0
+    _tail['reader'] = None
+    _capture['key'] = None
     return
 
 def onPulse(par):
@@ -77,21 +163,29 @@ def onCook(scriptOp):
     if not dat:
         return                        # 找不到檔，直接結束
 
-    # 直接從 DAT 取得文字並解析
-    lines = dat.text.splitlines()
-    frames_r, frames_a = parse_data_lines(lines)
-    if not frames_r:
+    _refresh_capture(dat)
+    num_frames = _capture['num_frames']
+    if not num_frames:
         return                        # 無資料
 
-    idx        = frame_index % len(frames_r)
-    r_frame    = frames_r[idx]        # [sensor][sample]
-    a_frame    = frames_a[idx]
+    idx = frame_index % num_frames
+    if zero_copy_chans and chanfile is not None:
+        chanfile.write_block(scriptOp, _block.load(_capture['data'], _capture['offsets'], idx), CHAN_NAMES)
+        frame_index += 1              # 下一幀（循環播放）
+        return
+
+    if chanfile is not None:
+        # 每次 cook 只切出一幀：(感測器數, n) 的陣列 view
+        r_frame, a_frame = chanfile.frame_view(_capture['data'], _capture['offsets'], idx)
+    else:
+        r_frame = _capture['frames_r'][idx]   # [sensor][sample]
+        a_frame = _capture['frames_a'][idx]
 
     num_samples = len(r_frame[0])
     scriptOp.clear()
     scriptOp.numSamples = num_samples
 
-    for s in range(4):
+    for s in range(NUM_SENSORS):
         # radius channel
         ch = scriptOp.appendChan(f'radius{s + 1}')
         ch.vals = r_frame[s]
@@ -0,0 +1,47 @@
+import numpy as np
+
+from index import _margin_box, _stamp_dots, cluster_points, detect_frame_centroids, raster_centroids
+
+W, H, R = 320, 200, 6
+
+
+def _raster(x_pixel, y_pixel, r=R):
+    occupancy = np.zeros((H, W), dtype=np.uint8)
+    _stamp_dots(occupancy, x_pixel, y_pixel, 255)
+    return sorted(raster_centroids(occupancy, 5.0, 5.0, r))
+
+
+def _points(x_pixel, y_pixel, r=R):
+    return sorted(cluster_points(x_pixel, y_pixel, r, _margin_box(W, H, 5.0, 5.0)))
+
+
+def test_dots_at_the_margin():
+    x0, x1, y0, y1 = _margin_box(W, H, 5.0, 5.0)
+    # Centres one pixel outside the margin still have an arm pixel inside it;
+    # two pixels outside they are dropped entirely.
+    xs = np.array([x0 - 1, x0 - 2, x1, x1 + 1, 100, 200, 150, 150])
+    ys = np.array([50, 120, 60, 140, y0 - 1, y1, y0 - 2, y1 + 1])
+    raster = _raster(xs, ys)
+    assert len(raster) == 4
+    assert _points(xs, ys) == raster
+
+
+def test_random_frames_match_raster():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        n = int(rng.integers(1, 300))
+        centers = rng.uniform([0, 0], [W, H], (int(rng.integers(1, 8)), 2))
+        pts = centers[rng.integers(0, len(centers), n)] + rng.normal(0, 8, (n, 2))
+        xs = np.clip(pts[:, 0].astype(np.int64), 0, W - 1)
+        ys = np.clip(pts[:, 1].astype(np.int64), 0, H - 1)
+        assert _points(xs, ys) == _raster(xs, ys)
+
+
+def test_detect_frame_centroids_backends_agree():
+    rng = np.random.default_rng(1)
+    radii = [rng.uniform(0.5, 8.0, 200) for _ in range(4)]
+    angles = [rng.uniform(0.0, 360.0, 200) for _ in range(4)]
+    args = (radii, angles, 1280, 720, 6.7, 3.77, [(-6.7, -1.7), (6.7, 2.0), (6.7, -1.7), (-6.7, 2.0)])
+    occupancy = detect_frame_centroids(*args, cluster_backend='occupancy')
+    points = detect_frame_centroids(*args, cluster_backend='points')
+    assert sorted(points) == sorted(occupancy)
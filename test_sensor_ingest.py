@@ -0,0 +1,38 @@
+import numpy as np
+
+from sensor_ingest import FrameAssembler, SweepRing
+
+
+def _sweep(ring, stamp):
+    ring.push(np.array([1.0, 2.0]), np.array([10.0, 20.0]), stamp)
+
+
+def test_stale_sweep_is_not_emitted_twice():
+    rings = [SweepRing(), SweepRing()]
+    assembler = FrameAssembler(rings, max_wait=0.05, max_age=0.25)
+    _sweep(rings[0], 0.0)
+    _sweep(rings[1], 1.0)
+
+    radii, angles, stamp = assembler.poll(now=1.0)
+    assert stamp == 1.0
+    assert radii[0].size == 0 and radii[1].size == 2
+    assert assembler.stale == [1, 0]
+
+    # No new sweeps: nothing is due, however often we poll.
+    assert assembler.poll(now=1.01) is None
+    assert assembler.poll(now=2.0) is None
+    assert assembler.frames == 1
+
+
+def test_new_sweep_after_stale_frame():
+    rings = [SweepRing(), SweepRing()]
+    assembler = FrameAssembler(rings, max_wait=0.05, max_age=0.25)
+    _sweep(rings[0], 0.0)
+    _sweep(rings[1], 1.0)
+    assert assembler.poll(now=1.0) is not None
+
+    _sweep(rings[1], 1.1)
+    radii, _, stamp = assembler.poll(now=1.1)
+    assert stamp == 1.1
+    assert radii[0].size == 0 and radii[1].size == 2
+    assert assembler.poll(now=1.2) is None
@@ -0,0 +1,252 @@
+# tracker.py
+#
+# Multi-person tracker for the detected circle centres.
+#
+# Every track keeps a persistent id, its last position and a constant-velocity
+# estimate. Each update:
+#   1. predicts every track forward by dt (pos + vel * dt),
+#   2. gates detection/track pairs by distance to the prediction (vectorized,
+#      one N x M distance matrix),
+#   3. splits the gated pairs into independent groups; a group with one
+#      detection and one track is matched directly, larger groups are solved
+#      with a globally optimal assignment (scipy's linear_sum_assignment when
+#      available, the Hungarian method below otherwise),
+#   4. updates matched tracks, coasts unmatched ones on their prediction and
+#      drops them after `max_missed` updates, and spawns a track for every
+#      unmatched detection.
+# Positions are whatever units the caller uses (ART2 sends 0~1 normalized
+# image coordinates); velocities are those units per second.
+
+import itertools
+import time
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+DEFAULT_GATE = 0.1          # max distance between prediction and detection
+DEFAULT_MAX_MISSED = 5      # updates a track may go unseen before it is dropped
+DEFAULT_VELOCITY_SMOOTHING = 0.5   # weight of the newest velocity measurement
+
+
+def hungarian(cost):
+    """
+    Minimum-cost assignment for a rectangular cost matrix (rows <= cols is
+    not required). Returns (row_indices, col_indices) like
+    scipy.optimize.linear_sum_assignment. O(n^2 m); meant for the small
+    ambiguous groups left after gating.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    # Shortest augmenting path with potentials (1-based, column 0 is a dummy).
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    match = np.zeros(m + 1, dtype=np.int64)     # column -> row
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            free = ~used[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+            masked = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(masked)) + 1
+            delta = masked[j1 - 1]
+            u[match[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+    cols = np.flatnonzero(match[1:])
+    rows = match[1:][cols] - 1
+    order = np.argsort(rows)
+    rows, cols = rows[order], cols[order]
+    if transposed:
+        rows, cols = cols, rows
+        order = np.argsort(rows)
+        rows, cols = rows[order], cols[order]
+    return rows, cols
+
+
+def _solve(cost):
+    n, m = cost.shape
+    # Closed forms for the groups gating usually leaves: 1 x k, k x 1, 2 x 2.
+    if n == 1:
+        return np.zeros(1, dtype=np.int64), cost[0].argmin(keepdims=True)
+    if m == 1:
+        return cost[:, 0].argmin(keepdims=True), np.zeros(1, dtype=np.int64)
+    if n == 2 and m == 2:
+        swap = cost[0, 1] + cost[1, 0] < cost[0, 0] + cost[1, 1]
+        return np.array([0, 1]), (np.array([1, 0]) if swap else np.array([0, 1]))
+    if linear_sum_assignment is not None:
+        return linear_sum_assignment(cost)
+    return hungarian(cost)
+
+
+def _gated_groups(det_idx, trk_idx, num_dets):
+    """
+    Connected components of the bipartite gating graph (edges det_idx[k] -
+    trk_idx[k]). Returns a list of (detections, tracks) index lists.
+    """
+    parent = list(range(num_dets + int(trk_idx.max()) + 1))
+
+    def find(a):
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    dets, trks = det_idx.tolist(), trk_idx.tolist()
+    for d, t in zip(dets, trks):
+        rd, rt = find(d), find(t + num_dets)
+        if rd != rt:
+            parent[rt] = rd
+    groups = {}
+    for d, t in zip(dets, trks):
+        group = groups.setdefault(find(d), ({}, {}))
+        group[0][d] = None       # dicts keep first-seen order without duplicates
+        group[1][t] = None
+    return [(list(d), list(t)) for d, t in groups.values()]
+
+
+def associate(detections, predictions, gate):
+    """
+    Globally optimal detection-to-track assignment within `gate`.
+    Args:
+        detections (np.ndarray): (N, 2) positions.
+        predictions (np.ndarray): (M, 2) predicted track positions.
+        gate (float): Pairs farther apart than this are never matched.
+    Returns:
+        tuple: (det_indices, track_indices) of the matched pairs.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if len(detections) == 0 or len(predictions) == 0:
+        return empty, empty
+    diff = detections[:, None, :] - predictions[None, :, :]
+    dist = np.hypot(diff[..., 0], diff[..., 1])
+    det_idx, trk_idx = np.nonzero(dist <= gate)
+    if det_idx.size == 0:
+        return empty, empty
+
+    # Pairs whose detection and track have no other candidate need no solver.
+    det_deg = np.bincount(det_idx, minlength=len(detections))
+    trk_deg = np.bincount(trk_idx, minlength=len(predictions))
+    unique = (det_deg[det_idx] == 1) & (trk_deg[trk_idx] == 1)
+    out_d = [det_idx[unique]]
+    out_t = [trk_idx[unique]]
+
+    rest_d, rest_t = det_idx[~unique], trk_idx[~unique]
+    if rest_d.size:
+        for dets, trks in _gated_groups(rest_d, rest_t, len(detections)):
+            dets, trks = np.array(dets), np.array(trks)
+            sub = dist[dets[:, None], trks]
+            # Out-of-gate pairs get a cost no in-gate assignment can reach.
+            sub[sub > gate] = gate * (len(dets) + len(trks) + 1)
+            rows, cols = _solve(sub)
+            ok = sub[rows, cols] <= gate
+            out_d.append(dets[rows[ok]])
+            out_t.append(trks[cols[ok]])
+    return np.concatenate(out_d), np.concatenate(out_t)
+
+
+class MultiTracker:
+    """
+    Persistent-id tracker with constant-velocity prediction.
+    Track state is kept in parallel numpy arrays (one row per live track).
+    """
+
+    def __init__(self,
+                 gate=DEFAULT_GATE,
+                 max_missed=DEFAULT_MAX_MISSED,
+                 velocity_smoothing=DEFAULT_VELOCITY_SMOOTHING):
+        self.gate = gate
+        self.max_missed = max_missed
+        self.velocity_smoothing = velocity_smoothing
+        self.reset()
+
+    def reset(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.pos = np.empty((0, 2))
+        self.vel = np.empty((0, 2))
+        self.movement = np.empty((0, 2))   # position change at the last update
+        self.missed = np.empty(0, dtype=np.int64)
+        self.last_time = None
+        self._next_id = itertools.count(1)
+
+    def __len__(self):
+        return self.ids.size
+
+    def update(self, detections, timestamp=None):
+        """
+        Feeds one frame of detections ((N, 2) array or list of [x, y]).
+        `timestamp` is in seconds (default: time.monotonic()).
+        Returns the tracks seen in this frame, see `results`.
+        """
+        now = time.monotonic() if timestamp is None else timestamp
+        dt = 0.0 if self.last_time is None else max(now - self.last_time, 0.0)
+        self.last_time = now
+        detections = np.asarray(detections, dtype=np.float64).reshape(-1, 2)
+
+        predicted = self.pos + self.vel * dt
+        det_idx, trk_idx = associate(detections, predicted, self.gate)
+
+        # Matched tracks: new position, blended velocity.
+        movement = detections[det_idx] - self.pos[trk_idx]
+        if dt > 0:
+            a = self.velocity_smoothing
+            self.vel[trk_idx] = a * movement / dt + (1.0 - a) * self.vel[trk_idx]
+        self.movement = np.zeros_like(self.pos)
+        self.movement[trk_idx] = movement
+        self.pos = predicted
+        self.pos[trk_idx] = detections[det_idx]
+        self.missed += 1
+        self.missed[trk_idx] = 0
+
+        # Expire tracks that have coasted too long.
+        alive = self.missed <= self.max_missed
+        if not alive.all():
+            self.ids, self.pos, self.vel = self.ids[alive], self.pos[alive], self.vel[alive]
+            self.movement, self.missed = self.movement[alive], self.missed[alive]
+
+        # Spawn tracks for unmatched detections.
+        new = np.ones(len(detections), dtype=bool)
+        new[det_idx] = False
+        if new.any():
+            count = int(new.sum())
+            self.ids = np.concatenate([self.ids, [next(self._next_id) for _ in range(count)]])
+            self.pos = np.concatenate([self.pos, detections[new]])
+            self.vel = np.concatenate([self.vel, np.zeros((count, 2))])
+            self.movement = np.concatenate([self.movement, np.zeros((count, 2))])
+            self.missed = np.concatenate([self.missed, np.zeros(count, dtype=np.int64)])
+        return self.results()
+
+    def results(self):
+        """
+        Tracks seen in the last update as JSON-ready dicts:
+        {"id", "pos": [x, y], "movement": [dx, dy], "velocity": [vx, vy]}.
+        "movement" is the change since the previous update (as the old
+        ART2.track_circles reported), "velocity" is per second.
+        """
+        seen = np.flatnonzero(self.missed == 0)
+        pos, mov, vel = self.pos.tolist(), self.movement.tolist(), self.vel.tolist()
+        ids = self.ids.tolist()
+        return [{"id": ids[i], "pos": pos[i], "movement": mov[i], "velocity": vel[i]}
+                for i in seen.tolist()]